@@ -8,11 +8,13 @@ from discord.app_commands import locale_str
 from discord.utils import get
 from tabulate import tabulate
 from pendulum import timezones as p_timezones
+from contextlib import contextmanager
 import os
+import time
 
 from sausage_bot.util.args import args
 from sausage_bot.util import config, envs, file_io, cogs, db_helper, net_io
-from sausage_bot.util import discord_commands
+from sausage_bot.util import db_backup, db_stats, discord_commands, http_client
 from sausage_bot.util.datetime_handling import get_dt
 from sausage_bot.util.i18n import I18N, available_languages
 from sausage_bot.util.i18n import MyTranslator
@@ -45,6 +47,35 @@ async def get_random_user_agent():
     await net_io.fetch_random_user_agent()
 
 
+@tasks.loop(hours=config.DB_MAINTENANCE_LOOP)
+async def db_maintenance():
+    """
+    Trim every approved guild's log tables to the retention set in config
+    and give the freed space back to the file system.
+    #autodoc skip#
+    """
+    for guild_row in await db_helper.guild_registry.approved():
+        async with db_helper.guild_locale_context(guild_row["guild_id"]):
+            reclaimed = await db_helper.compact_guild_logs(guild_row["guild_id"])
+        logger.info(
+            f"Database maintenance for `{guild_row['guild_name']}`: "
+            f"deleted {reclaimed['rows']} log rows, "
+            f"reclaimed {reclaimed['bytes']} bytes"
+        )
+
+
+@tasks.loop(hours=max(config.DB_BACKUP_LOOP, 1))
+async def db_backups():
+    """
+    Back up every database to `envs.BACKUP_DIR`, see `config.DB_BACKUP_LOOP`
+    #autodoc skip#
+    """
+    try:
+        await db_backup.backup_all()
+    except OSError as e:
+        logger.error(f"Scheduled backup failed: {e}")
+
+
 class SayTextInput(discord.ui.TextInput):
     def __init__(
         self,
@@ -733,6 +764,54 @@ async def load_admin_guild_from_db() -> None:
         await seed_admin_guild_from_env()
 
 
+@contextmanager
+def startup_phase(phase: str):
+    "Log how long the `on_ready` phase `phase` took. #autodoc skip#"
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        took = time.perf_counter() - started
+        logger.info(f"Startup phase `{phase}` took {took:.2f}s")
+
+
+async def ensure_bot_channel(guild: discord.Guild):
+    """
+    Make sure that `guild`'s configured bot channel exists, if the guild
+    is approved. The channel name is the guild's own `bot_channel`
+    setting, falling back to the bot-wide default (config.BOT_CHANNEL)
+    when unset.
+    #autodoc skip#
+    """
+    if not await db_helper.is_guild_approved(guild.id):
+        return
+    settings = await db_helper.get_output(
+        envs.settings_db_schema, guild_id=guild.id, as_settings_json=True
+    )
+    bot_channel = settings.get("bot_channel") or config.BOT_CHANNEL
+    channel_list = discord_commands.get_text_channel_list(guild) or {}
+    if bot_channel in channel_list:
+        return
+    logger.debug(
+        f"Bot channel `{bot_channel}` does not exist in `{guild.name}`, creating..."
+    )
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(read_messages=False),
+        guild.me: discord.PermissionOverwrite(read_messages=True),
+    }
+    async with db_helper.guild_locale_context(guild.id):
+        # Permissions are applied via `overwrites=` at creation time,
+        # so no follow-up set_permissions() call is needed.
+        await guild.create_text_channel(
+            name=str(bot_channel),
+            topic=I18N.t(
+                "main.msg.create_log_channel_logging",
+                botname=config.bot.user.name,
+            ),
+            overwrites=overwrites,
+        )
+
+
 @config.bot.event
 async def on_ready():
     """
@@ -753,6 +832,7 @@ async def on_ready():
 
     logger.debug("Checking guild registry db")
     await db_helper.prep_table(envs.guilds_db_schema)
+    await db_helper.guild_registry.load()
     # `tasks_db_schema` is guild-scoped (see envs.py) - it is prepped per
     # guild in `register_guild()`/`approve_guild()` below and defensively
     # again in each posting cog's own `setup()`.
@@ -774,10 +854,17 @@ async def on_ready():
         logger.debug("Found old json file")
         file_io.remove_file(envs.cogs_status_file)
 
-    for guild in config.bot.guilds:
-        await register_guild(guild)
+    # Each phase sets up the guilds `config.GUILD_BOOTSTRAP_CONCURRENCY`
+    # at a time. Everything in them is idempotent, and the cogs skip the
+    # guilds whose tables are up to date (`db_migrations.bootstrap_guild`),
+    # so a reconnect firing on_ready again is cheap.
+    with startup_phase("registry"):
+        await db_helper.for_each_guild(config.bot.guilds, register_guild)
 
-    await cogs.Cogs.load_and_clean_cogs_internal()
+    # The cogs themselves load one after another, each bootstraps its
+    # guilds concurrently in its `setup()`
+    with startup_phase("cogs"):
+        await cogs.Cogs.load_and_clean_cogs_internal()
 
     # The loop refreshes the scraped user-agents `net_io.get_link()` uses.
     # It was declared but never started, so the headers file was never
@@ -786,41 +873,22 @@ async def on_ready():
     if config.SCRAPEOPS_API_KEY and not get_random_user_agent.is_running():
         get_random_user_agent.start()
 
+    # Prunes the feed logs, see `config.LOG_RETENTION_ROWS`/`_DAYS`. Off
+    # unless one of them is set, so nothing is deleted by default
+    if (
+        config.LOG_RETENTION_ROWS > 0 or config.LOG_RETENTION_DAYS > 0
+    ) and not db_maintenance.is_running():
+        db_maintenance.start()
+
+    if config.DB_BACKUP_LOOP > 0 and not db_backups.is_running():
+        db_backups.start()
+
     if args.maintenance:
         logger.info("Maintenance mode activated", color="RED")
         await config.bot.change_presence(status=discord.Status.dnd)
 
-    # Make sure that each approved guild's configured bot channel exists.
-    # The channel name is the guild's own `bot_channel` setting, falling
-    # back to the bot-wide default (config.BOT_CHANNEL) when unset.
-    for guild in config.bot.guilds:
-        if not await db_helper.is_guild_approved(guild.id):
-            continue
-        settings = await db_helper.get_output(
-            envs.settings_db_schema, guild_id=guild.id, as_settings_json=True
-        )
-        bot_channel = settings.get("bot_channel") or config.BOT_CHANNEL
-        channel_list = discord_commands.get_text_channel_list(guild) or {}
-        if bot_channel in channel_list:
-            continue
-        logger.debug(
-            f"Bot channel `{bot_channel}` does not exist in `{guild.name}`, creating..."
-        )
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            guild.me: discord.PermissionOverwrite(read_messages=True),
-        }
-        async with db_helper.guild_locale_context(guild.id):
-            # Permissions are applied via `overwrites=` at creation time,
-            # so no follow-up set_permissions() call is needed.
-            await guild.create_text_channel(
-                name=str(bot_channel),
-                topic=I18N.t(
-                    "main.msg.create_log_channel_logging",
-                    botname=config.bot.user.name,
-                ),
-                overwrites=overwrites,
-            )
+    with startup_phase("bot channels"):
+        await db_helper.for_each_guild(config.bot.guilds, ensure_bot_channel)
 
 
 @config.bot.tree.error
@@ -1733,6 +1801,84 @@ async def get_version(interaction: discord.Interaction):
     return
 
 
+@discord_commands.is_owner()
+@config.bot.tree.command(
+    name="backup", description=locale_str(I18N.t("main.commands.backup.command"))
+)
+async def backup(interaction: discord.Interaction):
+    "Back up every database now, and list what each guild's backup took"
+    await interaction.response.defer(ephemeral=True)
+    try:
+        report = await db_backup.backup_all()
+    except OSError as e:
+        logger.error(f"Backup failed: {e}")
+        await interaction.followup.send(
+            I18N.t("main.commands.backup.msg_failed", error=e), ephemeral=True
+        )
+        return
+    msg = I18N.t(
+        "main.commands.backup.msg_confirm",
+        archive=report["archive"].name,
+        bytes=report["bytes"],
+        seconds=f"{report['seconds']:.2f}",
+    )
+    table = tabulate(
+        [
+            [owner, stats["files"], stats["bytes"], f"{stats['seconds']:.2f}"]
+            for owner, stats in report["guilds"].items()
+        ],
+        headers=[
+            I18N.t("main.commands.backup.headers.guild"),
+            I18N.t("main.commands.backup.headers.files"),
+            I18N.t("main.commands.backup.headers.bytes"),
+            I18N.t("main.commands.backup.headers.seconds"),
+        ],
+    )
+    # The whole table is in the log, the message only has room for so much
+    if len(msg) + len(table) < 1900:
+        msg += f"\n```{table}```"
+    await interaction.followup.send(msg, ephemeral=True)
+
+
+@discord_commands.is_owner()
+@config.bot.tree.command(
+    name="dbstats", description=locale_str(I18N.t("main.commands.dbstats.command"))
+)
+async def dbstats(interaction: discord.Interaction, top: int = 5):
+    "List the slowest and the most run database queries since the bot started"
+    stats = db_stats.query_stats
+    # More rows than this don't fit in a message
+    top = max(1, min(top, 15))
+    if not stats.shapes():
+        await interaction.response.send_message(
+            I18N.t("main.commands.dbstats.msg_empty"), ephemeral=True
+        )
+        return
+    headers = [
+        I18N.t("main.commands.dbstats.headers.query"),
+        I18N.t("main.commands.dbstats.headers.count"),
+        I18N.t("main.commands.dbstats.headers.avg_ms"),
+        I18N.t("main.commands.dbstats.headers.max_ms"),
+        I18N.t("main.commands.dbstats.headers.rows"),
+        I18N.t("main.commands.dbstats.headers.db_file"),
+    ]
+    histogram = tabulate([stats.histogram], headers=db_stats.bucket_labels())
+    msgs = [
+        f"```{histogram}```\n"
+        + I18N.t(
+            "main.commands.dbstats.msg_cache", **db_helper.settings_cache.stats()
+        ),
+        I18N.t("main.commands.dbstats.msg_slowest")
+        + f"\n```{db_stats.shape_table(stats.top(top, 'avg_seconds'), headers)}```",
+        I18N.t("main.commands.dbstats.msg_frequent")
+        + f"\n```{db_stats.shape_table(stats.top(top, 'count'), headers)}```",
+    ]
+    await interaction.response.send_message(msgs[0], ephemeral=True)
+    # Each table gets its own message, as a message only has room for so much
+    for msg in msgs[1:]:
+        await interaction.followup.send(msg, ephemeral=True)
+
+
 # Commands
 @config.bot.tree.command(
     name="ping", description=locale_str(I18N.t("main.commands.ping.command"))
@@ -2326,6 +2472,8 @@ async def edit_bot_say_msg(interaction: discord.Interaction, message: discord.Me
 
 # Locale db is per-guild - created in `register_guild()` (see on_ready
 # and on_guild_join above), not at import time here.
+config.bot.add_close_hook(db_helper.close_connections)
+config.bot.add_close_hook(http_client.client.close)
 if config.DISCORD_TOKEN != "":
     try:
         config.bot.run(config.DISCORD_TOKEN)
@@ -7,7 +7,7 @@ from discord.ext import commands
 from discord.app_commands import locale_str, describe
 import uuid
 
-from sausage_bot.util import config, envs, db_helper, discord_commands
+from sausage_bot.util import config, envs, db_helper, db_migrations, discord_commands
 from sausage_bot.util.i18n import I18N
 
 logger = config.logger
@@ -34,15 +34,6 @@ class Dilemmas(commands.Cog):
             out = "```{}```".format(dilemmas_in)
             return out
 
-        async def get_random_dilemma():
-            return await db_helper.get_random_left_exclude_output(
-                envs.dilemmas_db_schema,
-                envs.dilemmas_db_log_schema,
-                "id",
-                ("id", "dilemmas_text"),
-                guild_id=interaction.guild.id,
-            )
-
         await interaction.response.defer()
         # Check that there are dilemmas
         no_of_dilemmas = await db_helper.get_output(
@@ -58,12 +49,14 @@ class Dilemmas(commands.Cog):
             )
             return
         # Get a random dilemma
-        random_dilemma = await get_random_dilemma()
-        if len(random_dilemma) == 0:
-            await db_helper.empty_table(
-                envs.dilemmas_db_log_schema, guild_id=interaction.guild.id
-            )
-            random_dilemma = await get_random_dilemma()
+        random_dilemma = await db_helper.get_random_from_bag(
+            envs.dilemmas_db_schema,
+            envs.dilemmas_db_log_schema,
+            envs.dilemmas_bag_db_schema,
+            "id",
+            ("id", "dilemmas_text"),
+            guild_id=interaction.guild.id,
+        )
         # Post dilemma
         _dilemma = prettify(random_dilemma[0][1])
         dilemma_post = await interaction.followup.send(_dilemma)
@@ -72,6 +65,11 @@ class Dilemmas(commands.Cog):
             [(random_dilemma[0][0], dilemma_post.id)],
             guild_id=interaction.guild.id,
         )
+        await db_helper.remove_from_bag(
+            envs.dilemmas_bag_db_schema,
+            [random_dilemma[0][0]],
+            guild_id=interaction.guild.id,
+        )
         return
 
     @discord_commands.is_owner_or_manage_guild()
@@ -83,11 +81,15 @@ class Dilemmas(commands.Cog):
         self, interaction: discord.Interaction, dilemmas_in: str
     ) -> None:
         await interaction.response.defer()
+        dilemma_id = str(uuid.uuid4())
         await db_helper.insert_many_all(
             envs.dilemmas_db_schema,
-            [(str(uuid.uuid4()), dilemmas_in)],
+            [(dilemma_id, dilemmas_in)],
             guild_id=interaction.guild.id,
         )
+        await db_helper.add_to_bag(
+            envs.dilemmas_bag_db_schema, [dilemma_id], guild_id=interaction.guild.id
+        )
         await interaction.followup.send(
             I18N.t("dilemmas.commands.add.msg_confirm", dilemmas_in=dilemmas_in)
         )
@@ -121,16 +123,23 @@ async def setup(bot):
     logger.info(envs.COG_STARTING.format(cog_name))
     logger.debug("Checking db")
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=guild.id)
         await db_helper.prep_table(envs.dilemmas_db_log_schema, guild_id=guild.id)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                cog_name,
+                guild,
+                prep,
+                tables=[envs.dilemmas_db_schema, envs.dilemmas_db_log_schema],
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     logger.debug("Registering cog to bot")
     await bot.add_cog(Dilemmas(bot))
     logger.info(envs.COG_STARTED.format(cog_name))
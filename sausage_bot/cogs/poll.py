@@ -10,9 +10,10 @@ import asyncio
 import re
 import pendulum
 import uuid
+import aiosqlite
 
 from sausage_bot.util import db_helper, envs, config, discord_commands
-from sausage_bot.util import datetime_handling
+from sausage_bot.util import datetime_handling, db_migrations
 from sausage_bot.util.i18n import I18N
 
 logger = config.logger
@@ -255,16 +256,27 @@ class MakePoll(commands.Cog):
         # Get all reactions
         poll_cache = await channel.fetch_message(poll_msg.id)
         poll_reacts = poll_cache.reactions
-        for alts in alts_db:
-            for react in poll_reacts:
-                if react.emoji in alts:
-                    await db_helper.update_fields(
-                        envs.poll_db_alternatives_schema,
-                        [("uuid", _uuid), ("emoji", react.emoji)],
-                        [("count", int(react.count - 1))],
-                        guild_id=interaction.guild.id,
-                    )
-                    break
+        try:
+            async with db_helper.transaction(
+                envs.poll_db_alternatives_schema, interaction.guild.id
+            ):
+                for alts in alts_db:
+                    for react in poll_reacts:
+                        if react.emoji in alts:
+                            await db_helper.update_fields(
+                                envs.poll_db_alternatives_schema,
+                                [("uuid", _uuid), ("emoji", react.emoji)],
+                                [("count", int(react.count - 1))],
+                                guild_id=interaction.guild.id,
+                            )
+                            break
+        except aiosqlite.Error as e:
+            # Long after the interaction's followups have expired
+            logger.error(f"Could not store the counts for poll `{_uuid}`: {e}")
+            await discord_commands.log_to_bot_channel(
+                interaction.guild, I18N.t("common.something_wrong", error=e)
+            )
+            return
         sorted_reacts = await db_helper.get_output(
             template_info=envs.poll_db_alternatives_schema,
             where=[("uuid", _uuid)],
@@ -303,16 +315,23 @@ async def setup(bot):
     logger.info(envs.COG_STARTING.format(cog_name))
     logger.debug("Checking db")
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await db_helper.prep_table(envs.poll_db_polls_schema, guild_id=guild.id)
         await db_helper.prep_table(envs.poll_db_alternatives_schema, guild_id=guild.id)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                cog_name,
+                guild,
+                prep,
+                tables=[envs.poll_db_polls_schema, envs.poll_db_alternatives_schema],
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     logger.debug("Registering cog to bot")
     await bot.add_cog(MakePoll(bot))
     logger.info(envs.COG_STARTED.format(cog_name))
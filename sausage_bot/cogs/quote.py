@@ -15,15 +15,16 @@ import typing
 from pprint import pformat
 import re
 from datetime import datetime
-import requests
-import base64
-import binascii
+import aiohttp
+import asyncio
 from io import BytesIO
 from PIL import Image
+import aiosqlite
 
 from sausage_bot.util import datetime_handling
 from sausage_bot.util.args import args
-from sausage_bot.util import envs, db_helper, file_io, config, discord_commands
+from sausage_bot.util import envs, db_helper, db_migrations, file_io, config
+from sausage_bot.util import discord_commands, http_client
 from sausage_bot.util.datetime_handling import get_dt
 from sausage_bot.util.i18n import I18N
 from sausage_bot.util.logger import truncate_for_log
@@ -229,6 +230,25 @@ async def env_settings_autocomplete(
     ][:25]
 
 
+async def quote_autocomplete(
+    interaction: discord.Interaction,
+    current: str,
+) -> list[discord.app_commands.Choice[str]]:
+    "The quotes matching what is typed so far, best match first"
+    if not current or current.isdigit():
+        return []
+    hits = await db_helper.search_quotes(current, guild_id=interaction.guild.id)
+    return [
+        discord.app_commands.Choice(
+            name="#{} {}: {}".format(
+                hit["rowid"], hit["author_backup"], hit["snippet"].replace("**", "")
+            )[:100],
+            value=str(hit["rowid"]),
+        )
+        for hit in hits or []
+    ][:25]
+
+
 def get_quote_channel_name(guild: discord.Guild, quote: dict) -> str:
     """
     Resolve a quote's channel to a printable name.
@@ -254,10 +274,9 @@ async def delete_quote_with_content(guild_id, uuid: str, rowid) -> None:
     images, and its posting log rows.
 
     Deleting the `quote` row on its own left orphaned `quote_content` and
-    `quote_img` rows behind - the images in particular, since a single
-    base64 image is by far the largest thing this database stores - plus
-    log rows that kept a no longer existing uuid excluded from random
-    picks for good.
+    `quote_img` rows behind - and with them the images in `quote_blob`,
+    by far the largest thing this database stores - plus log rows that
+    kept a no longer existing uuid excluded from random picks for good.
     #autodoc skip#
     """
     comment_rows = await db_helper.get_output(
@@ -274,23 +293,27 @@ async def delete_quote_with_content(guild_id, uuid: str, rowid) -> None:
         if row["comment_id"] not in [None, ""]
     ]
     logger.debug(f"Deleting quote `{uuid}` with comment ids: {comment_ids}")
-    if len(comment_ids) > 0:
-        await db_helper.del_row_by_OR_filter(
-            template_info=envs.quote_img_db_schema,
-            where=[("comment_id", c_id) for c_id in comment_ids],
+    # All of it or nothing, so a failed delete can't leave half a quote
+    async with db_helper.transaction(envs.quote_db_schema, guild_id):
+        if len(comment_ids) > 0:
+            await db_helper.del_row_by_OR_filter(
+                template_info=envs.quote_img_db_schema,
+                where=[("comment_id", c_id) for c_id in comment_ids],
+                guild_id=guild_id,
+            )
+            await db_helper.prune_quote_blobs(guild_id=guild_id)
+        await db_helper.del_row_by_AND_filter(
+            template_info=envs.quote_content_db_schema,
+            where=[("uuid", uuid)],
             guild_id=guild_id,
         )
-    await db_helper.del_row_by_AND_filter(
-        template_info=envs.quote_content_db_schema,
-        where=[("uuid", uuid)],
-        guild_id=guild_id,
-    )
-    await db_helper.del_row_by_AND_filter(
-        template_info=envs.quote_db_log_schema,
-        where=[("uuid", uuid)],
-        guild_id=guild_id,
-    )
-    await db_helper.del_row_id(envs.quote_db_schema, rowid, guild_id=guild_id)
+        await db_helper.del_row_by_AND_filter(
+            template_info=envs.quote_db_log_schema,
+            where=[("uuid", uuid)],
+            guild_id=guild_id,
+        )
+        await db_helper.remove_from_bag(envs.quote_bag_db_schema, [uuid], guild_id)
+        await db_helper.del_row_id(envs.quote_db_schema, rowid, guild_id=guild_id)
 
 
 async def get_random_quote(guild_id, testmode=False):
@@ -311,23 +334,14 @@ async def get_random_quote(guild_id, testmode=False):
             guild_id=guild_id,
         )
         return quote
-    random_quote = await db_helper.get_random_left_exclude_output(
+    return await db_helper.get_random_from_bag(
         envs.quote_db_schema,
         envs.quote_db_log_schema,
+        envs.quote_bag_db_schema,
         "uuid",
         ("rowid", "uuid", "datetime"),
         guild_id=guild_id,
     )
-    if random_quote is None or len(random_quote) == 0:
-        await db_helper.empty_table(envs.quote_db_log_schema, guild_id=guild_id)
-        random_quote = await db_helper.get_random_left_exclude_output(
-            envs.quote_db_schema,
-            envs.quote_db_log_schema,
-            "uuid",
-            ("rowid", "uuid", "datetime"),
-            guild_id=guild_id,
-        )
-    return random_quote
 
 
 async def post_random_quote(
@@ -357,6 +371,7 @@ async def post_random_quote(
     random_quote = await db_helper.get_imgs_with_quote(
         envs.quote_db_schema,
         where=[("quote.rowid", str(random_quote_number[0][0]))],
+        img_refs=True,
         guild_id=guild.id,
     )
     logger.debug(f"random_quote: {random_quote}")
@@ -417,7 +432,7 @@ async def post_random_quote(
                 img_list = []
                 for _img_id in comment["imgs"]:
                     img = comment["imgs"][_img_id]
-                    img_object = convert_b64_to_img_in_mem(str(img))
+                    img_object = await load_img_file(img, guild.id)
                     img_list.append(img_object)
                 if len(autopost) > 0:
                     await discord_commands.post_to_channel(
@@ -512,6 +527,10 @@ async def post_random_quote(
                     ],
                     guild_id=guild.id,
                 )
+        # Posted, so it is done for this round
+        await db_helper.remove_from_bag(
+            envs.quote_bag_db_schema, [quote["uuid"]], guild.id
+        )
         return
 
 
@@ -519,6 +538,7 @@ async def post_selected_quote(interaction, _ephemeral, quote_in):
     quote = await db_helper.get_imgs_with_quote(
         envs.quote_db_schema,
         where=[("quote.rowid", int(quote_in))],
+        img_refs=True,
         guild_id=interaction.guild.id,
     )
     logger.debug(f"quote: {quote}")
@@ -554,7 +574,7 @@ async def post_selected_quote(interaction, _ephemeral, quote_in):
                 img_list = []
                 for _img_id in comment["imgs"]:
                     img = comment["imgs"][_img_id]
-                    img_object = convert_b64_to_img_in_mem(str(img))
+                    img_object = await load_img_file(img, interaction.guild.id)
                     img_list.append(img_object)
                 await interaction.followup.send(
                     msg_in, files=img_list, ephemeral=_ephemeral
@@ -659,6 +679,7 @@ class Quotes(commands.Cog):
         name="post", description=locale_str(I18N.t("quote.commands.post.cmd"))
     )
     @describe(quote_in=I18N.t("quote.commands.post.desc.number"))
+    @discord.app_commands.autocomplete(quote_in=quote_autocomplete)
     async def post(
         self,
         interaction: discord.Interaction,
@@ -694,12 +715,14 @@ class Quotes(commands.Cog):
         name="edit", description=locale_str(I18N.t("quote.commands.edit.cmd"))
     )
     @describe(quote_in=I18N.t("quote.commands.edit.desc.quote_in"))
+    @discord.app_commands.autocomplete(quote_in=quote_autocomplete)
     async def quote_edit(self, interaction: discord.Interaction, quote_in: str):
         "Edit an existing quote"
         logger.debug(f"quote_in: ({type(quote_in)}) {quote_in}")
         quote_from_db = await db_helper.get_imgs_with_quote(
             envs.quote_db_schema,
             where=[("quote.rowid", int(quote_in))],
+            img_refs=True,
             guild_id=interaction.guild.id,
         )
         quote_from_db = quote_from_db[0]
@@ -788,7 +811,7 @@ class Quotes(commands.Cog):
                 )
             )
             quote_insert_order += 1
-            imgs_in = get_imgs_to_db_format(_q_object)
+            imgs_in = await get_imgs_to_db_format(_q_object)
             if imgs_in:
                 imgs_to_db += imgs_in
         # Delete old comments
@@ -811,11 +834,9 @@ class Quotes(commands.Cog):
             guild_id=interaction.guild.id,
         )
         if len(imgs_to_db) > 0:
-            await db_helper.insert_many_all(
-                template_info=envs.quote_img_db_schema,
-                inserts=imgs_to_db,
-                guild_id=interaction.guild.id,
-            )
+            await db_helper.insert_quote_imgs(imgs_to_db, guild_id=interaction.guild.id)
+        if len(quote_comments_remove) > 0:
+            await db_helper.prune_quote_blobs(guild_id=interaction.guild.id)
         return
 
     @discord_commands.is_owner_or_manage_guild()
@@ -830,6 +851,7 @@ class Quotes(commands.Cog):
         quote_from_db = await db_helper.get_imgs_with_quote(
             envs.quote_db_schema,
             where=[("quote.rowid", str(quote_number))],
+            img_refs=True,
             guild_id=interaction.guild.id,
         )
         logger.debug(f"quote_from_db is: {truncate_for_log(quote_from_db)}")
@@ -862,7 +884,7 @@ class Quotes(commands.Cog):
                 img_list = []
                 for _img_id in comment["imgs"]:
                     img = comment["imgs"][_img_id]
-                    img_object = convert_b64_to_img_in_mem(str(img))
+                    img_object = await load_img_file(img, interaction.guild.id)
                     img_list.append(img_object)
                 await interaction.followup.send(msg_in, files=img_list, ephemeral=True)
                 msg_in = ""
@@ -908,11 +930,18 @@ class Quotes(commands.Cog):
             return
         if True in btn_values:
             # Remove the quote
-            await delete_quote_with_content(
-                guild_id=interaction.guild.id,
-                uuid=quote["uuid"],
-                rowid=quote["rowid"],
-            )
+            try:
+                await delete_quote_with_content(
+                    guild_id=interaction.guild.id,
+                    uuid=quote["uuid"],
+                    rowid=quote["rowid"],
+                )
+            except aiosqlite.Error as e:
+                logger.error(f"Could not delete quote {quote['rowid']}: {e}")
+                await interaction.followup.send(
+                    I18N.t("quote.commands.delete.msg_fail"), ephemeral=True
+                )
+                return
             # Confirm that the quote has been deleted
             await interaction.followup.send(
                 I18N.t(
@@ -958,16 +987,16 @@ class Quotes(commands.Cog):
         quote_rowids = await db_helper.get_row_ids(
             template_info=envs.quote_db_schema, guild_id=interaction.guild.id
         )
-        # List based on keyword
+        # List based on keyword, best match first
         if keyword:
             logger.debug("Using keyword")
+            hits = await db_helper.search_quotes(
+                keyword, limit=-1, guild_id=interaction.guild.id
+            )
             quote_in = await db_helper.get_imgs_with_quote(
                 envs.quote_content_db_schema,
-                like=[
-                    ("quote_content.author_backup", keyword, "OR"),
-                    ("quote_content.content_text", keyword),
-                ],
-                order_by=[("quote.rowid", "ASC")],
+                uuids=[hit["uuid"] for hit in hits or []],
+                img_refs=True,
                 guild_id=interaction.guild.id,
             )
             return quote_in
@@ -996,12 +1025,36 @@ class Quotes(commands.Cog):
                     quote_in = await db_helper.get_imgs_with_quote(
                         envs.quote_content_db_schema,
                         order_by=[("quote.rowid", "ASC")],
+                        img_refs=True,
                         guild_id=interaction.guild.id,
                     )
                     return quote_in
                 if False in btn_values:
                     return False
 
+    @group.command(
+        name="search", description=locale_str(I18N.t("quote.commands.search.cmd"))
+    )
+    @describe(query=I18N.t("quote.commands.search.desc.query"))
+    async def quote_search(self, interaction: discord.Interaction, query: str):
+        "Search the quotes' text and authors, best match first"
+        await interaction.response.defer(ephemeral=True)
+        hits = await db_helper.search_quotes(
+            query, limit=10, guild_id=interaction.guild.id
+        )
+        if not hits:
+            await interaction.followup.send(
+                I18N.t("quote.commands.search.msg_no_results", query=query),
+                ephemeral=True,
+            )
+            return
+        msg = "\n".join(
+            "`#{}` {}: {}".format(hit["rowid"], hit["author_backup"], hit["snippet"])
+            for hit in hits
+        )
+        await interaction.followup.send(msg[:2000], ephemeral=True)
+        return
+
     @discord_commands.is_owner_or_manage_guild()
     @group.command(
         name="list", description=locale_str(I18N.t("quote.commands.list.cmd"))
@@ -1068,7 +1121,7 @@ class Quotes(commands.Cog):
                     img_list = []
                     for _img_id in comment["imgs"]:
                         img = comment["imgs"][_img_id]
-                        img_object = convert_b64_to_img_in_mem(str(img))
+                        img_object = await load_img_file(img, interaction.guild.id)
                         img_list.append(img_object)
                     await interaction.followup.send(
                         msg_in, files=img_list, ephemeral=_ephemeral
@@ -1433,22 +1486,13 @@ class Quotes(commands.Cog):
         setting - posting a quote if this tick falls in that guild's
         target 5-minute window, in that guild's own timezone.
         """
-        approved_guilds = await db_helper.get_output(
-            envs.guilds_db_schema, where=("status", "approved")
+        started_guilds = await db_helper.task_statuses.started_guilds(
+            "quotes", "autopost"
         )
-        for guild_row in approved_guilds:
+        for guild_row in started_guilds:
             guild = config.bot.get_guild(int(guild_row["guild_id"]))
             if guild is None:
                 continue
-            task_status = await db_helper.get_output(
-                template_info=envs.tasks_db_schema,
-                where=[("cog", "quotes"), ("task", "autopost")],
-                select=("status"),
-                single=True,
-                guild_id=guild.id,
-            )
-            if task_status.get("status") != "started":
-                continue
             async with db_helper.guild_locale_context(guild.id):
                 settings_in_db = await db_helper.get_output(
                     template_info=envs.quote_db_settings_schema,
@@ -1544,7 +1588,7 @@ class Quotes(commands.Cog):
         await config.bot.wait_until_ready()
 
 
-def get_imgs_to_db_format(msg: discord.Message):
+async def get_imgs_to_db_format(msg: discord.Message):
     imgs_out = []
     if len(msg.attachments) > 0:
         att_counter = 0
@@ -1553,33 +1597,31 @@ def get_imgs_to_db_format(msg: discord.Message):
                 if att.filename.split(".")[-1] in ["jpg", "png", "gif"]:
                     logger.debug(f"Found attachment: {att.url}")
                     att_counter += 1
-                    base_img = convert_img_to_b64(att.url)
-                    imgs_out.append((str(msg.id), att_counter, base_img))
+                    img = await fetch_img(att.url)
+                    if img is not None:
+                        imgs_out.append((str(msg.id), att_counter, img))
         return imgs_out
     else:
         return None
 
 
-def convert_img_to_b64(image_url: str) -> str | None:
+async def fetch_img(image_url: str) -> bytes | None:
     """
-    Converts an image from a url to base64-string
+    Get an image from a url, as bytes
     """
     try:
         # Get image from url
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
+        async with http_client.client.session().get(
+            image_url, timeout=aiohttp.ClientTimeout(total=10), raise_for_status=True
+        ) as response:
+            content = await response.read()
 
         # Validate image
-        image_data = BytesIO(response.content)
-        with Image.open(image_data) as img:
+        with Image.open(BytesIO(content)) as img:
             img.verify()
+        return content
 
-        # Convert image to base64
-        image_data.seek(0)
-        base64_str = base64.b64encode(response.content).decode("utf-8")
-        return base64_str
-
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Could not fetch URL: {e}")
     except (IOError, SyntaxError) as e:
         logger.error(f"The URL does not giva a valid image: {e}")
@@ -1589,22 +1631,26 @@ def convert_img_to_b64(image_url: str) -> str | None:
     return None
 
 
-def convert_b64_to_img_in_mem(b64string: str):
+async def load_img_file(img_ref: dict, guild_id):
     """
-    Converts a base64-string to image file
+    Get the image `img_ref` refers to (see
+    `db_helper.get_imgs_with_quote`) as a `discord.File`
     """
-    try:
-        image_data = base64.b64decode(b64string)
-        with BytesIO(image_data) as image_binary:
-            discord_file = discord.File(fp=image_binary, filename="image.png")
-            return discord_file
-    except (binascii.Error, ValueError) as e:
-        logger.error(f"Invalid Base64 string: {e}")
-    except (IOError, SyntaxError) as e:
-        logger.error(f"Data is not a valid image: {e}")
-    except Exception as e:
-        logger.error(f"Unknown error: {e}")
-    return None
+    return img_to_discord_file(
+        await db_helper.get_quote_img(
+            img_ref["comment_id"], img_ref["img_no"], guild_id=guild_id
+        )
+    )
+
+
+def img_to_discord_file(img: bytes):
+    """
+    Make a `discord.File` of an image stored as bytes
+    """
+    if img is None:
+        logger.error("Image is missing from the database")
+        return None
+    return discord.File(fp=BytesIO(img), filename="image.png")
 
 
 @discord_commands.is_owner_or_manage_guild()
@@ -1668,7 +1714,7 @@ async def quote_add(interaction: discord.Interaction, message: discord.Message):
             )
         )
         quote_insert_order += 1
-        imgs_in = get_imgs_to_db_format(_q)
+        imgs_in = await get_imgs_to_db_format(_q)
         if imgs_in:
             imgs_to_db += imgs_in
     await db_helper.insert_many_all(
@@ -1689,11 +1735,10 @@ async def quote_add(interaction: discord.Interaction, message: discord.Message):
         guild_id=interaction.guild.id,
     )
     if len(imgs_to_db) > 0:
-        await db_helper.insert_many_all(
-            template_info=envs.quote_img_db_schema,
-            inserts=imgs_to_db,
-            guild_id=interaction.guild.id,
-        )
+        await db_helper.insert_quote_imgs(imgs_to_db, guild_id=interaction.guild.id)
+    await db_helper.add_to_bag(
+        envs.quote_bag_db_schema, [_uuid], guild_id=interaction.guild.id
+    )
     return
 
 
@@ -1712,6 +1757,8 @@ async def ensure_guild_quote_tables(guild):
     )
     await db_helper.prep_table(table_in=envs.quote_content_db_schema, guild_id=guild.id)
     await db_helper.prep_table(table_in=envs.quote_img_db_schema, guild_id=guild.id)
+    await db_helper.prep_table(table_in=envs.quote_blob_db_schema, guild_id=guild.id)
+    await db_migrations.migrate(envs.quote_img_db_schema, guild)
 
 
 async def setup(bot):
@@ -1719,16 +1766,32 @@ async def setup(bot):
     logger.info(envs.COG_STARTING.format(cog_name))
     logger.debug("Checking db")
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await ensure_guild_quote_tables(guild)
         await db_helper.ensure_guild_tasks_rows(guild.id)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                cog_name,
+                guild,
+                prep,
+                migrated=[envs.quote_img_db_schema],
+                tables=[
+                    envs.quote_db_schema,
+                    envs.quote_db_log_schema,
+                    envs.quote_db_settings_schema,
+                    envs.quote_content_db_schema,
+                    envs.quote_img_db_schema,
+                    envs.quote_blob_db_schema,
+                    envs.tasks_db_schema,
+                ],
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     logger.debug("Registering cog to bot")
     await bot.add_cog(Quotes(bot))
     logger.info(envs.COG_STARTED.format(cog_name))
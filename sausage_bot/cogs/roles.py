@@ -10,9 +10,10 @@ from tabulate import tabulate
 import re
 import typing
 from pprint import pformat
+import aiosqlite
 
 from sausage_bot.util import config, envs, discord_commands
-from sausage_bot.util import db_helper, net_io
+from sausage_bot.util import db_helper, db_migrations, net_io
 from sausage_bot.util.i18n import I18N
 
 logger = config.logger
@@ -222,18 +223,26 @@ async def sync_reaction_message_from_settings(
             )
         )
         msg_id = msg_obj.id
-        await db_helper.update_fields(
-            envs.roles_db_msgs_schema,
-            updates=[("msg_id", msg_id)],
-            where=("msg_id", msg_info["id"]),
-            guild_id=guild.id,
-        )
-        await db_helper.update_fields(
-            envs.roles_db_roles_schema,
-            updates=[("msg_id", msg_id)],
-            where=("msg_id", msg_info["id"]),
-            guild_id=guild.id,
-        )
+        # Both tables or neither, so the roles never point to a message
+        # id the messages table doesn't have
+        try:
+            async with db_helper.transaction(envs.roles_db_msgs_schema, guild.id):
+                await db_helper.update_fields(
+                    envs.roles_db_msgs_schema,
+                    updates=[("msg_id", msg_id)],
+                    where=("msg_id", msg_info["id"]),
+                    guild_id=guild.id,
+                )
+                await db_helper.update_fields(
+                    envs.roles_db_roles_schema,
+                    updates=[("msg_id", msg_id)],
+                    where=("msg_id", msg_info["id"]),
+                    guild_id=guild.id,
+                )
+        except aiosqlite.Error as e:
+            logger.error(f"Could not move reaction message to {msg_id}: {e}")
+            await msg_obj.delete()
+            return I18N.t("common.something_wrong", error=e)
         logger.debug(f"`msg_obj` is {msg_obj}")
 
     db_message = await db_helper.get_output(
@@ -2175,12 +2184,7 @@ async def ensure_guild_roles_tables(guild):
         table_in=envs.roles_db_settings_schema, guild_id=guild.id
     )
     # Change channel name to id
-    await db_helper.db_channel_names_to_ids(
-        template_info=envs.roles_db_msgs_schema,
-        id_col="msg_id",
-        channel_col="channel",
-        guild=guild,
-    )
+    await db_migrations.migrate(envs.roles_db_msgs_schema, guild)
 
 
 async def setup(bot):
@@ -2188,15 +2192,27 @@ async def setup(bot):
     logger.info(envs.COG_STARTING.format(cog_name))
     logger.debug("Checking db")
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await ensure_guild_roles_tables(guild)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                cog_name,
+                guild,
+                prep,
+                migrated=[envs.roles_db_msgs_schema],
+                tables=[
+                    envs.roles_db_msgs_schema,
+                    envs.roles_db_roles_schema,
+                    envs.roles_db_settings_schema,
+                ],
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     logger.debug("Registering cog to bot")
     await bot.add_cog(Autoroles(bot))
     logger.info(envs.COG_STARTED.format(cog_name))
@@ -10,12 +10,13 @@ from discord.ext import commands, tasks
 from discord.app_commands import locale_str, describe
 from discord.utils import get
 import typing
+import functools
 from time import sleep
 import re
 from pprint import pformat
 
 from sausage_bot.util import config, envs, feeds_core, net_io
-from sausage_bot.util import db_helper, discord_commands
+from sausage_bot.util import db_helper, db_migrations, discord_commands
 from sausage_bot.util.i18n import I18N
 
 logger = config.logger
@@ -28,6 +29,7 @@ logger = config.logger
 LIST_TYPE_NORMAL = I18N.t("rss.commands.list.literal_type.normal")
 LIST_TYPE_ADDED = I18N.t("rss.commands.list.literal_type.added")
 LIST_TYPE_FILTER = I18N.t("rss.commands.list.literal_type.filter")
+LIST_TYPE_CACHE = I18N.t("rss.commands.list.literal_type.cache")
 
 
 async def rss_feed_name_autocomplete(
@@ -644,6 +646,7 @@ class RSSfeed(commands.Cog):
             LIST_TYPE_NORMAL,
             LIST_TYPE_ADDED,
             LIST_TYPE_FILTER,
+            LIST_TYPE_CACHE,
         ],
     ):
         """
@@ -667,6 +670,14 @@ class RSSfeed(commands.Cog):
                 list_type="filter",
                 feed_type="rss",
             )
+        elif list_type == LIST_TYPE_CACHE:
+            formatted_list = await feeds_core.get_feed_list(
+                guild=interaction.guild,
+                db_in=envs.rss_db_schema,
+                db_cache_in=envs.rss_db_http_cache_schema,
+                list_type="cache",
+                feed_type="rss",
+            )
         else:
             formatted_list = await feeds_core.get_feed_list(
                 guild=interaction.guild, db_in=envs.rss_db_schema, feed_type="rss"
@@ -975,6 +986,7 @@ class RSSfeed(commands.Cog):
             LIST_TYPE_NORMAL,
             LIST_TYPE_ADDED,
             LIST_TYPE_FILTER,
+            LIST_TYPE_CACHE,
         ],
     ):
         """
@@ -998,6 +1010,14 @@ class RSSfeed(commands.Cog):
                 list_type="filter",
                 feed_type="podcast",
             )
+        elif list_type == LIST_TYPE_CACHE:
+            formatted_list = await feeds_core.get_feed_list(
+                guild=interaction.guild,
+                db_in=envs.rss_db_schema,
+                db_cache_in=envs.rss_db_http_cache_schema,
+                list_type="cache",
+                feed_type="podcast",
+            )
         else:
             formatted_list = await feeds_core.get_feed_list(
                 guild=interaction.guild, db_in=envs.rss_db_schema, feed_type="podcast"
@@ -1019,24 +1039,16 @@ class RSSfeed(commands.Cog):
     @tasks.loop(minutes=config.RSS_LOOP, reconnect=True)
     async def task_post_feeds():
         logger.info("Starting `post_feeds`")
-        approved_guilds = await db_helper.get_output(
-            envs.guilds_db_schema, where=("status", "approved")
+        started_guilds = await db_helper.task_statuses.started_guilds(
+            "rss", "post_feeds"
         )
-        for guild_row in approved_guilds:
+        jobs = []
+        fetches = feeds_core.FeedFetches()
+        for guild_row in started_guilds:
             guild = config.bot.get_guild(int(guild_row["guild_id"]))
             if guild is None:
                 logger.debug(f"Guild `{guild_row['guild_id']}` not in cache, skipping")
                 continue
-            task_status = await db_helper.get_output(
-                template_info=envs.tasks_db_schema,
-                where=[("cog", "rss"), ("task", "post_feeds")],
-                select=("status"),
-                single=True,
-                guild_id=guild.id,
-            )
-            if task_status.get("status") != "started":
-                logger.debug(f"`post_feeds` is not enabled for `{guild.name}`, skipping")
-                continue
             async with db_helper.guild_locale_context(guild.id):
                 # Start processing feeds
                 feeds = await db_helper.get_output(
@@ -1057,45 +1069,21 @@ class RSSfeed(commands.Cog):
                     logger.debug("- {}".format(feed["feed_name"]))
                 # Start processing per feed settings
                 for feed in feeds:
-                    UUID = feed["uuid"]
-                    FEED_NAME = feed["feed_name"]
-                    CHANNEL = feed["channel"]
-                    channel_obj = guild.get_channel(int(CHANNEL))
-                    logger.debug(f"Found channel `{channel_obj.name}` in `{FEED_NAME}`")
-                    FEED_POSTS = await feeds_core.get_feed_links(
-                        feed_type="rss", feed_info=feed, guild_id=guild.id
-                    )
-                    if FEED_POSTS is None or isinstance(FEED_POSTS, int):
-                        logger.info(f"Feed {FEED_NAME} returned {FEED_POSTS}")
-                        await db_helper.update_fields(
-                            template_info=envs.rss_db_schema,
-                            where=("uuid", UUID),
-                            updates=("status_url", envs.FEEDS_URL_ERROR),
-                            guild_id=guild.id,
-                        )
-                        await discord_commands.log_to_bot_channel(
-                            guild,
-                            I18N.t(
-                                "rss.tasks.feed_posts_is_none",
-                                feed_name=FEED_NAME,
-                                return_value=str(FEED_POSTS),
-                            ),
-                        )
-                    else:
-                        logger.debug(
-                            "Got {} items for `FEED_POSTS`: {}".format(
-                                len(FEED_POSTS),
-                                ", ".join([pod_ep["title"] for pod_ep in FEED_POSTS]),
-                            )
-                        )
-                        await feeds_core.process_links_for_posting_or_editing(
-                            feed_name=FEED_NAME,
-                            feed_type="rss",
-                            uuid=UUID,
-                            FEED_POSTS=FEED_POSTS,
-                            CHANNEL=CHANNEL,
-                            guild=guild,
+                    jobs.append(
+                        (
+                            feed["channel"],
+                            feed["url"],
+                            functools.partial(post_rss_feed, guild, feed, fetches),
                         )
+                    )
+        # Fetch and post the feeds of all the guilds at the same time
+        await feeds_core.run_feed_jobs(jobs)
+        logger.info(
+            f"Fetched {fetches.fetched} feeds for {len(jobs)} subscriptions "
+            f"({fetches.shared} shared)"
+        )
+        # Write the links logged during this run in one go
+        await db_helper.flush_buffered_inserts()
         logger.info("Done with posting")
         return
 
@@ -1108,26 +1096,15 @@ class RSSfeed(commands.Cog):
     @tasks.loop(minutes=config.POD_LOOP, reconnect=True)
     async def task_post_podcasts():
         logger.info("Starting `post_podcasts`")
-        approved_guilds = await db_helper.get_output(
-            envs.guilds_db_schema, where=("status", "approved")
+        started_guilds = await db_helper.task_statuses.started_guilds(
+            "rss", "post_podcasts"
         )
-        for guild_row in approved_guilds:
+        fetches = feeds_core.FeedFetches()
+        for guild_row in started_guilds:
             guild = config.bot.get_guild(int(guild_row["guild_id"]))
             if guild is None:
                 logger.debug(f"Guild `{guild_row['guild_id']}` not in cache, skipping")
                 continue
-            task_status = await db_helper.get_output(
-                template_info=envs.tasks_db_schema,
-                where=[("cog", "rss"), ("task", "post_podcasts")],
-                select=("status"),
-                single=True,
-                guild_id=guild.id,
-            )
-            if task_status.get("status") != "started":
-                logger.debug(
-                    f"`post_podcasts` is not enabled for `{guild.name}`, skipping"
-                )
-                continue
             async with db_helper.guild_locale_context(guild.id):
                 # Check for new episodes of Spotify podcasts
                 spotify_check = await net_io.check_for_new_spotify_podcast_episodes(
@@ -1207,9 +1184,19 @@ class RSSfeed(commands.Cog):
                                 FEED_NAME,
                             )
                         )
-                        req = await net_io.get_link(URL)
+                        req = await feeds_core.get_feed_if_changed(
+                            "podcast", UUID, URL, guild.id, fetches=fetches
+                        )
+                        if req["status"] == 304:
+                            logger.debug(f"Feed {FEED_NAME} has not changed")
+                            await feeds_core.save_feed_fetches([req], guild.id)
+                            continue
                         FEED_POSTS = await net_io.get_other_podcast_links(
-                            req=req, url=URL, uuid=UUID, num_items=3, guild=guild
+                            req=req["content"],
+                            url=URL,
+                            uuid=UUID,
+                            num_items=3,
+                            guild=guild,
                         )
                         logger.debug(
                             "Got {} items for `FEED_POSTS`: {}".format(
@@ -1236,6 +1223,9 @@ class RSSfeed(commands.Cog):
                                 CHANNEL=CHANNEL,
                                 guild=guild,
                             )
+                            await feeds_core.save_feed_fetches([req], guild.id)
+        # Write the links logged during this run in one go
+        await db_helper.flush_buffered_inserts()
         logger.info("Done with posting")
 
     @task_post_podcasts.before_loop
@@ -1245,6 +1235,62 @@ class RSSfeed(commands.Cog):
         await config.bot.wait_until_ready()
 
 
+async def post_rss_feed(guild, feed, fetches=None):
+    """
+    Fetch the rss feed `feed` and post what's new in it to its channel in
+    `guild`. Run by `RSSfeed.task_post_feeds`, see
+    `feeds_core.run_feed_jobs`. The fetch and parse are shared with the
+    other guilds following the feed through `fetches`.
+    #autodoc skip#
+    """
+    async with db_helper.guild_locale_context(guild.id):
+        UUID = feed["uuid"]
+        FEED_NAME = feed["feed_name"]
+        CHANNEL = feed["channel"]
+        channel_obj = guild.get_channel(int(CHANNEL))
+        logger.debug(f"Found channel `{channel_obj.name}` in `{FEED_NAME}`")
+        fetched = []
+        FEED_POSTS = await feeds_core.get_feed_links(
+            feed_type="rss",
+            feed_info=feed,
+            guild_id=guild.id,
+            fetches=fetches,
+            fetched=fetched,
+        )
+        if FEED_POSTS is None or isinstance(FEED_POSTS, int):
+            logger.info(f"Feed {FEED_NAME} returned {FEED_POSTS}")
+            await db_helper.update_fields(
+                template_info=envs.rss_db_schema,
+                where=("uuid", UUID),
+                updates=("status_url", envs.FEEDS_URL_ERROR),
+                guild_id=guild.id,
+            )
+            await discord_commands.log_to_bot_channel(
+                guild,
+                I18N.t(
+                    "rss.tasks.feed_posts_is_none",
+                    feed_name=FEED_NAME,
+                    return_value=str(FEED_POSTS),
+                ),
+            )
+        else:
+            logger.debug(
+                "Got {} items for `FEED_POSTS`: {}".format(
+                    len(FEED_POSTS),
+                    ", ".join([pod_ep["title"] for pod_ep in FEED_POSTS]),
+                )
+            )
+            await feeds_core.process_links_for_posting_or_editing(
+                feed_name=FEED_NAME,
+                feed_type="rss",
+                uuid=UUID,
+                FEED_POSTS=FEED_POSTS,
+                CHANNEL=CHANNEL,
+                guild=guild,
+            )
+            await feeds_core.save_feed_fetches(fetched, guild.id)
+
+
 async def ensure_guild_rss_tables(guild):
     """
     Prep this guild's RSS/podcast tables, and fix up any legacy
@@ -1261,6 +1307,9 @@ async def ensure_guild_rss_tables(guild):
     )
     await db_helper.prep_table(table_in=envs.rss_db_ratings_schema, guild_id=guild.id)
     await db_helper.prep_table(table_in=envs.rss_db_log_schema, guild_id=guild.id)
+    await db_helper.prep_table(
+        table_in=envs.rss_db_http_cache_schema, guild_id=guild.id
+    )
 
     await db_helper.add_missing_db_setup(
         envs.rss_db_schema, missing_tbl_cols, guild_id=guild.id
@@ -1288,14 +1337,8 @@ async def ensure_guild_rss_tables(guild):
             "Missing columns in rss db: {}\n"
             "Make sure to populate missing information".format(missing_tbl_cols_text),
         )
-    # Change channel name to id
-    await db_helper.db_channel_names_to_ids(
-        template_info=envs.rss_db_schema, id_col="uuid", channel_col="channel",
-        guild=guild,
-    )
-    await db_helper.db_update_to_correct_feed_types(
-        template_info=envs.rss_db_schema, guild_id=guild.id
-    )
+    # Channel names to ids, old feed types
+    await db_migrations.migrate(envs.rss_db_schema, guild)
 
 
 async def setup(bot):
@@ -1303,16 +1346,32 @@ async def setup(bot):
     logger.info(envs.COG_STARTING.format(cog_name))
     logger.debug("Checking db")
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await ensure_guild_rss_tables(guild)
         await db_helper.ensure_guild_tasks_rows(guild.id)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                cog_name,
+                guild,
+                prep,
+                migrated=[envs.rss_db_schema],
+                tables=[
+                    envs.rss_db_schema,
+                    envs.rss_db_filter_schema,
+                    envs.rss_db_settings_schema,
+                    envs.rss_db_ratings_schema,
+                    envs.rss_db_log_schema,
+                    envs.rss_db_http_cache_schema,
+                    envs.tasks_db_schema,
+                ],
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     logger.debug("Registering cog to bot")
     await bot.add_cog(RSSfeed(bot))
     logger.info(envs.COG_STARTED.format(cog_name))
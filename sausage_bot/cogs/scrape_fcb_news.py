@@ -6,11 +6,12 @@ https://www.fcbarcelona.com and post them to specific team channels
 """
 
 from bs4 import BeautifulSoup
-import requests
+import aiohttp
+import asyncio
 from discord.ext import commands, tasks
 import discord
 from sausage_bot.util import config, envs, feeds_core, db_helper
-from sausage_bot.util import discord_commands
+from sausage_bot.util import db_migrations, discord_commands, http_client
 from sausage_bot.util.i18n import I18N
 
 logger = config.logger
@@ -75,13 +76,14 @@ class scrape_and_post(commands.Cog):
         Post news from https://www.fcbarcelona.com to specific team channels
         """
 
-        def scrape_fcb_page(url):
+        async def scrape_fcb_page(url):
             "Scrape https://www.fcbarcelona.com"
-            scrape = requests.get(url)
-            soup = BeautifulSoup(scrape.content, features="html5lib")
+            async with http_client.client.session().get(url) as scrape:
+                content = await scrape.read()
+            soup = BeautifulSoup(content, features="html5lib")
             return soup
 
-        def barca_news_links():
+        async def barca_news_links():
             "Find links for specific team news and return it as a dict"
             root_url = "https://www.fcbarcelona.com/en/football/"
             wanted_links = {
@@ -99,13 +101,17 @@ class scrape_and_post(commands.Cog):
             for team in wanted_links:
                 for wanted_link in wanted_links[team]:
                     try:
-                        main_dev = scrape_fcb_page(wanted_link).find(
+                        main_dev = (await scrape_fcb_page(wanted_link)).find(
                             "div", attrs={"class": "widget__content-wrapper"}
                         )
                         news_dev = main_dev.find_all(
                             "div", attrs={"class": "feed__items"}
                         )
-                    except AttributeError as e:
+                    except (
+                        AttributeError,
+                        aiohttp.ClientError,
+                        asyncio.TimeoutError,
+                    ) as e:
                         logger.error(f"Error when fetching articles: {e}")
                         return None
                     max_items = 2
@@ -125,32 +131,20 @@ class scrape_and_post(commands.Cog):
             return links
 
         feed = "FCB news"
-        FEED_POSTS = barca_news_links()
+        FEED_POSTS = await barca_news_links()
         if FEED_POSTS is None:
             return
         if len(FEED_POSTS) < 1:
             logger.info(f"{feed}: this feed is empty")
             return
         logger.info(f"{feed}: `FEED_POSTS` are good:\n### {FEED_POSTS} ###")
-        approved_guilds = await db_helper.get_output(
-            envs.guilds_db_schema, where=("status", "approved")
+        started_guilds = await db_helper.task_statuses.started_guilds(
+            "barca_news", "post_news"
         )
-        for guild_row in approved_guilds:
+        for guild_row in started_guilds:
             guild = config.bot.get_guild(int(guild_row["guild_id"]))
             if guild is None:
                 continue
-            task_status = await db_helper.get_output(
-                template_info=envs.tasks_db_schema,
-                where=[("cog", "barca_news"), ("task", "post_news")],
-                select=("status"),
-                single=True,
-                guild_id=guild.id,
-            )
-            if task_status.get("status") != "started":
-                logger.debug(
-                    f"`post_news` is not enabled for `{guild.name}`, skipping"
-                )
-                continue
             guild_channels = discord_commands.get_text_channel_list(guild)
             for team in FEED_POSTS:
                 channel_name = team_channel_defaults[team.upper()]
@@ -186,15 +180,19 @@ class scrape_and_post(commands.Cog):
 async def setup(bot):
     logger.info(envs.COG_STARTING.format("barca_news"))
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await db_helper.ensure_guild_tasks_rows(guild.id)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                "barca_news", guild, prep, tables=[envs.tasks_db_schema]
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     await bot.add_cog(scrape_and_post(bot))
     logger.info(envs.COG_STARTED.format("barca_news"))
 
@@ -17,7 +17,7 @@ from pprint import pformat
 import asyncio
 
 from sausage_bot.util import envs, datetime_handling, file_io, config
-from sausage_bot.util import discord_commands, db_helper
+from sausage_bot.util import discord_commands, db_helper, db_migrations
 from sausage_bot.util.i18n import I18N
 
 logger = config.logger
@@ -854,31 +854,22 @@ class Stats(commands.Cog):
     @tasks.loop(minutes=config.STATS_LOOP, reconnect=True)
     async def task_update_stats():
         """
-        Shared, always-running loop (like rss/youtube). Every tick, checks
-        each approved guild's own `tasks_db_schema` row (cog="stats",
-        task="post_stats") and updates that guild's stats post if enabled.
+        Shared, always-running loop (like rss/youtube). Every tick, updates
+        the stats post of each approved guild where `tasks_db_schema` has
+        cog="stats", task="post_stats" started.
         """
-        approved_guilds = await db_helper.get_output(
-            envs.guilds_db_schema, where=("status", "approved")
+        started_guilds = await db_helper.task_statuses.started_guilds(
+            "stats", "post_stats"
         )
         # Stats about this bot's own codebase are guild-independent
         _codebase = get_stats_codebase()
         lines_in_codebase = _codebase["total_lines"]
         files_in_codebase = _codebase["total_files"]
 
-        for guild_row in approved_guilds:
+        for guild_row in started_guilds:
             guild = config.bot.get_guild(int(guild_row["guild_id"]))
             if guild is None:
                 continue
-            task_status = await db_helper.get_output(
-                template_info=envs.tasks_db_schema,
-                where=[("cog", "stats"), ("task", "post_stats")],
-                select=("status"),
-                single=True,
-                guild_id=guild.id,
-            )
-            if task_status.get("status") != "started":
-                continue
             async with db_helper.guild_locale_context(guild.id):
                 try:
                     await update_guild_stats(
@@ -915,13 +906,7 @@ async def ensure_guild_stats_tables(guild):
     await db_helper.add_missing_db_setup(
         envs.stats_db_settings_schema, guild_id=guild.id
     )
-    await db_helper.db_fix_old_hide_roles_status(guild_id=guild.id)
-    await db_helper.db_fix_old_stats_msg_name_status(guild_id=guild.id)
-    await db_helper.db_fix_old_value_check_or_help(guild_id=guild.id)
-    await db_helper.db_replace_numeral_bool_with_bool(
-        envs.stats_db_settings_schema, guild_id=guild.id
-    )
-    await db_helper.db_remove_old_cols(envs.stats_db_settings_schema, guild_id=guild.id)
+    await db_migrations.migrate(envs.stats_db_settings_schema, guild)
 
 
 async def setup(bot):
@@ -929,16 +914,29 @@ async def setup(bot):
     logger.info(envs.COG_STARTING.format(cog_name))
     logger.debug("Checking db")
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await ensure_guild_stats_tables(guild)
         await db_helper.ensure_guild_tasks_rows(guild.id)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                cog_name,
+                guild,
+                prep,
+                migrated=[envs.stats_db_settings_schema],
+                tables=[
+                    envs.stats_db_settings_schema,
+                    envs.stats_db_hide_roles_schema,
+                    envs.stats_db_log_schema,
+                    envs.tasks_db_schema,
+                ],
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     logger.debug("Registering cog to bot")
     await bot.add_cog(Stats(bot))
     logger.info(envs.COG_STARTED.format(cog_name))
@@ -8,11 +8,12 @@ from discord.app_commands import locale_str, describe
 from discord.utils import get
 
 import typing
+import functools
 from time import sleep
 from yt_dlp import YoutubeDL
 
 from sausage_bot.util import config, envs, feeds_core
-from sausage_bot.util import db_helper, discord_commands
+from sausage_bot.util import db_helper, db_migrations, discord_commands
 from sausage_bot.util.i18n import I18N
 
 logger = config.logger
@@ -25,6 +26,7 @@ logger = config.logger
 LIST_TYPE_NORMAL = I18N.t("youtube.commands.list.literal_list_type.normal")
 LIST_TYPE_ADDED = I18N.t("youtube.commands.list.literal_list_type.added")
 LIST_TYPE_FILTER = I18N.t("youtube.commands.list.literal_list_type.filter")
+LIST_TYPE_CACHE = I18N.t("youtube.commands.list.literal_list_type.cache")
 LINK_TYPE_CHANNEL = I18N.t("youtube.commands.list.literal_link_type.channel")
 LINK_TYPE_PLAYLIST = I18N.t("youtube.commands.list.literal_link_type.playlist")
 
@@ -401,6 +403,7 @@ class Youtube(commands.Cog):
             LIST_TYPE_NORMAL,
             LIST_TYPE_ADDED,
             LIST_TYPE_FILTER,
+            LIST_TYPE_CACHE,
         ],
         link_type: typing.Literal[
             LINK_TYPE_CHANNEL,
@@ -434,6 +437,14 @@ class Youtube(commands.Cog):
                 list_type="filter",
                 link_type=link_type_in,
             )
+        elif list_type == LIST_TYPE_CACHE:
+            formatted_list = await feeds_core.get_feed_list(
+                guild=interaction.guild,
+                db_in=envs.youtube_db_schema,
+                db_cache_in=envs.youtube_db_http_cache_schema,
+                list_type="cache",
+                link_type=link_type_in,
+            )
         else:
             formatted_list = await feeds_core.get_feed_list(
                 guild=interaction.guild,
@@ -473,26 +484,16 @@ class Youtube(commands.Cog):
     @tasks.loop(minutes=config.YT_LOOP, reconnect=True)
     async def task_post_videos():
         logger.info("Starting `post_videos`")
-        approved_guilds = await db_helper.get_output(
-            envs.guilds_db_schema, where=("status", "approved")
+        started_guilds = await db_helper.task_statuses.started_guilds(
+            "youtube", "post_videos"
         )
-        for guild_row in approved_guilds:
+        jobs = []
+        fetches = feeds_core.FeedFetches()
+        for guild_row in started_guilds:
             guild = config.bot.get_guild(int(guild_row["guild_id"]))
             if guild is None:
                 logger.debug(f"Guild `{guild_row['guild_id']}` not in cache, skipping")
                 continue
-            task_status = await db_helper.get_output(
-                template_info=envs.tasks_db_schema,
-                where=[("cog", "youtube"), ("task", "post_videos")],
-                select=("status"),
-                single=True,
-                guild_id=guild.id,
-            )
-            if task_status.get("status") != "started":
-                logger.debug(
-                    f"`post_videos` is not enabled for `{guild.name}`, skipping"
-                )
-                continue
             async with db_helper.guild_locale_context(guild.id):
                 # Start processing feeds
                 feeds = await db_helper.get_output(
@@ -512,42 +513,27 @@ class Youtube(commands.Cog):
                     logger.debug("- {}".format(feed["feed_name"]))
                 # Start processing per feed settings
                 for feed in feeds:
-                    UUID = feed["uuid"]
-                    FEED_NAME = feed["feed_name"]
-                    CHANNEL = feed["channel"]
-                    logger.info(f"Checking {FEED_NAME}")
-                    logger.debug(f"Found channel `{CHANNEL}` in `{FEED_NAME}`")
-                    FEED_POSTS = await feeds_core.get_feed_links(
-                        feed_type="youtube", feed_info=feed, guild_id=guild.id
-                    )
-                    if FEED_POSTS is None or isinstance(FEED_POSTS, int):
-                        logger.info(f"Feed {FEED_NAME} returned {FEED_POSTS}")
-                        await db_helper.update_fields(
-                            template_info=envs.youtube_db_schema,
-                            where=("uuid", UUID),
-                            updates=("status_url", envs.FEEDS_URL_ERROR),
-                            guild_id=guild.id,
-                        )
-                        await discord_commands.log_to_bot_channel(
-                            guild,
-                            I18N.t(
-                                "youtube.tasks.log_error",
-                                feed_name=FEED_NAME,
-                                return_value=str(FEED_POSTS),
-                            ),
-                        )
+                    if feed["playlist_id"] is not None:
+                        url = envs.YOUTUBE_PLAYLIST_RSS_LINK.format(feed["playlist_id"])
                     else:
-                        logger.debug(
-                            "Got {} items for `FEED_POSTS`: {}".format(
-                                len(FEED_POSTS),
-                                ", ".join(
-                                    [pod_ep["title"] for pod_ep in FEED_POSTS[0:3]]
-                                ),
-                            )
-                        )
-                        await feeds_core.process_links_for_posting_or_editing(
-                            FEED_NAME, "youtube", UUID, FEED_POSTS, CHANNEL, guild
+                        url = envs.YOUTUBE_RSS_LINK.format(feed["youtube_id"])
+                    jobs.append(
+                        (
+                            feed["channel"],
+                            url,
+                            functools.partial(
+                                post_youtube_feed, guild, feed, fetches
+                            ),
                         )
+                    )
+        # Fetch and post the feeds of all the guilds at the same time
+        await feeds_core.run_feed_jobs(jobs)
+        logger.info(
+            f"Fetched {fetches.fetched} feeds for {len(jobs)} subscriptions "
+            f"({fetches.shared} shared)"
+        )
+        # Write the links logged during this run in one go
+        await db_helper.flush_buffered_inserts()
         logger.info("Done with posting")
         return
 
@@ -558,6 +544,59 @@ class Youtube(commands.Cog):
         await config.bot.wait_until_ready()
 
 
+async def post_youtube_feed(guild, feed, fetches=None):
+    """
+    Fetch the Youtube feed `feed` and post the new videos in it to its
+    channel in `guild`. Run by `Youtube.task_post_videos`, see
+    `feeds_core.run_feed_jobs`. The fetch and parse are shared with the
+    other guilds following the channel or playlist through `fetches`.
+    #autodoc skip#
+    """
+    async with db_helper.guild_locale_context(guild.id):
+        UUID = feed["uuid"]
+        FEED_NAME = feed["feed_name"]
+        CHANNEL = feed["channel"]
+        logger.info(f"Checking {FEED_NAME}")
+        logger.debug(f"Found channel `{CHANNEL}` in `{FEED_NAME}`")
+        fetched = []
+        FEED_POSTS = await feeds_core.get_feed_links(
+            feed_type="youtube",
+            feed_info=feed,
+            guild_id=guild.id,
+            fetches=fetches,
+            fetched=fetched,
+        )
+        if FEED_POSTS is None or isinstance(FEED_POSTS, int):
+            logger.info(f"Feed {FEED_NAME} returned {FEED_POSTS}")
+            await db_helper.update_fields(
+                template_info=envs.youtube_db_schema,
+                where=("uuid", UUID),
+                updates=("status_url", envs.FEEDS_URL_ERROR),
+                guild_id=guild.id,
+            )
+            await discord_commands.log_to_bot_channel(
+                guild,
+                I18N.t(
+                    "youtube.tasks.log_error",
+                    feed_name=FEED_NAME,
+                    return_value=str(FEED_POSTS),
+                ),
+            )
+        else:
+            logger.debug(
+                "Got {} items for `FEED_POSTS`: {}".format(
+                    len(FEED_POSTS),
+                    ", ".join(
+                        [pod_ep["title"] for pod_ep in FEED_POSTS[0:3]]
+                    ),
+                )
+            )
+            await feeds_core.process_links_for_posting_or_editing(
+                FEED_NAME, "youtube", UUID, FEED_POSTS, CHANNEL, guild
+            )
+            await feeds_core.save_feed_fetches(fetched, guild.id)
+
+
 async def ensure_guild_youtube_tables(guild):
     """
     Prep this guild's Youtube tables, and fix up any legacy channel-name
@@ -569,6 +608,9 @@ async def ensure_guild_youtube_tables(guild):
         table_in=envs.youtube_db_filter_schema, guild_id=guild.id
     )
     await db_helper.prep_table(table_in=envs.youtube_db_log_schema, guild_id=guild.id)
+    await db_helper.prep_table(
+        table_in=envs.youtube_db_http_cache_schema, guild_id=guild.id
+    )
     missing_tbl_cols = {}
     missing_tbl_cols = await db_helper.add_missing_db_setup(
         envs.youtube_db_schema, missing_tbl_cols, guild_id=guild.id
@@ -596,12 +638,7 @@ async def ensure_guild_youtube_tables(guild):
             "Make sure to populate missing information".format(missing_tbl_cols_text),
         )
     # Change channel name to id
-    await db_helper.db_channel_names_to_ids(
-        template_info=envs.youtube_db_schema,
-        id_col="uuid",
-        channel_col="channel",
-        guild=guild,
-    )
+    await db_migrations.migrate(envs.youtube_db_schema, guild)
 
 
 async def setup(bot):
@@ -609,16 +646,30 @@ async def setup(bot):
     logger.info(envs.COG_STARTING.format(cog_name))
     logger.debug("Checking db")
 
-    approved_guilds = await db_helper.get_output(
-        envs.guilds_db_schema, where=("status", "approved")
-    )
-    for guild_row in approved_guilds:
-        guild = config.bot.get_guild(int(guild_row["guild_id"]))
-        if guild is None:
-            continue
+    async def prep(guild):
         await ensure_guild_youtube_tables(guild)
         await db_helper.ensure_guild_tasks_rows(guild.id)
 
+    async def bootstrap(guild_row):
+        guild = config.bot.get_guild(int(guild_row["guild_id"]))
+        if guild is not None:
+            await db_migrations.bootstrap_guild(
+                cog_name,
+                guild,
+                prep,
+                migrated=[envs.youtube_db_schema],
+                tables=[
+                    envs.youtube_db_schema,
+                    envs.youtube_db_filter_schema,
+                    envs.youtube_db_log_schema,
+                    envs.youtube_db_http_cache_schema,
+                    envs.tasks_db_schema,
+                ],
+            )
+
+    approved_guilds = await db_helper.guild_registry.approved()
+    await db_helper.for_each_guild(approved_guilds, bootstrap)
+
     logger.debug("Registering cog to bot")
     await bot.add_cog(Youtube(bot))
     logger.info(envs.COG_STARTED.format(cog_name))
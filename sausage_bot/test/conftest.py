@@ -3,9 +3,11 @@
 """
 Shared pytest fixtures for the multi-guild test suite.
 """
+import logging
+
 import pytest
 
-from sausage_bot.util import envs
+from sausage_bot.util import envs, db_helper
 
 
 @pytest.fixture
@@ -17,9 +19,37 @@ def guild_db_root(tmp_path, monkeypatch):
     real bot data. The guild registry is the only globally-scoped schema
     (it resolves its `db_file` once at import time), so it needs
     patching separately from `envs.DB_DIR`. `tasks_db_schema` is
-    guild-scoped like everything else and rebases automatically once
-    `envs.DB_DIR` is patched.
+    guild-scoped like everything else and rebases once `envs.DB_DIR` is
+    patched and the resolved paths are forgotten.
     """
     monkeypatch.setattr(envs, "DB_DIR", tmp_path)
     monkeypatch.setitem(envs.guilds_db_schema, "db_file", str(tmp_path / "guilds.sqlite"))
-    return tmp_path
+    envs.forget_db_files()
+    db_helper.forget_known_tables()
+    yield tmp_path
+    envs.forget_db_files()
+    db_helper.forget_known_tables()
+
+
+@pytest.fixture(autouse=True)
+def slow_query_log(tmp_path, monkeypatch):
+    """
+    `logger.configure_logging` sends `db_stats`' slow query log to its
+    own file in `envs.LOG_DIR`. Send it to `tmp_path` instead, so the
+    tests never write to the real log.
+    """
+    handler = logging.FileHandler(tmp_path / "slow_queries.log", delay=True)
+    monkeypatch.setattr(logging.getLogger("slow_queries"), "handlers", [handler])
+    yield tmp_path / "slow_queries.log"
+    handler.close()
+
+
+@pytest.fixture(autouse=True)
+async def close_db_connections():
+    """
+    `db_helper` keeps its connections open between calls, and each one
+    runs in its own (non-daemon) thread. Close them after every test, so
+    the next test's `tmp_path` starts clean and pytest can exit.
+    """
+    yield
+    await db_helper.close_connections()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_backup`, which copies every database with sqlite's online
+backup API and packs the copies in one compressed archive.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import sqlite3
+import tarfile
+from contextlib import closing
+
+import pytest
+
+from sausage_bot.util import envs, db_helper, db_backup
+
+GUILD_A = 121212121212121212
+GUILD_B = 343434343434343434
+
+
+async def test_backup_has_every_database(guild_db_root, monkeypatch):
+    monkeypatch.setattr(db_backup.config, "DB_BACKUP_KEEP", 7)
+    await db_helper.prep_table(envs.guilds_db_schema)
+    for guild_id in (GUILD_A, GUILD_B):
+        await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=guild_id)
+        await db_helper.insert_many_all(
+            envs.dilemmas_db_schema, [(f"id-{guild_id}", "text")], guild_id=guild_id
+        )
+    await db_helper.prep_table(envs.dilemmas_db_log_schema, guild_id=GUILD_A)
+    # Still in the write buffer, but has to be in the backup
+    db_helper.write_buffer.add(
+        envs.dilemmas_db_log_schema, [("id", "msg")], guild_id=GUILD_A
+    )
+
+    report = await db_backup.backup_all(guild_db_root / "backups")
+
+    assert set(report["guilds"]) == {"global", f"guild_{GUILD_A}", f"guild_{GUILD_B}"}
+    assert report["guilds"][f"guild_{GUILD_A}"]["files"] == 1
+    assert report["bytes"] == report["archive"].stat().st_size
+    extract_dir = guild_db_root / "restored"
+    with tarfile.open(report["archive"]) as tar:
+        assert sorted(tar.getnames()) == [
+            f"guild_{GUILD_A}/dilemmas.sqlite",
+            f"guild_{GUILD_B}/dilemmas.sqlite",
+            "guilds.sqlite",
+        ]
+        tar.extractall(extract_dir, filter="data")
+    restored = sqlite3.connect(extract_dir / f"guild_{GUILD_A}" / "dilemmas.sqlite")
+    assert restored.execute("SELECT id FROM dilemmas").fetchall() == [
+        (f"id-{GUILD_A}",)
+    ]
+    assert restored.execute("SELECT * FROM log").fetchall() == [("id", "msg")]
+    restored.close()
+    # The snapshots are only kept in the archive
+    assert list((guild_db_root / "backups").iterdir()) == [report["archive"]]
+
+
+def test_only_the_newest_backups_are_kept(tmp_path):
+    for stamp in ("20260101-000000", "20260102-000000", "20260103-000000"):
+        (tmp_path / f"db_backup_{stamp}.tar.gz").write_bytes(b"")
+
+    deleted = db_backup.prune_backups(tmp_path, keep=2)
+
+    assert [archive.name for archive in deleted] == ["db_backup_20260101-000000.tar.gz"]
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def _make_db(path, rows=200):
+    with closing(sqlite3.connect(path)) as db:
+        db.execute("CREATE TABLE t (value TEXT)")
+        db.executemany("INSERT INTO t VALUES (?)", [("x" * 500,)] * rows)
+        db.commit()
+
+
+def test_backup_pauses_between_steps(tmp_path, monkeypatch):
+    _make_db(tmp_path / "src.sqlite")
+    monkeypatch.setattr(db_backup, "BACKUP_PAGES", 5)
+    sleeps = []
+    monkeypatch.setattr(db_backup.time, "sleep", sleeps.append)
+
+    size = db_backup._backup_file(
+        str(tmp_path / "src.sqlite"), str(tmp_path / "copy.sqlite")
+    )
+
+    assert size == (tmp_path / "src.sqlite").stat().st_size
+    assert len(sleeps) > 1
+    assert set(sleeps) == {db_backup.BACKUP_SLEEP}
+
+
+def test_backup_of_a_file_that_keeps_changing_gives_up(tmp_path, monkeypatch):
+    _make_db(tmp_path / "src.sqlite")
+    monkeypatch.setattr(db_backup, "BACKUP_PAGES", 5)
+    monkeypatch.setattr(db_backup, "BACKUP_MAX_RESTARTS", 2)
+    writer = sqlite3.connect(tmp_path / "src.sqlite")
+
+    def write_instead(seconds):
+        # A write from another connection starts the copy over
+        writer.execute("INSERT INTO t VALUES ('y')")
+        writer.commit()
+
+    monkeypatch.setattr(db_backup.time, "sleep", write_instead)
+
+    with closing(writer), pytest.raises(sqlite3.OperationalError):
+        db_backup._backup_file(
+            str(tmp_path / "src.sqlite"), str(tmp_path / "copy.sqlite")
+        )
+    assert not (tmp_path / "copy.sqlite").exists()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises the secondary indexes declared with `indexes` in the `envs`
+schemas, which `db_helper.prep_table` creates.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper
+
+GUILD = 444444444444444444
+
+
+async def _indexes(template_info):
+    db_file = envs.resolve_db_file(template_info, guild_id=GUILD)
+    async with db_helper.connect(db_file) as db:
+        out = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+            (template_info["name"],),
+        )
+        return [row[0] for row in await out.fetchall()]
+
+
+async def test_prep_table_creates_the_indexes(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_ratings_schema, guild_id=GUILD)
+    # Running it again is fine
+    await db_helper.prep_table(envs.rss_db_ratings_schema, guild_id=GUILD)
+
+    assert await _indexes(envs.rss_db_ratings_schema) == [
+        "ratings_show_uuid_episode_uuid_user_id_idx"
+    ]
+
+
+async def test_log_lookups_use_the_index(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    db_file = envs.resolve_db_file(envs.rss_db_log_schema, guild_id=GUILD)
+    async with db_helper.connect(db_file) as db:
+        out = await db.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM log WHERE uuid = ?", ("a",)
+        )
+        plan = " ".join(row[-1] for row in await out.fetchall())
+
+    assert "USING INDEX log_uuid_idx" in plan
+
+
+async def test_index_on_a_missing_column_waits_for_the_column(guild_db_root):
+    db_file = envs.resolve_db_file(envs.quote_img_db_schema, guild_id=GUILD)
+    await db_helper.prep_table(envs.quote_db_schema, guild_id=GUILD)
+    # A database from before `comment_id` existed
+    async with db_helper.connect(db_file) as db:
+        await db.execute("CREATE TABLE quote_img (img_no INT, base64 TEXT)")
+    await db_helper.prep_table(envs.quote_img_db_schema, guild_id=GUILD)
+    assert await _indexes(envs.quote_img_db_schema) == []
+
+    await db_helper.add_missing_db_setup(envs.quote_img_db_schema, guild_id=GUILD)
+
+    assert await _indexes(envs.quote_img_db_schema) == ["quote_img_comment_id_idx"]
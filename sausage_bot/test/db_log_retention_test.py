@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises the log retention in `db_helper`: `prune_log`, which drops the
+log rows the retention rules no longer keep, and `compact_guild_logs`,
+which the maintenance task runs for every guild.
+
+All database tests use the `guild_db_root` fixture (see conftest.py), so
+nothing here touches real bot data.
+"""
+from pathlib import Path
+
+import aiosqlite
+
+from sausage_bot.util import envs, db_helper
+
+GUILD = 444444444444444444
+OLD = "2001-01-01 12:00:00.000"
+NEW = "2999-01-01 12:00:00.000"
+
+
+async def _seed(rows):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    await db_helper.insert_many_all(envs.rss_db_log_schema, rows, guild_id=GUILD)
+
+
+async def _urls(uuid):
+    return [
+        row["url"]
+        for row in await db_helper.get_output(
+            envs.rss_db_log_schema, where=("uuid", uuid), guild_id=GUILD
+        )
+    ]
+
+
+async def test_keeps_the_last_rows_per_feed(guild_db_root):
+    await _seed(
+        [("feed-a", f"a{i}", OLD, f"ha{i}") for i in range(5)]
+        + [("feed-b", "b0", OLD, "hb0")]
+    )
+
+    deleted = await db_helper.prune_log(
+        envs.rss_db_log_schema, keep_rows=2, keep_days=0, guild_id=GUILD
+    )
+
+    assert deleted == 3
+    assert await _urls("feed-a") == ["a3", "a4"]
+    assert await _urls("feed-b") == ["b0"]
+
+
+async def test_new_rows_are_kept_past_the_row_limit(guild_db_root):
+    await _seed(
+        [
+            ("feed-a", "a0", OLD, "h0"),
+            ("feed-a", "a1", NEW, "h1"),
+            ("feed-a", "a2", OLD, "h2"),
+            ("feed-a", "a3", OLD, "h3"),
+        ]
+    )
+
+    deleted = await db_helper.prune_log(
+        envs.rss_db_log_schema, keep_rows=1, keep_days=30, guild_id=GUILD
+    )
+
+    assert deleted == 2
+    assert await _urls("feed-a") == ["a1", "a3"]
+    assert (
+        await db_helper.prune_log(
+            envs.rss_db_log_schema, keep_rows=0, keep_days=0, guild_id=GUILD
+        )
+        == 0
+    )
+
+
+async def test_compact_reports_rows_and_bytes(guild_db_root, monkeypatch):
+    monkeypatch.setattr(db_helper.config, "LOG_RETENTION_ROWS", 10)
+    monkeypatch.setattr(db_helper.config, "LOG_RETENTION_DAYS", 0)
+    await _seed([("feed-a", "x" * 500, OLD, f"h{i}") for i in range(2000)])
+
+    reclaimed = await db_helper.compact_guild_logs(GUILD)
+
+    assert reclaimed["rows"] == 1990
+    assert reclaimed["bytes"] > 0
+    db_file = envs.resolve_db_file(envs.rss_db_log_schema, GUILD)
+    async with aiosqlite.connect(db_file) as db:
+        auto_vacuum = await (await db.execute("PRAGMA auto_vacuum")).fetchone()
+    assert auto_vacuum[0] == 2
+    # The other log files were never made, and still aren't
+    youtube_log = envs.resolve_db_file(envs.youtube_db_log_schema, GUILD)
+    assert not Path(youtube_log).exists()
+
+
+async def test_default_retention_keeps_everything(guild_db_root):
+    await _seed([("feed-a", f"a{i}", OLD, f"h{i}") for i in range(5)])
+
+    reclaimed = await db_helper.compact_guild_logs(GUILD)
+
+    assert reclaimed["rows"] == 0
+    assert len(await _urls("feed-a")) == 5
+    assert envs.quote_db_log_schema not in envs.retention_db_schemas
+
+
+async def test_quiet_feed_keeps_its_last_rows(guild_db_root, monkeypatch):
+    monkeypatch.setattr(db_helper.config, "LOG_RETENTION_MIN_ROWS", 3)
+    await _seed(
+        [("feed-a", f"a{i}", OLD, f"ha{i}") for i in range(5)]
+        + [("feed-b", "b0", OLD, "hb0")]
+    )
+
+    deleted = await db_helper.prune_log(
+        envs.rss_db_log_schema, keep_rows=0, keep_days=30, guild_id=GUILD
+    )
+
+    assert deleted == 2
+    assert await _urls("feed-a") == ["a2", "a3", "a4"]
+    assert await _urls("feed-b") == ["b0"]
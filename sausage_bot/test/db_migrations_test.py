@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_migrations`, which runs the fixups for old guild databases
+once per database and keeps count in its `PRAGMA user_version`.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from types import SimpleNamespace
+
+import aiosqlite
+
+from sausage_bot.util import envs, db_helper, db_migrations
+
+GUILD = SimpleNamespace(id=666666666666666666)
+
+
+async def test_fixups_run_once_in_order(guild_db_root, monkeypatch):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD.id)
+    ran = []
+
+    async def first(guild):
+        ran.append(("first", guild.id))
+
+    async def second(guild):
+        ran.append(("second", guild.id))
+
+    monkeypatch.setitem(db_migrations.migrations, "dilemmas.sqlite", [first])
+    assert await db_migrations.migrate(envs.dilemmas_db_schema, GUILD) == 1
+    assert await db_migrations.migrate(envs.dilemmas_db_schema, GUILD) == 0
+
+    # A fixup added later is the only one run on an up to date database
+    db_migrations.migrations["dilemmas.sqlite"].append(second)
+    assert not await db_migrations.is_current(envs.dilemmas_db_schema, GUILD.id)
+    assert await db_migrations.migrate(envs.dilemmas_db_schema, GUILD) == 1
+
+    assert ran == [("first", GUILD.id), ("second", GUILD.id)]
+    assert await db_migrations.get_version(envs.dilemmas_db_schema, GUILD.id) == 2
+    assert await db_migrations.is_current(envs.dilemmas_db_schema, GUILD.id)
+
+
+async def test_failed_fixup_is_tried_again(guild_db_root, monkeypatch):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD.id)
+    attempts = []
+
+    async def ok(guild):
+        pass
+
+    async def flaky(guild):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise aiosqlite.OperationalError("database is locked")
+
+    monkeypatch.setitem(db_migrations.migrations, "dilemmas.sqlite", [ok, flaky])
+    assert await db_migrations.migrate(envs.dilemmas_db_schema, GUILD) == 1
+    assert await db_migrations.get_version(envs.dilemmas_db_schema, GUILD.id) == 1
+
+    assert await db_migrations.migrate(envs.dilemmas_db_schema, GUILD) == 1
+    assert len(attempts) == 2
+    assert await db_migrations.is_current(envs.dilemmas_db_schema, GUILD.id)
+
+
+async def test_fixup_whose_helper_swallows_the_error_is_not_recorded(
+    guild_db_root, monkeypatch
+):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD.id)
+
+    async def half_done(guild):
+        await db_helper.insert_many_all(
+            envs.dilemmas_db_schema, [("d1", "text")], guild_id=guild.id
+        )
+        # Logs the missing column and returns, like the fixups' helpers do
+        await db_helper.update_fields(
+            envs.dilemmas_db_schema,
+            where=("id", "d1"),
+            updates=("no_such_col", "x"),
+            guild_id=guild.id,
+        )
+
+    monkeypatch.setitem(db_migrations.migrations, "dilemmas.sqlite", [half_done])
+    assert await db_migrations.migrate(envs.dilemmas_db_schema, GUILD) == 0
+
+    assert await db_migrations.get_version(envs.dilemmas_db_schema, GUILD.id) == 0
+    # What it did before failing was rolled back
+    assert await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD.id) == []
+
+
+async def test_old_stats_settings_are_fixed(guild_db_root):
+    # A stats database from before `hide_roles` got its own table and
+    # `stats_msg` was renamed
+    await db_helper.prep_table(envs.stats_db_settings_schema, guild_id=GUILD.id)
+    await db_helper.insert_many_all(
+        envs.stats_db_settings_schema,
+        [
+            ("stats_msg", "1234"),
+            ("hide_roles", "111"),
+            ("hide_roles", "222"),
+            ("show_role_stats", "1"),
+        ],
+        guild_id=GUILD.id,
+    )
+
+    ran = await db_migrations.migrate(envs.stats_db_settings_schema, GUILD)
+
+    assert ran == db_migrations.latest_version(envs.stats_db_settings_schema)
+    settings = await db_helper.get_output(
+        envs.stats_db_settings_schema, as_settings_json=True, guild_id=GUILD.id
+    )
+    assert settings == {"stats_msg_id": "1234", "show_role_stats": "True"}
+    hidden = await db_helper.get_output(
+        envs.stats_db_hide_roles_schema, guild_id=GUILD.id
+    )
+    assert hidden == [{"role_id": "111"}, {"role_id": "222"}]
+    assert await db_migrations.migrate(envs.stats_db_settings_schema, GUILD) == 0
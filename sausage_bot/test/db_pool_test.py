@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_helper.ConnectionPool`, which keeps one long-lived
+connection per database file instead of every helper opening (and
+closing) its own.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper
+
+GUILD_A = 111111111111111111
+GUILD_B = 222222222222222222
+
+
+async def test_helpers_reuse_one_connection_per_file(guild_db_root):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    db_file = envs.resolve_db_file(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    first = db_helper.pool._connections[db_file]
+
+    await db_helper.insert_many_all(
+        envs.dilemmas_db_schema, [("a-1", "Pooled")], guild_id=GUILD_A
+    )
+    rows = await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD_A)
+
+    assert rows == [{"id": "a-1", "dilemmas_text": "Pooled"}]
+    assert db_helper.pool._connections[db_file] is first
+
+
+async def test_schemas_sharing_a_file_share_the_connection(guild_db_root):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    await db_helper.prep_table(envs.dilemmas_db_log_schema, guild_id=GUILD_A)
+
+    assert len(db_helper.pool._connections) == 1
+
+
+async def test_least_recently_used_connection_is_evicted(guild_db_root, monkeypatch):
+    monkeypatch.setattr(db_helper.pool, "max_connections", 2)
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    await db_helper.prep_table(envs.poll_db_polls_schema, guild_id=GUILD_A)
+    # Touch the dilemmas db again, so the poll db is the oldest one
+    await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD_B)
+
+    assert list(db_helper.pool._connections) == [
+        envs.resolve_db_file(envs.dilemmas_db_schema, guild_id=GUILD_A),
+        envs.resolve_db_file(envs.dilemmas_db_schema, guild_id=GUILD_B),
+    ]
+
+
+async def test_failed_statement_is_rolled_back(guild_db_root):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    db_file = envs.resolve_db_file(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    try:
+        async with db_helper.connect(db_file) as db:
+            await db.execute("INSERT INTO dilemmas VALUES ('x-1', 'Never kept')")
+            raise RuntimeError("Something went wrong mid-way")
+    except RuntimeError:
+        pass
+
+    assert await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD_A) == []
+
+
+async def test_close_connections_empties_the_pool(guild_db_root):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD_A)
+    await db_helper.close_connections()
+
+    assert len(db_helper.pool._connections) == 0
+    # ...and the next call simply opens a new one
+    assert await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD_A) == []
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises the pragmas `db_helper` applies to every connection it opens,
+as declared per database file in `envs.db_pragmas_default` and
+`envs.db_pragmas`.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper
+
+GUILD = 555555555555555555
+
+
+async def _pragma(db_file, pragma):
+    async with db_helper.connect(db_file) as db:
+        out = await db.execute(f"PRAGMA {pragma}")
+        return (await out.fetchone())[0]
+
+
+def test_file_pragmas_override_the_defaults():
+    pragmas = envs.resolve_db_pragmas("/some/guild_1/quote.sqlite")
+    assert pragmas["journal_mode"] == "WAL"
+    assert pragmas["cache_size"] == envs.db_pragmas["quote.sqlite"]["cache_size"]
+    assert "cache_size" not in envs.resolve_db_pragmas("/some/guild_1/poll.sqlite")
+
+
+async def test_connections_run_in_wal_mode(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    db_file = envs.resolve_db_file(envs.rss_db_log_schema, guild_id=GUILD)
+
+    assert await _pragma(db_file, "journal_mode") == "wal"
+    # NORMAL
+    assert await _pragma(db_file, "synchronous") == 1
+    assert await _pragma(db_file, "busy_timeout") == 5000
+
+
+async def test_per_file_cache_size_is_applied(guild_db_root):
+    await db_helper.prep_table(envs.quote_db_schema, guild_id=GUILD)
+    quote_file = envs.resolve_db_file(envs.quote_db_schema, guild_id=GUILD)
+    await db_helper.prep_table(envs.poll_db_polls_schema, guild_id=GUILD)
+    poll_file = envs.resolve_db_file(envs.poll_db_polls_schema, guild_id=GUILD)
+
+    assert await _pragma(quote_file, "cache_size") == -16000
+    assert await _pragma(poll_file, "cache_size") != -16000
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_query`, which builds the parameterized SQL `db_helper`
+runs, and that the helpers built on it still filter, update and delete
+the same rows - also when the values contain quotes.
+
+All database tests use the `guild_db_root` fixture (see conftest.py), so
+nothing here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper, db_query
+
+GUILD = 333333333333333333
+
+
+def test_query_text_only_depends_on_the_shape():
+    first = db_query.where_filter(where=[("uuid", "a"), ("feed_type", "rss")])
+    second = db_query.where_filter(where=[("uuid", "b"), ("feed_type", "podcast")])
+
+    assert first[0] == second[0] == " WHERE uuid = ? AND feed_type = ?"
+    assert first[1] == ("a", "rss")
+    assert second[1] == ("b", "podcast")
+
+
+def test_where_like_and_not_like_are_combined():
+    sql, params = db_query.where_filter(
+        where=("status", "approved"),
+        like=("url", "nrk"),
+        not_like=[("feed_type", "podcast")],
+    )
+
+    assert sql == " WHERE status = ? AND url LIKE ? AND feed_type NOT LIKE ?"
+    assert params == ("approved", "%nrk%", "%podcast%")
+    assert db_query.where_filter() == ("", ())
+
+
+def test_third_element_joins_with_the_next_condition():
+    sql, _ = db_query.where_filter(where=[("a", 1, "OR"), ("b", 2), ("c", 3)])
+
+    assert sql == " WHERE a = ? OR b = ? AND c = ?"
+
+
+def test_values_are_bound_as_text():
+    sql, params = db_query.set_values([("value", False), ("num", 5)])
+
+    assert sql == "value = ?, num = ?"
+    assert params == ("False", "5")
+
+
+def test_case_updates():
+    sql, params = db_query.set_values(
+        {"channel": [("channel", "general", 1234), ("channel", "news", 5678)]}
+    )
+
+    assert sql == (
+        "channel = CASE WHEN channel = ? THEN ? WHEN channel = ? THEN ?"
+        " ELSE channel END"
+    )
+    assert params == ("general", "1234", "news", "5678")
+
+
+async def test_helpers_handle_quotes_in_values(guild_db_root):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD)
+    await db_helper.insert_many_all(
+        envs.dilemmas_db_schema,
+        [("d-1", "Would you rather 'fly' or \"swim\"?"), ("d-2", "Tea's fine")],
+        guild_id=GUILD,
+    )
+
+    found = await db_helper.get_output(
+        envs.dilemmas_db_schema,
+        where=("dilemmas_text", "Tea's fine"),
+        guild_id=GUILD,
+    )
+    assert found == [{"id": "d-2", "dilemmas_text": "Tea's fine"}]
+
+    await db_helper.update_fields(
+        envs.dilemmas_db_schema,
+        where=("id", "d-2"),
+        updates=("dilemmas_text", "Coffee's better"),
+        guild_id=GUILD,
+    )
+    liked = await db_helper.get_output(
+        envs.dilemmas_db_schema, like=("dilemmas_text", "'s bet"), guild_id=GUILD
+    )
+    assert liked == [{"id": "d-2", "dilemmas_text": "Coffee's better"}]
+
+    await db_helper.del_row_by_AND_filter(
+        envs.dilemmas_db_schema,
+        where=("dilemmas_text", "Would you rather 'fly' or \"swim\"?"),
+        guild_id=GUILD,
+    )
+    assert await db_helper.get_output(
+        envs.dilemmas_db_schema, select="id", guild_id=GUILD
+    ) == [{"id": "d-2"}]
+
+
+async def test_delete_by_rowids(guild_db_root):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD)
+    await db_helper.insert_many_all(
+        envs.dilemmas_db_schema,
+        [("d-1", "One"), ("d-2", "Two"), ("d-3", "Three")],
+        guild_id=GUILD,
+    )
+
+    await db_helper.del_row_ids(envs.dilemmas_db_schema, [1, 3], guild_id=GUILD)
+    await db_helper.del_row_id(envs.dilemmas_db_schema, "2", guild_id=GUILD)
+
+    assert await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD) == []
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_helper.settings_cache`, which keeps what `get_output`
+returns for the `cached` schemas (the settings tables) in memory until
+one of the helpers writes to them.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import sqlite3
+
+import pytest
+
+from sausage_bot.util import envs, db_helper
+
+GUILD_A = 111111111111111111
+GUILD_B = 222222222222222222
+
+
+async def _settings(guild_id):
+    return await db_helper.get_output(
+        envs.settings_db_schema, as_settings_json=True, guild_id=guild_id
+    )
+
+
+async def _prep(guild_id):
+    await db_helper.prep_table(
+        envs.settings_db_schema,
+        inserts=envs.settings_db_schema["inserts"],
+        guild_id=guild_id,
+    )
+
+
+async def test_repeated_reads_come_from_the_cache(guild_db_root):
+    await _prep(GUILD_A)
+    hits = db_helper.settings_cache.hits
+
+    first = await _settings(GUILD_A)
+    second = await _settings(GUILD_A)
+
+    assert first == second
+    assert first["language"] == "en"
+    assert db_helper.settings_cache.hits == hits + 1
+
+
+async def test_changing_the_output_does_not_change_the_cache(guild_db_root):
+    await _prep(GUILD_A)
+    settings = await _settings(GUILD_A)
+    settings["language"] = "changed by the caller"
+
+    assert (await _settings(GUILD_A))["language"] == "en"
+
+
+async def test_writes_invalidate_only_that_guild(guild_db_root):
+    await _prep(GUILD_A)
+    await _prep(GUILD_B)
+    await _settings(GUILD_A)
+    await _settings(GUILD_B)
+
+    await db_helper.update_fields(
+        envs.settings_db_schema,
+        where=("setting", "language"),
+        updates=("value", "nb"),
+        guild_id=GUILD_A,
+    )
+    hits = db_helper.settings_cache.hits
+
+    assert (await _settings(GUILD_A))["language"] == "nb"
+    assert (await _settings(GUILD_B))["language"] == "en"
+    assert db_helper.settings_cache.hits == hits + 1
+
+
+async def test_rolled_back_transaction_leaves_no_stale_cache(guild_db_root):
+    await _prep(GUILD_A)
+    with pytest.raises(RuntimeError):
+        async with db_helper.transaction(envs.settings_db_schema, GUILD_A):
+            await db_helper.update_fields(
+                envs.settings_db_schema,
+                where=("setting", "language"),
+                updates=("value", "nb"),
+                guild_id=GUILD_A,
+            )
+            assert (await _settings(GUILD_A))["language"] == "nb"
+            raise RuntimeError("Something went wrong mid-way")
+
+    assert (await _settings(GUILD_A))["language"] == "en"
+
+
+async def test_failed_reads_are_not_cached(guild_db_root):
+    await _prep(GUILD_A)
+    db_file = envs.resolve_db_file(envs.settings_db_schema, GUILD_A)
+    table_name = envs.settings_db_schema["name"]
+    with sqlite3.connect(db_file) as db:
+        db.execute(f"ALTER TABLE {table_name} RENAME TO moved_away")
+
+    assert await _settings(GUILD_A) == {}
+
+    # Put back behind the helpers' backs, so nothing invalidates the cache
+    with sqlite3.connect(db_file) as db:
+        db.execute(f"ALTER TABLE moved_away RENAME TO {table_name}")
+    assert (await _settings(GUILD_A))["language"] == "en"
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_stats`, which times every query `db_helper` runs and adds
+it up per query shape.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import logging
+from unittest import mock
+
+from sausage_bot.util import envs, config, db_helper, db_stats
+
+GUILD = 444444444444444444
+
+
+async def test_queries_are_added_up_per_shape(guild_db_root):
+    db_stats.query_stats.reset()
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD)
+    await db_helper.insert_many_all(
+        envs.dilemmas_db_schema,
+        [("1", "first"), ("2", "second")],
+        guild_id=GUILD,
+    )
+    for _ in range(3):
+        rows = await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD)
+    assert len(rows) == 2
+
+    reads = [
+        shape
+        for shape in db_stats.query_stats.shapes()
+        if shape.sql.startswith("SELECT") and shape.table == "dilemmas"
+    ]
+    assert len(reads) == 1
+    read = reads[0]
+    assert read.count == 3
+    assert read.rows == 6
+    assert sum(read.histogram) == 3
+    assert list(read.db_files) == [f"guild_{GUILD}/dilemmas.sqlite"]
+    assert db_stats.query_stats.top(1, "count")[0].count >= 3
+
+
+async def test_slow_queries_are_logged(guild_db_root, monkeypatch, caplog):
+    db_stats.query_stats.reset()
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 1)
+        db_stats.query_stats.record(
+            "SELECT  *\n FROM quote", "/x/1/quote.sqlite", 0.5, rows=3
+        )
+        monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 0)
+        db_stats.query_stats.record("SELECT * FROM quote", "/x/1/quote.sqlite", 0.5)
+        monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 1000)
+        db_stats.query_stats.record("SELECT * FROM quote", "/x/1/quote.sqlite", 0.5)
+        monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 100)
+        db_stats.query_stats.record("SELECT * FROM quote", "/x/1/quote.sqlite", 0.5)
+
+    assert len(caplog.records) == 2
+    assert "500.0ms, 3 rows" in caplog.records[0].getMessage()
+    (shape,) = db_stats.query_stats.shapes()
+    assert shape.count == 4
+    assert shape.table == "quote"
+    assert shape.max_seconds == 0.5
+
+
+async def test_slow_query_log_names_the_caller(guild_db_root, monkeypatch, caplog):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD)
+
+    def not_for_fast_queries():
+        raise AssertionError("only slow queries look for where they came from")
+
+    monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 100000)
+    with mock.patch.object(db_stats, "find_caller", not_for_fast_queries):
+        await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD)
+
+    monkeypatch.setattr(config, "DB_SLOW_QUERY_MS", 1)
+    # Every query takes a second
+    monkeypatch.setattr(db_stats.time, "perf_counter", iter(range(100)).__next__)
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        await db_helper.get_output(envs.dilemmas_db_schema, guild_id=GUILD)
+
+    (slow,) = [record for record in caplog.records if record.name == "slow_queries"]
+    assert "via `get_output` from `db_stats_test`" in slow.getMessage()
+
+
+async def test_execute_works_as_a_context_manager(guild_db_root):
+    db_stats.query_stats.reset()
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD)
+    db_file = envs.resolve_db_file(envs.dilemmas_db_schema, GUILD)
+
+    async with db_helper.connect(db_file) as db:
+        async with db.executemany(
+            "INSERT INTO dilemmas VALUES (?, ?)", [("1", "first"), ("2", "second")]
+        ):
+            pass
+        async with db.execute("SELECT * FROM dilemmas") as cursor:
+            rows = await cursor.fetchall()
+        await db.commit()
+
+    assert len(rows) == 2
+    (read,) = [
+        shape
+        for shape in db_stats.query_stats.shapes()
+        if shape.sql.startswith("SELECT")
+    ]
+    assert read.rows == 2
+
+
+def test_shape_table_names_the_busiest_db_file():
+    db_stats.query_stats.reset()
+    for db_file in ("/x/1/quote.sqlite", "/x/2/quote.sqlite", "/x/2/quote.sqlite"):
+        db_stats.query_stats.record("SELECT * FROM quote", db_file, 0.002, rows=1)
+
+    table = db_stats.shape_table(
+        db_stats.query_stats.top(5, "count"),
+        ["Query", "Count", "Avg ms", "Max ms", "Rows", "Database"],
+    )
+
+    (row,) = table.splitlines()[2:]
+    assert row.startswith("SELECT * FROM quote")
+    assert row.split()[-2:] == ["3", "2/quote.sqlite"]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_helper.transaction()`, which runs several helpers against
+one connection and commits them together, or not at all.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import pytest
+
+from sausage_bot.util import envs, db_helper
+
+GUILD = 777777777777777777
+
+
+async def _prep():
+    await db_helper.prep_table(envs.roles_db_msgs_schema, guild_id=GUILD)
+    await db_helper.prep_table(envs.roles_db_roles_schema, guild_id=GUILD)
+    await db_helper.insert_many_all(
+        envs.roles_db_msgs_schema,
+        [("1", "2", "colors", "", "", "", 1)],
+        guild_id=GUILD,
+    )
+    await db_helper.insert_many_all(
+        envs.roles_db_roles_schema, [("1", "red", "🟥")], guild_id=GUILD
+    )
+
+
+async def _msg_ids():
+    msgs = await db_helper.get_output(
+        envs.roles_db_msgs_schema, select="msg_id", guild_id=GUILD
+    )
+    roles = await db_helper.get_output(
+        envs.roles_db_roles_schema, select="msg_id", guild_id=GUILD
+    )
+    return [row["msg_id"] for row in msgs + roles]
+
+
+async def test_helpers_share_one_transaction(guild_db_root):
+    await _prep()
+    async with db_helper.transaction(envs.roles_db_msgs_schema, GUILD) as tx:
+        for schema in (envs.roles_db_msgs_schema, envs.roles_db_roles_schema):
+            await db_helper.update_fields(
+                schema,
+                where=("msg_id", "1"),
+                updates=[("msg_id", "9")],
+                guild_id=GUILD,
+            )
+        assert tx.db.in_transaction
+
+    assert await _msg_ids() == ["9", "9"]
+
+
+async def test_exception_rolls_everything_back(guild_db_root):
+    await _prep()
+    with pytest.raises(RuntimeError):
+        async with db_helper.transaction(envs.roles_db_msgs_schema, GUILD):
+            await db_helper.update_fields(
+                envs.roles_db_msgs_schema,
+                where=("msg_id", "1"),
+                updates=[("msg_id", "9")],
+                guild_id=GUILD,
+            )
+            raise RuntimeError("Could not post the new message")
+
+    assert await _msg_ids() == ["1", "1"]
+
+
+async def test_error_swallowed_by_a_helper_rolls_back(guild_db_root):
+    await _prep()
+    with pytest.raises(Exception):
+        async with db_helper.transaction(envs.roles_db_msgs_schema, GUILD):
+            await db_helper.update_fields(
+                envs.roles_db_msgs_schema,
+                where=("msg_id", "1"),
+                updates=[("msg_id", "9")],
+                guild_id=GUILD,
+            )
+            # No such column: `update_fields` logs it and returns None
+            await db_helper.update_fields(
+                envs.roles_db_roles_schema,
+                where=("msg_id", "1"),
+                updates=[("no_such_col", "9")],
+                guild_id=GUILD,
+            )
+
+    assert await _msg_ids() == ["1", "1"]
+
+
+async def test_nested_transaction_joins_the_outer_one(guild_db_root):
+    await _prep()
+    async with db_helper.transaction(envs.roles_db_msgs_schema, GUILD) as outer:
+        async with db_helper.transaction(
+            envs.roles_db_roles_schema, GUILD
+        ) as inner:
+            assert inner is outer
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_helper.write_buffer`, which holds rows from
+`insert_buffered` (like posted feed links) and writes them in one
+transaction, while reads still see them.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import asyncio
+
+import aiosqlite
+import pytest
+
+from sausage_bot.util import envs, db_helper, feeds_core, net_io
+
+GUILD = 666666666666666666
+
+
+def _row(uuid, url):
+    return [uuid, url, "2026-01-01T00:00:00", f"hash-{url}"]
+
+
+async def _written(template_info):
+    "Rows actually in the database file, bypassing the buffer"
+    db_file = envs.resolve_db_file(template_info, guild_id=GUILD)
+    async with db_helper.connect(db_file, write_buffered=False) as db:
+        out = await db.execute(f"SELECT url FROM {template_info['name']}")
+        return [row[0] for row in await out.fetchall()]
+
+
+async def test_buffered_rows_are_read_before_they_are_written(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    await db_helper.insert_buffered(
+        envs.rss_db_log_schema,
+        [_row("feed-a", "https://a/1"), _row("feed-b", "https://b/1")],
+        guild_id=GUILD,
+    )
+
+    logged = await db_helper.get_output(
+        envs.rss_db_log_schema,
+        select=("url", "hash"),
+        where=[("uuid", "feed-a")],
+        guild_id=GUILD,
+    )
+
+    assert logged == [{"url": "https://a/1", "hash": "hash-https://a/1"}]
+    assert await _written(envs.rss_db_log_schema) == []
+
+
+async def test_flush_writes_every_buffered_row(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    for idx in range(3):
+        await db_helper.insert_buffered(
+            envs.rss_db_log_schema, [_row("feed-a", f"https://a/{idx}")], guild_id=GUILD
+        )
+
+    await db_helper.flush_buffered_inserts()
+
+    assert await _written(envs.rss_db_log_schema) == [
+        "https://a/0",
+        "https://a/1",
+        "https://a/2",
+    ]
+    # ...and are not returned twice from now on
+    assert len(await db_helper.get_output(envs.rss_db_log_schema, guild_id=GUILD)) == 3
+
+
+async def test_other_use_of_the_file_writes_the_buffer_first(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    await db_helper.insert_buffered(
+        envs.rss_db_log_schema, [_row("feed-a", "https://a/1")], guild_id=GUILD
+    )
+
+    await db_helper.del_row_by_AND_filter(
+        envs.rss_db_log_schema, where=("uuid", "feed-a"), guild_id=GUILD
+    )
+
+    assert await db_helper.get_output(envs.rss_db_log_schema, guild_id=GUILD) == []
+
+
+async def test_buffer_is_written_on_a_timer(guild_db_root, monkeypatch):
+    monkeypatch.setattr(db_helper.write_buffer, "flush_interval", 0)
+    await db_helper.prep_table(envs.youtube_db_log_schema, guild_id=GUILD)
+    await db_helper.insert_buffered(
+        envs.youtube_db_log_schema, [_row("feed-y", "https://y/1")], guild_id=GUILD
+    )
+
+    await asyncio.sleep(0.1)
+
+    assert await _written(envs.youtube_db_log_schema) == ["https://y/1"]
+
+
+async def test_unlogged_link_is_not_logged_by_the_check(guild_db_root, monkeypatch):
+    async def fake_page_hash(link):
+        return "some-hash"
+
+    monkeypatch.setattr(net_io, "get_page_hash", fake_page_hash)
+    await db_helper.prep_table(envs.youtube_db_log_schema, guild_id=GUILD)
+    # Youtube logs are read without their hashes
+    log_in = [{"url": "https://y/old"}]
+
+    in_log = await feeds_core.link_is_in_log(
+        "https://y/new", log_in, envs.youtube_db_log_schema, "123", "feed-y", None
+    )
+
+    # The caller logs the link once it has been posted
+    assert in_log is False
+    assert await db_helper.get_output(envs.youtube_db_log_schema, guild_id=GUILD) == []
+
+
+async def test_failed_write_keeps_the_rows_and_spares_the_reader(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    db_file = envs.resolve_db_file(envs.rss_db_log_schema, guild_id=GUILD)
+    async with aiosqlite.connect(db_file) as db:
+        await db.execute("DROP TABLE log")
+    db_helper.forget_known_tables()
+    # No table, so writing the buffered row fails
+    await db_helper.insert_buffered(
+        envs.rss_db_log_schema, [_row("feed-a", "https://a/1")], guild_id=GUILD
+    )
+
+    async with db_helper.connect(db_file) as db:
+        out = await db.execute("SELECT 1")
+        assert await out.fetchall() == [(1,)]
+
+    assert db_helper.write_buffer.has_rows(db_file)
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    await db_helper.flush_buffered_inserts()
+    assert not db_helper.write_buffer.has_rows(db_file)
+    assert await _written(envs.rss_db_log_schema) == ["https://a/1"]
+
+
+async def test_rows_stay_buffered_until_committed(guild_db_root, monkeypatch):
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    db_file = envs.resolve_db_file(envs.rss_db_log_schema, guild_id=GUILD)
+    await db_helper.insert_buffered(
+        envs.rss_db_log_schema, [_row("feed-a", "https://a/1")], guild_id=GUILD
+    )
+
+    async with db_helper.pool.borrow(db_file) as db:
+        commit = db.commit
+
+        async def cancelled():
+            assert db_helper.write_buffer.has_rows(db_file)
+            raise asyncio.CancelledError
+
+        monkeypatch.setattr(db, "commit", cancelled)
+        with pytest.raises(asyncio.CancelledError):
+            await db_helper.write_buffer.write(db, db_file)
+        assert not db.in_transaction
+
+        async def add_then_commit():
+            # Added while the write is underway, so left for the next one
+            db_helper.write_buffer.add(
+                envs.rss_db_log_schema, [_row("feed-b", "https://b/1")], GUILD
+            )
+            await commit()
+
+        monkeypatch.setattr(db, "commit", add_then_commit)
+        assert await db_helper.write_buffer.write(db, db_file)
+        monkeypatch.setattr(db, "commit", commit)
+
+    assert await _written(envs.rss_db_log_schema) == ["https://a/1"]
+    assert db_helper.write_buffer.pending(envs.rss_db_log_schema, GUILD) == [
+        tuple(_row("feed-b", "https://b/1"))
+    ]
+    await db_helper.flush_buffered_inserts()
+
+
+async def test_timer_does_not_inherit_a_transaction(guild_db_root, monkeypatch):
+    seen = []
+
+    async def fake_flush(db_file=None):
+        seen.append(dict(db_helper.active_transactions.get()))
+
+    monkeypatch.setattr(db_helper.write_buffer, "flush_interval", 0)
+    monkeypatch.setattr(db_helper.write_buffer, "flush", fake_flush)
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD)
+    await db_helper.prep_table(envs.youtube_db_log_schema, guild_id=GUILD)
+    # The timer starts while a transaction on the rss file is open, but
+    # fires when that is long done
+    async with db_helper.transaction(envs.rss_db_log_schema, GUILD):
+        await db_helper.insert_buffered(
+            envs.youtube_db_log_schema, [_row("feed-y", "https://y/1")], guild_id=GUILD
+        )
+
+    await asyncio.sleep(0.1)
+
+    assert seen == [{}]
+    db_helper.write_buffer._rows.clear()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `feeds_core.FeedFetches`, which fetches and parses a feed that
+several guilds follow once per run of a feed loop.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from unittest import mock
+
+from sausage_bot.util import envs, db_helper, feeds_core
+
+GUILDS = [111111111111111111, 111111111111111112, 111111111111111113]
+FEED = """<?xml version="1.0"?>
+<rss><channel><title>News</title>
+<item><title>First</title><link>https://example.com/1</link>
+<description>one</description></item>
+<item><title>Second</title><link>https://example.com/2</link>
+<description>two</description></item>
+</channel></rss>"""
+
+
+def test_the_same_feed_gets_the_same_key():
+    assert (
+        feeds_core.feed_key("https://Example.com/feed/?b=2&a=1#top")
+        == feeds_core.feed_key("example.com/feed?a=1&b=2")
+        == "https://example.com/feed?a=1&b=2"
+    )
+    assert feeds_core.feed_key("https://example.com/feed") != feeds_core.feed_key(
+        "https://example.com/other"
+    )
+
+
+async def test_guilds_share_one_fetch_and_parse(guild_db_root):
+    for guild_id in GUILDS:
+        for schema in (
+            envs.rss_db_http_cache_schema,
+            envs.rss_db_filter_schema,
+            envs.rss_db_log_schema,
+        ):
+            await db_helper.prep_table(schema, guild_id=guild_id)
+    # The last guild has fetched the feed before, the others haven't
+    await db_helper.insert_many_all(
+        envs.rss_db_http_cache_schema,
+        [("feed", "https://example.com/feed", '"old"', None, 1, 0)],
+        guild_id=GUILDS[2],
+    )
+    fetched = []
+
+    async def fake_get_link(url, status_out=None, validators=None):
+        fetched.append((validators or {}).get("etag"))
+        content = f"{FEED}\n"
+        return {"status": 200, "content": content, "etag": '"new"', "last_modified": None}
+
+    fetches = feeds_core.FeedFetches()
+    parse = mock.Mock(wraps=feeds_core.parse_feed_items)
+    with (
+        mock.patch.object(feeds_core.net_io, "get_link", fake_get_link),
+        mock.patch.object(feeds_core, "parse_feed_items", parse),
+    ):
+        links = [
+            await feeds_core.get_feed_links(
+                "rss", {"uuid": "feed", "url": url}, guild_id, fetches=fetches
+            )
+            for guild_id, url in zip(
+                GUILDS,
+                [
+                    "https://example.com/feed",
+                    "example.com/feed/",
+                    "https://example.com/feed",
+                ],
+            )
+        ]
+
+    # The feed changed, so the last guild gets the first guild's fetch
+    assert fetched == [None]
+    assert (fetches.fetched, parse.call_count) == (1, 1)
+    assert all([item["title"] for item in out] == ["First", "Second"] for out in links)
+    # Every guild gets its own items
+    links[0][0]["title"] = "Changed"
+    assert links[1][0]["title"] == "First"
+
+
+async def test_guilds_with_other_validators_share_one_full_fetch(guild_db_root):
+    validators = ['"v1"', '"v1"', '"v0"', None]
+    guilds = GUILDS + [111111111111111114]
+    for guild_id, etag in zip(guilds, validators):
+        await db_helper.prep_table(envs.rss_db_http_cache_schema, guild_id=guild_id)
+        if etag is not None:
+            await db_helper.insert_many_all(
+                envs.rss_db_http_cache_schema,
+                [("feed", "https://example.com/feed", etag, None, 1, 0)],
+                guild_id=guild_id,
+            )
+    fetched = []
+
+    async def fake_get_link(url, status_out=None, validators=None):
+        etag = (validators or {}).get("etag")
+        fetched.append(etag)
+        if etag == '"v1"':
+            return {"status": 304, "content": None, "etag": None, "last_modified": None}
+        return {"status": 200, "content": FEED, "etag": '"v1"', "last_modified": None}
+
+    fetches = feeds_core.FeedFetches()
+    with mock.patch.object(feeds_core.net_io, "get_link", fake_get_link):
+        statuses = [
+            (
+                await feeds_core.get_feed_if_changed(
+                    "rss", "feed", "https://example.com/feed", guild_id, fetches=fetches
+                )
+            )["status"]
+            for guild_id in guilds
+        ]
+
+    assert fetched == ['"v1"', None]
+    assert statuses == [304, 304, 200, 200]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises the conditional fetches of feeds: the `ETag`/`Last-Modified`
+a feed was last fetched with are sent along, and a 304 is taken as "no
+new items" without parsing the feed.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from unittest import mock
+
+from sausage_bot.util import envs, db_helper, feeds_core
+
+GUILD = 222222222222222222
+URL = "https://example.com/feed.xml"
+
+
+async def test_unchanged_feed_is_not_parsed(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_http_cache_schema, guild_id=GUILD)
+    validators_sent = []
+    responses = [
+        {"status": 200, "content": "<rss/>", "etag": '"v1"', "last_modified": None},
+        {"status": 304, "content": "", "etag": None, "last_modified": None},
+    ]
+
+    async def fake_get_link(url, status_out=None, validators=None):
+        validators_sent.append(validators and validators["etag"])
+        return responses.pop(0)
+
+    feed = {"uuid": "feed-1", "url": URL}
+    with (
+        mock.patch.object(feeds_core.net_io, "get_link", fake_get_link),
+        mock.patch.object(
+            feeds_core, "get_items_from_rss", mock.AsyncMock(return_value=["item"])
+        ) as parse,
+    ):
+        for expected in (["item"], []):
+            fetched = []
+            links = await feeds_core.get_feed_links(
+                "rss", feed, GUILD, fetched=fetched
+            )
+            assert links == expected
+            # ...the links are posted, and then
+            await feeds_core.save_feed_fetches(fetched, GUILD)
+
+    assert validators_sent == [None, '"v1"']
+    assert parse.await_count == 1
+    cached = await db_helper.get_output(
+        envs.rss_db_http_cache_schema,
+        where=("uuid", "feed-1"),
+        single=True,
+        guild_id=GUILD,
+    )
+    assert cached["etag"] == '"v1"'
+    assert (cached["fetches"], cached["not_modified"]) == (2, 1)
+
+
+async def test_validators_wait_until_the_feed_is_posted(guild_db_root):
+    await db_helper.prep_table(envs.rss_db_http_cache_schema, guild_id=GUILD)
+    validators_sent = []
+
+    async def fake_get_link(url, status_out=None, validators=None):
+        validators_sent.append(validators and validators["etag"])
+        return {
+            "status": 200,
+            "content": "<rss/>",
+            "etag": '"v1"',
+            "last_modified": None,
+        }
+
+    feed = {"uuid": "feed-1", "url": URL}
+    with (
+        mock.patch.object(feeds_core.net_io, "get_link", fake_get_link),
+        mock.patch.object(
+            feeds_core, "get_items_from_rss", mock.AsyncMock(return_value=["item"])
+        ),
+    ):
+        # Posting failed, so nothing was saved
+        await feeds_core.get_feed_links("rss", feed, GUILD, fetched=[])
+        fetched = []
+        await feeds_core.get_feed_links("rss", feed, GUILD, fetched=fetched)
+        await feeds_core.save_feed_fetches(fetched, GUILD)
+        fetched = []
+        await feeds_core.get_feed_links("rss", feed, GUILD, fetched=fetched)
+        await feeds_core.save_feed_fetches(fetched, GUILD)
+
+    assert validators_sent == [None, None, '"v1"']
+    db_file = envs.resolve_db_file(envs.rss_db_http_cache_schema, GUILD)
+    # Only buffered so far, and still one row per feed once written
+    assert db_helper.write_buffer.has_rows(db_file)
+    await db_helper.flush_buffered_inserts()
+    cached = await db_helper.get_output(envs.rss_db_http_cache_schema, guild_id=GUILD)
+    assert [(row["uuid"], row["fetches"]) for row in cached] == [("feed-1", 2)]
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `feeds_core.run_feed_jobs`, which fetches and posts feeds at
+the same time within the configured limits, keeping the order of the
+posts in each channel.
+"""
+import asyncio
+import logging
+
+from sausage_bot.util import config, feeds_core
+
+
+async def test_channels_keep_their_order_within_the_limits(monkeypatch, caplog):
+    monkeypatch.setattr(config, "FEED_CONCURRENCY", 3)
+    monkeypatch.setattr(config, "FEED_CONCURRENCY_PER_HOST", 2)
+    running = {"all": 0, "hosts": {}}
+    most = {"all": 0, "hosts": {}}
+    posted = {}
+    started = []
+
+    def job(channel, host, number):
+        async def run():
+            started.append(host)
+            running["all"] += 1
+            running["hosts"][host] = running["hosts"].get(host, 0) + 1
+            most["all"] = max(most["all"], running["all"])
+            most["hosts"][host] = max(
+                most["hosts"].get(host, 0), running["hosts"][host]
+            )
+            await asyncio.sleep(0.01)
+            posted.setdefault(channel, []).append(number)
+            running["all"] -= 1
+            running["hosts"][host] -= 1
+            if number == 1:
+                raise RuntimeError("a failed feed doesn't stop the rest")
+
+        return (channel, f"https://{host}/feed", run)
+
+    jobs = [
+        job(channel, host, number)
+        for number in range(4)
+        for channel, host in [(1, "a.com"), (2, "a.com"), (3, "a.com"), (4, "b.com")]
+    ]
+    with caplog.at_level(logging.ERROR):
+        await feeds_core.run_feed_jobs(jobs)
+
+    assert posted == {channel: [0, 1, 2, 3] for channel in range(1, 5)}
+    assert most["all"] == 3
+    assert most["hosts"] == {"a.com": 2, "b.com": 1}
+    # A job waiting for a busy host doesn't keep others from running
+    assert "b.com" in started[:3]
+    # Failures are logged with their traceback
+    assert len(caplog.records) == 4
+    assert all(record.exc_info for record in caplog.records)
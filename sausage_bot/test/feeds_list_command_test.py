@@ -72,6 +72,7 @@ def norwegian_guild():
                 youtube.LIST_TYPE_NORMAL,
                 youtube.LIST_TYPE_ADDED,
                 youtube.LIST_TYPE_FILTER,
+                youtube.LIST_TYPE_CACHE,
             ],
         ),
         (
@@ -82,12 +83,22 @@ def norwegian_guild():
         (
             rss.RSSfeed.rss_list,
             "list_type",
-            [rss.LIST_TYPE_NORMAL, rss.LIST_TYPE_ADDED, rss.LIST_TYPE_FILTER],
+            [
+                rss.LIST_TYPE_NORMAL,
+                rss.LIST_TYPE_ADDED,
+                rss.LIST_TYPE_FILTER,
+                rss.LIST_TYPE_CACHE,
+            ],
         ),
         (
             rss.RSSfeed.podcast_list,
             "list_type",
-            [rss.LIST_TYPE_NORMAL, rss.LIST_TYPE_ADDED, rss.LIST_TYPE_FILTER],
+            [
+                rss.LIST_TYPE_NORMAL,
+                rss.LIST_TYPE_ADDED,
+                rss.LIST_TYPE_FILTER,
+                rss.LIST_TYPE_CACHE,
+            ],
         ),
     ],
 )
@@ -70,7 +70,7 @@ async def test_missing_headers_file_does_not_break_the_request():
     session = _FakeSession()
     with (
         _no_user_agents(),
-        mock.patch.object(net_io.aiohttp, "ClientSession", lambda: session),
+        mock.patch.object(net_io.http_client.client, "session", lambda: session),
     ):
         result = await net_io.get_link(URL)
     assert result == "<html>ok</html>"
@@ -82,7 +82,7 @@ async def test_a_scraped_user_agent_is_used_when_available():
     session = _FakeSession()
     with (
         _some_user_agents(),
-        mock.patch.object(net_io.aiohttp, "ClientSession", lambda: session),
+        mock.patch.object(net_io.http_client.client, "session", lambda: session),
     ):
         await net_io.get_link(URL)
     assert session.headers_seen == [{"user-agent": "test-agent/1.0"}]
@@ -97,7 +97,7 @@ async def test_a_failed_request_returns_none_rather_than_a_fake_status():
 
     with (
         _no_user_agents(),
-        mock.patch.object(net_io.aiohttp, "ClientSession", _explode),
+        mock.patch.object(net_io.http_client.client, "session", _explode),
     ):
         result = await net_io.get_link(URL)
     assert result is None
@@ -111,7 +111,7 @@ async def test_a_failed_request_keeps_the_dict_shape_for_status_out():
 
     with (
         _no_user_agents(),
-        mock.patch.object(net_io.aiohttp, "ClientSession", _explode),
+        mock.patch.object(net_io.http_client.client, "session", _explode),
     ):
         result = await net_io.get_link(URL, status_out=True)
     assert result["status"] != 200
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises the guild bootstrap the cogs run in their `setup()`:
+`db_helper.for_each_guild`, which sets up a bounded number of guilds at
+a time, and `db_migrations.bootstrap_guild`, which skips the guilds
+whose tables are already set up for the current schema.
+
+All database tests use the `guild_db_root` fixture (see conftest.py), so
+nothing here touches real bot data.
+"""
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+from sausage_bot.util import envs, db_helper, db_migrations
+
+GUILD = SimpleNamespace(id=777777777777777777, name="Guild")
+
+
+async def test_for_each_guild_is_bounded_and_isolates_errors():
+    guilds = [SimpleNamespace(id=guild_id) for guild_id in range(10)]
+    running = []
+    most_running = 0
+
+    async def work(guild):
+        nonlocal most_running
+        running.append(guild.id)
+        most_running = max(most_running, len(running))
+        await asyncio.sleep(0.01)
+        running.remove(guild.id)
+        if guild.id == 3:
+            raise ValueError("broken guild")
+        return guild.id
+
+    results = await db_helper.for_each_guild(guilds, work, limit=4)
+
+    assert most_running == 4
+    assert results == [0, 1, 2, None, 4, 5, 6, 7, 8, 9]
+
+
+async def test_bootstrap_skips_up_to_date_guilds(guild_db_root, monkeypatch):
+    preps = []
+
+    async def prep(guild):
+        preps.append(guild.id)
+        await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=guild.id)
+
+    assert await db_migrations.bootstrap_guild("dilemmas", GUILD, prep)
+    # A reconnect doesn't set the tables up again
+    assert not await db_migrations.bootstrap_guild("dilemmas", GUILD, prep)
+    assert preps == [GUILD.id]
+
+    # A schema change sets them up again, once
+    monkeypatch.setattr(db_migrations, "schema_version", lambda: "changed")
+    assert await db_migrations.bootstrap_guild("dilemmas", GUILD, prep)
+    assert not await db_migrations.bootstrap_guild("dilemmas", GUILD, prep)
+    assert preps == [GUILD.id, GUILD.id]
+
+
+async def test_bootstrap_runs_again_after_a_failed_fixup(guild_db_root, monkeypatch):
+    async def failing(guild):
+        raise ValueError("not yet")
+
+    async def prep(guild):
+        await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=guild.id)
+        await db_migrations.migrate(envs.dilemmas_db_schema, guild)
+
+    monkeypatch.setitem(db_migrations.migrations, "dilemmas.sqlite", [failing])
+    migrated = [envs.dilemmas_db_schema]
+    assert await db_migrations.bootstrap_guild("dilemmas", GUILD, prep, migrated)
+    assert await db_migrations.bootstrap_guild("dilemmas", GUILD, prep, migrated)
+
+
+async def test_bootstrap_runs_again_when_tables_are_gone(guild_db_root):
+    preps = []
+    tables = [envs.dilemmas_db_schema, envs.tasks_db_schema]
+
+    async def prep(guild):
+        preps.append(guild.id)
+        await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=guild.id)
+        await db_helper.ensure_guild_tasks_rows(guild.id)
+
+    assert await db_migrations.bootstrap_guild("dilemmas", GUILD, prep, tables=tables)
+    assert not await db_migrations.bootstrap_guild(
+        "dilemmas", GUILD, prep, tables=tables
+    )
+
+    # A deleted database file...
+    await db_helper.close_connections()
+    Path(envs.resolve_db_file(envs.dilemmas_db_schema, GUILD.id)).unlink()
+    db_helper.forget_known_tables()
+    assert await db_migrations.bootstrap_guild("dilemmas", GUILD, prep, tables=tables)
+    # ...or a missing tasks row sets the tables up again
+    await db_helper.del_row_by_AND_filter(
+        envs.tasks_db_schema, where=("cog", "quotes"), guild_id=GUILD.id
+    )
+    assert await db_migrations.bootstrap_guild("dilemmas", GUILD, prep, tables=tables)
+    assert not await db_migrations.bootstrap_guild(
+        "dilemmas", GUILD, prep, tables=tables
+    )
+    assert preps == [GUILD.id] * 3
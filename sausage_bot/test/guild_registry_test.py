@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_helper.guild_registry`, the in-memory copy of the guild
+registry behind `is_guild_approved()` and the task loops' list of
+approved guilds.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper
+
+APPROVED = "111111111111111111"
+PENDING = "222222222222222222"
+
+
+async def _seed():
+    await db_helper.prep_table(envs.guilds_db_schema)
+    await db_helper.insert_many_all(
+        envs.guilds_db_schema,
+        [
+            (APPROVED, "Approved guild", "approved", None, None, None),
+            (PENDING, "Pending guild", "pending", None, None, None),
+        ],
+    )
+
+
+async def test_lookups_do_not_query_once_loaded(guild_db_root, monkeypatch):
+    await _seed()
+    await db_helper.guild_registry.load()
+    queries = []
+    real_get_output = db_helper._get_output
+
+    async def counting_get_output(*args, **kwargs):
+        queries.append(args)
+        return await real_get_output(*args, **kwargs)
+
+    monkeypatch.setattr(db_helper, "_get_output", counting_get_output)
+
+    assert await db_helper.is_guild_approved(APPROVED) is True
+    assert await db_helper.is_guild_approved(int(PENDING)) is False
+    assert await db_helper.is_guild_approved("333") is False
+    assert [row["guild_id"] for row in await db_helper.guild_registry.approved()] == [
+        APPROVED
+    ]
+    assert queries == []
+
+
+async def test_status_changes_are_picked_up(guild_db_root):
+    await _seed()
+    assert await db_helper.is_guild_approved(PENDING) is False
+
+    # What `/approve-guild` and `on_guild_remove` do
+    await db_helper.update_fields(
+        envs.guilds_db_schema,
+        where=("guild_id", PENDING),
+        updates=("status", "approved"),
+    )
+    assert await db_helper.is_guild_approved(PENDING) is True
+
+    await db_helper.update_fields(
+        envs.guilds_db_schema,
+        where=("guild_id", APPROVED),
+        updates=("status", "removed"),
+    )
+    assert await db_helper.guild_registry.status(APPROVED) == "removed"
+    assert [row["guild_id"] for row in await db_helper.guild_registry.approved()] == [
+        PENDING
+    ]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `guild_transfer`, which exports a guild's tables to a gzipped
+JSON lines file and imports them again, a batch of rows at a time.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import gzip
+import json
+
+import aiosqlite
+
+from sausage_bot.util import envs, db_helper, guild_transfer
+
+GUILD_FROM = 565656565656565656
+GUILD_TO = 787878787878787878
+
+
+async def test_export_and_import_copy_every_table(guild_db_root, monkeypatch):
+    monkeypatch.setattr(guild_transfer, "BATCH_SIZE", 100)
+    await db_helper.prep_table(envs.rss_db_log_schema, guild_id=GUILD_FROM)
+    log_rows = [
+        ("feed", f"https://example.com/{i}", "2026-01-01", f"h{i}") for i in range(1050)
+    ]
+    await db_helper.insert_many_all(
+        envs.rss_db_log_schema, log_rows, guild_id=GUILD_FROM
+    )
+    for schema in (envs.quote_img_db_schema, envs.quote_blob_db_schema):
+        await db_helper.prep_table(schema, guild_id=GUILD_FROM)
+    await db_helper.insert_quote_imgs(
+        [(1, 1, b"\x89PNG\x00image")], guild_id=GUILD_FROM
+    )
+
+    exported = await guild_transfer.export_guild(
+        GUILD_FROM, guild_db_root / "export.jsonl.gz"
+    )
+    imported = await guild_transfer.import_guild(exported["path"], guild_id=GUILD_TO)
+
+    assert exported["rows"]["rss_db_log_schema"] == 1050
+    assert imported["rows"] == exported["rows"]
+    # Only the tables the guild has are in the export
+    assert "dilemmas_db_schema" not in exported["rows"]
+    copied = await db_helper.get_output(
+        envs.rss_db_log_schema, select=("url"), guild_id=GUILD_TO
+    )
+    assert len(copied) == 1050
+    assert (
+        await db_helper.get_quote_img(1, 1, guild_id=GUILD_TO) == b"\x89PNG\x00image"
+    )
+    # Importing again doesn't duplicate what has a primary key
+    await guild_transfer.import_guild(exported["path"], guild_id=GUILD_TO)
+    blobs = await db_helper.get_output(envs.quote_blob_db_schema, guild_id=GUILD_TO)
+    assert len(blobs) == 1
+
+
+async def test_import_leaves_out_unknown_columns(guild_db_root):
+    path = guild_db_root / "old.jsonl.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as out:
+        for record in (
+            {"format": 1, "guild_id": str(GUILD_FROM), "exported": "2020-01-01"},
+            {"schema": "dilemmas_db_schema", "columns": ["id", "old", "dilemmas_text"]},
+            {"row": ["d1", "gone", "text"]},
+            {"schema": "no_such_db_schema", "columns": ["a"]},
+            {"row": [1]},
+        ):
+            out.write(json.dumps(record) + "\n")
+
+    imported = await guild_transfer.import_guild(path)
+
+    assert imported == {"guild_id": str(GUILD_FROM), "rows": {"dilemmas_db_schema": 1}}
+    db_file = envs.resolve_db_file(envs.dilemmas_db_schema, GUILD_FROM)
+    async with aiosqlite.connect(db_file) as db:
+        out = await db.execute("SELECT * FROM dilemmas")
+        assert await out.fetchall() == [("d1", "text")]
+
+
+async def test_export_and_import_keep_rowid(guild_db_root, monkeypatch):
+    monkeypatch.setattr(guild_transfer, "BATCH_SIZE", 2)
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD_FROM)
+    db_file = envs.resolve_db_file(envs.dilemmas_db_schema, GUILD_FROM)
+    async with aiosqlite.connect(db_file) as db:
+        await db.executemany(
+            "INSERT INTO dilemmas (rowid, id, dilemmas_text) VALUES (?, ?, ?)",
+            [(3, "d3", "three"), (7, "d7", "seven"), (8, "d8", "eight")],
+        )
+        await db.commit()
+
+    exported = await guild_transfer.export_guild(
+        GUILD_FROM, guild_db_root / "export.jsonl.gz"
+    )
+    await guild_transfer.import_guild(exported["path"], guild_id=GUILD_TO)
+
+    assert exported["rows"]["dilemmas_db_schema"] == 3
+    db_file = envs.resolve_db_file(envs.dilemmas_db_schema, GUILD_TO)
+    async with aiosqlite.connect(db_file) as db:
+        out = await db.execute("SELECT rowid, id FROM dilemmas ORDER BY rowid")
+        assert await out.fetchall() == [(3, "d3"), (7, "d7"), (8, "d8")]
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `http_client`, the one HTTP session every outgoing request
+goes through.
+"""
+from sausage_bot.util.http_client import HttpClient
+
+
+async def test_one_session_is_shared_until_closed():
+    client = HttpClient(limit_per_host=2, timeout=5)
+    session = client.session()
+    assert client.session() is session
+    assert session.connector.limit_per_host == 2
+    assert session.timeout.total == 5
+
+    await client.close()
+    assert session.closed
+    reopened = client.session()
+    assert reopened is not session
+    await client.close()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises the paths and tables `envs` and `db_helper` remember, so
+reads don't ask the file system or the database whether they exist.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import pytest
+
+from sausage_bot.util import envs, db_helper, db_stats
+
+GUILD = 333333333333333333
+
+
+def test_db_file_is_resolved_once(guild_db_root):
+    first = envs.resolve_db_file(envs.dilemmas_db_schema, GUILD)
+    assert first == str(guild_db_root / f"guild_{GUILD}" / "dilemmas.sqlite")
+    assert envs.resolve_db_file(envs.dilemmas_db_schema, GUILD) is first
+
+
+async def test_prepped_table_is_not_probed(guild_db_root):
+    await db_helper.prep_table(envs.stats_db_hide_roles_schema, guild_id=GUILD)
+    db_stats.query_stats.reset()
+
+    assert await db_helper.table_exist(envs.stats_db_hide_roles_schema, GUILD)
+    assert db_stats.query_stats.shapes() == []
+
+    # A table that isn't there is asked for every time
+    assert not await db_helper.table_exist(envs.stats_db_settings_schema, GUILD)
+    assert not await db_helper.table_exist(envs.stats_db_settings_schema, GUILD)
+    (probe,) = db_stats.query_stats.shapes()
+    assert probe.count == 2
+
+
+async def test_rolled_back_table_is_not_remembered(guild_db_root):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD)
+    with pytest.raises(RuntimeError):
+        async with db_helper.transaction(envs.dilemmas_db_schema, GUILD):
+            await db_helper.prep_table(envs.dilemmas_db_log_schema, guild_id=GUILD)
+            raise RuntimeError("rolled back")
+
+    assert not await db_helper.table_exist(envs.dilemmas_db_log_schema, GUILD)
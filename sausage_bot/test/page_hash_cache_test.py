@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `net_io.PageHashCache`, which keeps the page hashes so the
+same page is fetched once per TTL however many feeds and guilds have it.
+"""
+import asyncio
+
+from sausage_bot.util.net_io import PageHashCache
+
+
+class _Fetcher:
+    def __init__(self, result="hash"):
+        self.fetched = []
+        self.result = result
+        self.release = asyncio.Event()
+
+    async def __call__(self, url):
+        self.fetched.append(url)
+        await self.release.wait()
+        return self.result
+
+
+async def test_concurrent_requests_share_one_fetch():
+    cache = PageHashCache(ttl=60, max_size=10)
+    fetch = _Fetcher()
+    waiting = [asyncio.create_task(cache.get("https://a", fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    fetch.release.set()
+
+    assert await asyncio.gather(*waiting) == ["hash"] * 5
+    assert await cache.get("https://a", fetch) == "hash"
+    assert fetch.fetched == ["https://a"]
+    assert cache.stats() == {"hits": 5, "misses": 1, "urls": 1}
+
+
+async def test_expired_failed_and_evicted_pages_are_fetched_again():
+    fetch = _Fetcher()
+    fetch.release.set()
+    expiring = PageHashCache(ttl=0, max_size=10)
+    await expiring.get("https://a", fetch)
+    await expiring.get("https://a", fetch)
+    assert fetch.fetched == ["https://a"] * 2
+
+    failing = _Fetcher(result=None)
+    failing.release.set()
+    cache = PageHashCache(ttl=60, max_size=2)
+    assert await cache.get("https://gone", failing) is None
+    assert await cache.get("https://gone", failing) is None
+    assert len(failing.fetched) == 2
+
+    fetch.fetched.clear()
+    for url in ["https://a", "https://b", "https://c", "https://a"]:
+        await cache.get(url, fetch)
+    assert fetch.fetched == ["https://a", "https://b", "https://c", "https://a"]
@@ -4,8 +4,8 @@
 Exercises `cogs/quote.py`'s `delete_quote_with_content()`.
 
 `/quote delete` used to remove the row in `quote` only, leaving the
-quote's comments in `quote_content`, its (base64-encoded, by far the
-largest rows in this database) images in `quote_img`, and its rows in the
+quote's comments in `quote_content`, its images (by far the largest rows
+in this database) in `quote_img` and `quote_blob`, and its rows in the
 posting log behind - the latter keeping a uuid that no longer exists
 excluded from random picks for good.
 
@@ -23,6 +23,7 @@ async def _prep_quote_tables():
         envs.quote_db_schema,
         envs.quote_content_db_schema,
         envs.quote_img_db_schema,
+        envs.quote_blob_db_schema,
         envs.quote_db_log_schema,
     ):
         await db_helper.prep_table(schema, guild_id=GUILD)
@@ -43,9 +44,7 @@ async def _insert_quote(uuid, comments, imgs=[]):
         guild_id=GUILD,
     )
     if imgs:
-        await db_helper.insert_many_all(
-            envs.quote_img_db_schema, imgs, guild_id=GUILD
-        )
+        await db_helper.insert_quote_imgs(imgs, guild_id=GUILD)
     await db_helper.insert_many_all(
         envs.quote_db_log_schema,
         [(uuid, 555, "2026-01-02 10:00:00.000")],
@@ -69,6 +68,9 @@ async def _counts():
         "img": len(
             await db_helper.get_output(envs.quote_img_db_schema, guild_id=GUILD)
         ),
+        "blob": len(
+            await db_helper.get_output(envs.quote_blob_db_schema, guild_id=GUILD)
+        ),
         "log": len(
             await db_helper.get_output(envs.quote_db_log_schema, guild_id=GUILD)
         ),
@@ -80,15 +82,15 @@ async def test_delete_removes_comments_images_and_log_rows(guild_db_root):
     await _insert_quote(
         "u-doomed",
         [(875423461655334924, "a"), (875423598968467467, "b")],
-        imgs=[(875423461655334924, 1, "QUJD"), (875423461655334924, 2, "WFla")],
+        imgs=[(875423461655334924, 1, b"ABC"), (875423461655334924, 2, b"XYZ")],
     )
-    assert await _counts() == {"quote": 1, "content": 2, "img": 2, "log": 1}
+    assert await _counts() == {"quote": 1, "content": 2, "img": 2, "blob": 2, "log": 1}
 
     await delete_quote_with_content(
         guild_id=GUILD, uuid="u-doomed", rowid=await _rowid_of("u-doomed")
     )
 
-    assert await _counts() == {"quote": 0, "content": 0, "img": 0, "log": 0}
+    assert await _counts() == {"quote": 0, "content": 0, "img": 0, "blob": 0, "log": 0}
 
 
 async def test_delete_leaves_other_quotes_untouched(guild_db_root):
@@ -96,19 +98,19 @@ async def test_delete_leaves_other_quotes_untouched(guild_db_root):
     await _insert_quote(
         "u-doomed",
         [(875423461655334924, "delete me")],
-        imgs=[(875423461655334924, 1, "QUJD")],
+        imgs=[(875423461655334924, 1, b"ABC")],
     )
     await _insert_quote(
         "u-keeper",
         [(875424818034532513, "keep me")],
-        imgs=[(875424818034532513, 1, "WFla")],
+        imgs=[(875424818034532513, 1, b"XYZ")],
     )
 
     await delete_quote_with_content(
         guild_id=GUILD, uuid="u-doomed", rowid=await _rowid_of("u-doomed")
     )
 
-    assert await _counts() == {"quote": 1, "content": 1, "img": 1, "log": 1}
+    assert await _counts() == {"quote": 1, "content": 1, "img": 1, "blob": 1, "log": 1}
     remaining = await db_helper.get_output(envs.quote_db_schema, guild_id=GUILD)
     assert remaining[0]["uuid"] == "u-keeper"
     content = await db_helper.get_output(envs.quote_content_db_schema, guild_id=GUILD)
@@ -125,4 +127,4 @@ async def test_delete_of_imported_quote_without_message_ids(guild_db_root):
         guild_id=GUILD, uuid="u-imported", rowid=await _rowid_of("u-imported")
     )
 
-    assert await _counts() == {"quote": 0, "content": 0, "img": 0, "log": 0}
+    assert await _counts() == {"quote": 0, "content": 0, "img": 0, "blob": 0, "log": 0}
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises where quote images are kept: `quote_blob`, keyed by the
+sha256 of the image, with `quote_img` pointing to it - and the move of
+the images in older databases' base64 `quote_img` column there.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+import base64
+import hashlib
+
+import aiosqlite
+
+from sausage_bot.util import envs, db_helper
+
+GUILD = 555555555555555555
+
+
+async def _prep_quote_tables():
+    for schema in (
+        envs.quote_db_schema,
+        envs.quote_content_db_schema,
+        envs.quote_img_db_schema,
+        envs.quote_blob_db_schema,
+    ):
+        await db_helper.prep_table(schema, guild_id=GUILD)
+
+
+async def test_the_same_image_is_stored_once(guild_db_root):
+    await _prep_quote_tables()
+
+    await db_helper.insert_quote_imgs(
+        [(1, 1, b"same"), (2, 1, b"same"), (2, 2, b"other")], guild_id=GUILD
+    )
+
+    imgs = await db_helper.get_output(envs.quote_img_db_schema, guild_id=GUILD)
+    blobs = await db_helper.get_output(
+        envs.quote_blob_db_schema, select=("sha256", "size"), guild_id=GUILD
+    )
+    assert len(imgs) == 3
+    assert sorted(blob["sha256"] for blob in blobs) == sorted(
+        hashlib.sha256(img).hexdigest() for img in (b"same", b"other")
+    )
+
+    # Only what no `quote_img` row points to anymore is pruned
+    await db_helper.del_row_by_AND_filter(
+        envs.quote_img_db_schema, where=("comment_id", 2), guild_id=GUILD
+    )
+    await db_helper.prune_quote_blobs(guild_id=GUILD)
+    blobs = await db_helper.get_output(
+        envs.quote_blob_db_schema, select=("size"), guild_id=GUILD
+    )
+    assert blobs == [{"size": 4}]
+
+
+async def test_base64_images_are_moved_to_blobs(guild_db_root):
+    db_file = envs.resolve_db_file(envs.quote_img_db_schema, guild_id=GUILD)
+    await db_helper.prep_table(envs.quote_db_schema, guild_id=GUILD)
+    await db_helper.prep_table(envs.quote_content_db_schema, guild_id=GUILD)
+    # A `quote_img` table as it used to be made
+    async with aiosqlite.connect(db_file) as db:
+        await db.execute(
+            "CREATE TABLE quote_img (comment_id INT, img_no INT, base64 TEXT)"
+        )
+        await db.executemany(
+            "INSERT INTO quote_img VALUES (?, ?, ?)",
+            [
+                (10, 1, base64.b64encode(b"first").decode()),
+                (11, 1, base64.b64encode(b"first").decode()),
+                (11, 2, base64.b64encode(b"second").decode()),
+            ],
+        )
+        await db.commit()
+    await db_helper.insert_many_all(
+        envs.quote_db_schema, [("u-1", 5, "quotes", "2026-01-01")], guild_id=GUILD
+    )
+    await db_helper.insert_many_all(
+        envs.quote_content_db_schema,
+        [("u-1", 10, 9, "someone", "a", 0), ("u-1", 11, 9, "someone", "b", 1)],
+        guild_id=GUILD,
+    )
+
+    await db_helper.db_quote_imgs_to_blobs(guild_id=GUILD)
+    # Running it again does nothing
+    await db_helper.db_quote_imgs_to_blobs(guild_id=GUILD)
+
+    assert await db_helper.find_cols(
+        envs.quote_img_db_schema, ["base64", "sha256"], guild_id=GUILD
+    ) == ["sha256"]
+    assert (
+        len(await db_helper.get_output(envs.quote_blob_db_schema, guild_id=GUILD))
+        == 2
+    )
+    quote = (await db_helper.get_imgs_with_quote(envs.quote_db_schema, guild_id=GUILD))[
+        0
+    ]
+    assert quote["comments"][10]["imgs"] == {1: b"first"}
+    assert quote["comments"][11]["imgs"] == {1: b"first", 2: b"second"}
@@ -27,6 +27,7 @@ async def _prep_quote_tables():
         envs.quote_db_schema,
         envs.quote_content_db_schema,
         envs.quote_img_db_schema,
+        envs.quote_blob_db_schema,
     ):
         await db_helper.prep_table(schema, guild_id=GUILD)
 
@@ -46,9 +47,7 @@ async def _insert_quote(uuid, channel_id, channel_backup, comments, imgs=[]):
         guild_id=GUILD,
     )
     if imgs:
-        await db_helper.insert_many_all(
-            envs.quote_img_db_schema, imgs, guild_id=GUILD
-        )
+        await db_helper.insert_quote_imgs(imgs, guild_id=GUILD)
 
 
 async def test_imported_quote_keeps_every_comment(guild_db_root):
@@ -95,14 +94,14 @@ async def test_quote_with_images_returns_them_per_comment(guild_db_root):
         555,
         "quotes",
         [(875423461655334924, "look at this"), (875423598968467467, "no image here")],
-        imgs=[(875423461655334924, 1, "QUJD"), (875423461655334924, 2, "WFla")],
+        imgs=[(875423461655334924, 1, b"ABC"), (875423461655334924, 2, b"XYZ")],
     )
 
     quote = (await db_helper.get_imgs_with_quote(envs.quote_db_schema, guild_id=GUILD))[
         0
     ]
 
-    assert quote["comments"][875423461655334924]["imgs"] == {1: "QUJD", 2: "WFla"}
+    assert quote["comments"][875423461655334924]["imgs"] == {1: b"ABC", 2: b"XYZ"}
     assert quote["comments"][875423598968467467]["imgs"] == {}
 
 
@@ -113,7 +112,7 @@ async def test_comment_level_columns_do_not_leak_into_the_quote(guild_db_root):
         555,
         "quotes",
         [(875423461655334924, "a")],
-        imgs=[(875423461655334924, 1, "QUJD")],
+        imgs=[(875423461655334924, 1, b"ABC")],
     )
 
     quote = (await db_helper.get_imgs_with_quote(envs.quote_db_schema, guild_id=GUILD))[
@@ -128,3 +127,30 @@ async def test_comment_level_columns_do_not_leak_into_the_quote(guild_db_root):
         "datetime",
         "comments",
     }
+
+
+async def test_img_refs_leave_the_bytes_in_the_database(guild_db_root):
+    await _prep_quote_tables()
+    await _insert_quote(
+        "u-refs",
+        555,
+        "quotes",
+        [(875423461655334924, "look at this")],
+        imgs=[(875423461655334924, 1, b"ABC"), (875423461655334924, 2, b"WXYZ")],
+    )
+
+    quote = (
+        await db_helper.get_imgs_with_quote(
+            envs.quote_db_schema, img_refs=True, guild_id=GUILD
+        )
+    )[0]
+
+    imgs = quote["comments"][875423461655334924]["imgs"]
+    assert imgs == {
+        1: {"comment_id": 875423461655334924, "img_no": 1, "size": 3},
+        2: {"comment_id": 875423461655334924, "img_no": 2, "size": 4},
+    }
+    assert await db_helper.get_quote_img(
+        imgs[2]["comment_id"], imgs[2]["img_no"], guild_id=GUILD
+    ) == b"WXYZ"
+    assert await db_helper.get_quote_img(875423461655334924, 3, guild_id=GUILD) is None
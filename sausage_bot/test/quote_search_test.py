@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises the full-text search over the quotes: `quote_search`, the
+FTS5 index `db_helper.prep_quote_search` makes and keeps in step with
+`quote_content`, and `db_helper.search_quotes`, which ranks the quotes
+by it.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper, db_query, db_stats
+
+GUILD = 909090909090909090
+
+
+async def _seed():
+    for schema in (
+        envs.quote_db_schema,
+        envs.quote_content_db_schema,
+        envs.quote_img_db_schema,
+        envs.quote_blob_db_schema,
+    ):
+        await db_helper.prep_table(schema, guild_id=GUILD)
+    await db_helper.insert_many_all(
+        envs.quote_db_schema,
+        [
+            ("u-1", 1, "quotes", "2026-01-01"),
+            ("u-2", 1, "quotes", "2026-01-02"),
+            ("u-3", 1, "quotes", "2026-01-03"),
+        ],
+        guild_id=GUILD,
+    )
+    # Made after the first comments, so it has to index those too
+    await db_helper.insert_many_all(
+        envs.quote_content_db_schema,
+        [("u-1", 11, 9, "Geir", "Pølser er best med sennep", 0)],
+        guild_id=GUILD,
+    )
+    await db_helper.prep_quote_search(guild_id=GUILD)
+    await db_helper.insert_many_all(
+        envs.quote_content_db_schema,
+        [
+            ("u-2", 21, 9, "Anna", "Sausages, sausages and more sausages", 0),
+            ("u-2", 22, 8, "Ola", "I only wanted a sausage", 1),
+            ("u-3", 31, 7, "Kari", "Nothing about food here", 0),
+        ],
+        guild_id=GUILD,
+    )
+
+
+async def test_search_ranks_and_follows_changes(guild_db_root):
+    await _seed()
+
+    hits = await db_helper.search_quotes("sausage", guild_id=GUILD)
+    assert [hit["uuid"] for hit in hits] == ["u-2"]
+    assert hits[0]["author_backup"] == "Anna"
+    assert "**Sausages**" in hits[0]["snippet"]
+    # Case doesn't matter, and authors are searched too
+    hits = await db_helper.search_quotes("PØLSE", guild_id=GUILD)
+    assert [hit["uuid"] for hit in hits] == ["u-1"]
+    hits = await db_helper.search_quotes("kari", guild_id=GUILD)
+    assert [hit["rowid"] for hit in hits] == [3]
+
+    await db_helper.update_fields(
+        envs.quote_content_db_schema,
+        where=("comment_id", 31),
+        updates=("content_text", "A sausage at last"),
+        guild_id=GUILD,
+    )
+    await db_helper.del_row_by_AND_filter(
+        envs.quote_content_db_schema, where=("uuid", "u-2"), guild_id=GUILD
+    )
+
+    hits = await db_helper.search_quotes("sausage", guild_id=GUILD)
+    assert [hit["uuid"] for hit in hits] == ["u-3"]
+    assert await db_helper.search_quotes("food", guild_id=GUILD) == []
+
+
+async def test_index_is_only_filled_when_made(guild_db_root):
+    await db_helper.prep_table(envs.quote_content_db_schema, guild_id=GUILD)
+    # Searching a guild without the index finds nothing, rather than None
+    assert await db_helper.search_quotes("sausage", guild_id=GUILD) == []
+    await _seed()
+    db_stats.query_stats.reset()
+
+    await db_helper.prep_quote_search(guild_id=GUILD)
+
+    assert not any("rebuild" in shape.sql for shape in db_stats.query_stats.shapes())
+    hits = await db_helper.search_quotes("sausage", guild_id=GUILD)
+    assert [hit["uuid"] for hit in hits] == ["u-2"]
+
+
+async def test_quotes_are_listed_in_search_order(guild_db_root):
+    await _seed()
+
+    quotes = await db_helper.get_imgs_with_quote(
+        envs.quote_content_db_schema, uuids=["u-3", "u-1"], guild_id=GUILD
+    )
+
+    assert [quote["uuid"] for quote in quotes] == ["u-3", "u-1"]
+    assert await db_helper.get_imgs_with_quote(
+        envs.quote_content_db_schema, uuids=[], guild_id=GUILD
+    ) == []
+
+
+def test_typed_text_is_never_fts_syntax():
+    assert db_query.fts_match('"best" OR sau*(') == '"best"* "OR"* "sau"*'
+    assert db_query.fts_match("  -- ") == ""
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_helper.get_random_from_bag`, the shuffle bag the random
+quotes and dilemmas are drawn from, and `add_to_bag`/`remove_from_bag`,
+which keep it in step with the table.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper
+
+GUILD = 888888888888888888
+
+
+async def _seed(ids, posted=()):
+    await db_helper.prep_table(envs.dilemmas_db_schema, guild_id=GUILD)
+    await db_helper.prep_table(envs.dilemmas_db_log_schema, guild_id=GUILD)
+    if ids:
+        await db_helper.insert_many_all(
+            envs.dilemmas_db_schema,
+            [(_id, f"text {_id}") for _id in ids],
+            guild_id=GUILD,
+        )
+    if posted:
+        await db_helper.insert_many_all(
+            envs.dilemmas_db_log_schema, [(_id, "1") for _id in posted], guild_id=GUILD
+        )
+
+
+async def _draw(posted=True):
+    out = await db_helper.get_random_from_bag(
+        envs.dilemmas_db_schema,
+        envs.dilemmas_db_log_schema,
+        envs.dilemmas_bag_db_schema,
+        "id",
+        ("id", "dilemmas_text"),
+        guild_id=GUILD,
+    )
+    if not out:
+        return None
+    if posted:
+        await db_helper.remove_from_bag(
+            envs.dilemmas_bag_db_schema, [out[0][0]], guild_id=GUILD
+        )
+    return out[0][0]
+
+
+async def test_every_row_is_drawn_once_per_round(guild_db_root):
+    ids = [f"d{i}" for i in range(6)]
+    await _seed(ids, posted=["d0", "d1"])
+
+    # The round that was going on when the bag was made is finished first
+    first_round = {await _draw() for _ in range(4)}
+    assert first_round == set(ids) - {"d0", "d1"}
+
+    await db_helper.insert_many_all(
+        envs.dilemmas_db_log_schema, [("d2", "1")], guild_id=GUILD
+    )
+    second_round = [await _draw() for _ in range(6)]
+    assert sorted(second_round) == ids
+    # Starting the round emptied the log
+    log = await db_helper.get_output(envs.dilemmas_db_log_schema, guild_id=GUILD)
+    assert log == []
+
+
+async def test_bag_follows_added_and_deleted_rows(guild_db_root):
+    await _seed(["a", "b"])
+    drawn = [await _draw()]
+
+    await db_helper.insert_many_all(
+        envs.dilemmas_db_schema, [("c", "text c")], guild_id=GUILD
+    )
+    await db_helper.add_to_bag(envs.dilemmas_bag_db_schema, ["c"], guild_id=GUILD)
+    left = {"a", "b", "c"} - set(drawn)
+    gone = sorted(left)[0]
+    await db_helper.remove_from_bag(envs.dilemmas_bag_db_schema, [gone], guild_id=GUILD)
+    await db_helper.del_row_by_AND_filter(
+        envs.dilemmas_db_schema, where=("id", gone), guild_id=GUILD
+    )
+
+    drawn.append(await _draw())
+    assert set(drawn) == {"a", "b", "c"} - {gone}
+
+
+async def test_empty_table_gives_nothing(guild_db_root):
+    await _seed([])
+    # Adding before the bag is made does nothing
+    await db_helper.add_to_bag(envs.dilemmas_bag_db_schema, ["x"], guild_id=GUILD)
+    assert await _draw() is None
+
+
+async def test_a_row_that_was_not_posted_is_drawn_again(guild_db_root):
+    await _seed(["a", "b", "c"])
+
+    failed = await _draw(posted=False)
+
+    assert await _draw() == failed
+    assert {await _draw(), await _draw()} == {"a", "b", "c"} - {failed}
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exercises `db_helper.task_statuses`, the in-memory index of every
+guild's task statuses that the task loops use to find the guilds they
+should process.
+
+All tests use the `guild_db_root` fixture (see conftest.py), so nothing
+here touches real bot data.
+"""
+from sausage_bot.util import envs, db_helper
+
+STARTED = "111111111111111111"
+STOPPED = "222222222222222222"
+PENDING = "333333333333333333"
+
+
+async def _seed():
+    await db_helper.prep_table(envs.guilds_db_schema)
+    await db_helper.insert_many_all(
+        envs.guilds_db_schema,
+        [
+            (STARTED, "Started guild", "approved", None, None, None),
+            (STOPPED, "Stopped guild", "approved", None, None, None),
+            (PENDING, "Pending guild", "pending", None, None, None),
+        ],
+    )
+    for guild_id in (STARTED, STOPPED, PENDING):
+        await db_helper.ensure_guild_tasks_rows(guild_id)
+    for guild_id in (STARTED, PENDING):
+        await db_helper.update_fields(
+            envs.tasks_db_schema,
+            where=[("cog", "rss"), ("task", "post_feeds")],
+            updates=("status", "started"),
+            guild_id=guild_id,
+        )
+
+
+async def _started_ids(cog, task):
+    return [
+        row["guild_id"]
+        for row in await db_helper.task_statuses.started_guilds(cog, task)
+    ]
+
+
+async def test_only_approved_guilds_with_the_task_started(guild_db_root):
+    await _seed()
+
+    assert await _started_ids("rss", "post_feeds") == [STARTED]
+    assert await _started_ids("rss", "post_podcasts") == []
+    assert await db_helper.task_statuses.status(STOPPED, "rss", "post_feeds") == (
+        "stopped"
+    )
+    assert await db_helper.task_statuses.status(STARTED, "rss", "nope") is None
+
+
+async def test_lookups_do_not_query_once_loaded(guild_db_root, monkeypatch):
+    await _seed()
+    await _started_ids("rss", "post_feeds")
+    queries = []
+    real_get_output = db_helper._get_output
+
+    async def counting_get_output(*args, **kwargs):
+        queries.append(args)
+        return await real_get_output(*args, **kwargs)
+
+    monkeypatch.setattr(db_helper, "_get_output", counting_get_output)
+
+    assert await _started_ids("rss", "post_feeds") == [STARTED]
+    assert await _started_ids("youtube", "post_videos") == []
+    assert queries == []
+
+
+async def test_status_changes_are_picked_up(guild_db_root):
+    await _seed()
+    assert await _started_ids("rss", "post_feeds") == [STARTED]
+
+    # What `/tasks` and the cogs' start/stop commands do
+    await db_helper.update_fields(
+        envs.tasks_db_schema,
+        where=[("cog", "rss"), ("task", "post_feeds")],
+        updates=("status", "started"),
+        guild_id=STOPPED,
+    )
+    await db_helper.update_fields(
+        envs.tasks_db_schema,
+        where=[("cog", "rss"), ("task", "post_feeds")],
+        updates=("status", "stopped"),
+        guild_id=STARTED,
+    )
+
+    assert await _started_ids("rss", "post_feeds") == [STOPPED]
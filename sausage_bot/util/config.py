@@ -84,6 +84,62 @@ try:
     RSS_LOOP = env.int("RSS_LOOP", default=10)
     POD_LOOP = env.int("POD_LOOP", default=10)
     FCB_LOOP = env.int("FCB_LOOP", default=60)
+    # How many sqlite connections `db_helper` keeps open at once. Every
+    # guild has about ten database files, so this is a cap on the pool
+    # rather than a target.
+    DB_POOL_SIZE = env.int("DB_POOL_SIZE", default=64)
+    # How many prepared statements each of those connections keeps.
+    # `db_query` makes the query text depend only on the query's shape,
+    # so these get reused instead of parsed anew on every call.
+    DB_STATEMENT_CACHE_SIZE = env.int("DB_STATEMENT_CACHE_SIZE", default=256)
+    # Seconds rows put in `db_helper.write_buffer` (like posted feed links)
+    # may wait before they are written, if nothing writes them sooner
+    DB_WRITE_BUFFER_FLUSH = env.int("DB_WRITE_BUFFER_FLUSH", default=5)
+    # Rows in the feed logs (posted RSS and YouTube links) are kept if they
+    # are among the last LOG_RETENTION_ROWS for their feed, or newer than
+    # LOG_RETENTION_DAYS. 0 turns a rule off, and with both 0 (the default)
+    # nothing is deleted and the maintenance task doesn't run.
+    LOG_RETENTION_ROWS = env.int("LOG_RETENTION_ROWS", default=0)
+    LOG_RETENTION_DAYS = env.int("LOG_RETENTION_DAYS", default=0)
+    # With only LOG_RETENTION_DAYS set, the last LOG_RETENTION_MIN_ROWS of
+    # every feed are kept anyway, so the items of a feed that has been
+    # quiet for longer aren't taken for new and posted again
+    LOG_RETENTION_MIN_ROWS = env.int("LOG_RETENTION_MIN_ROWS", default=50)
+    # How many guilds are set up at the same time when the bot starts
+    GUILD_BOOTSTRAP_CONCURRENCY = env.int("GUILD_BOOTSTRAP_CONCURRENCY", default=8)
+    # Database queries that take at least this many milliseconds are
+    # written to `slow_queries.log`, 0 turns that off
+    DB_SLOW_QUERY_MS = env.int("DB_SLOW_QUERY_MS", default=100)
+    # Hours between each run of the database maintenance task
+    DB_MAINTENANCE_LOOP = env.int("DB_MAINTENANCE_LOOP", default=24)
+    # Hours between each backup of every database to `envs.BACKUP_DIR`,
+    # 0 turns the scheduled backups off. Only the last DB_BACKUP_KEEP
+    # backups are kept.
+    DB_BACKUP_LOOP = env.int("DB_BACKUP_LOOP", default=0)
+    DB_BACKUP_KEEP = env.int("DB_BACKUP_KEEP", default=7)
+    # The shared HTTP session's cap on open connections, in all and per
+    # host, and the seconds a request may take in all
+    HTTP_LIMIT = env.int("HTTP_LIMIT", default=100)
+    HTTP_LIMIT_PER_HOST = env.int("HTTP_LIMIT_PER_HOST", default=8)
+    HTTP_TIMEOUT = env.int("HTTP_TIMEOUT", default=30)
+    # How many feeds are fetched and posted at the same time, in all and
+    # from the same host
+    FEED_CONCURRENCY = env.int("FEED_CONCURRENCY", default=8)
+    FEED_CONCURRENCY_PER_HOST = env.int("FEED_CONCURRENCY_PER_HOST", default=2)
+    # Seconds the hash of a posted page is kept, so the same page isn't
+    # fetched again for every feed and guild it shows up in, and how
+    # many pages' hashes are kept at most. The hashes have to be gone
+    # before the next run of the feed loops, so every run sees the pages
+    # as they are then: by default a minute less than the shortest loop,
+    # and never more than that.
+    _page_hash_max_ttl = max(
+        min(RSS_LOOP, YT_LOOP, POD_LOOP) * 60 - 60,
+        min(RSS_LOOP, YT_LOOP, POD_LOOP) * 30,
+    )
+    PAGE_HASH_TTL = min(
+        env.int("PAGE_HASH_TTL", default=_page_hash_max_ttl), _page_hash_max_ttl
+    )
+    PAGE_HASH_CACHE_SIZE = env.int("PAGE_HASH_CACHE_SIZE", default=2000)
     INVITATION_CHANNEL = env.int("INVITATION_CHANNEL", default="general")
     # Only the credentials the bot cannot start without are checked here.
     # ADMIN_GUILD_ID/ADMIN_CHANNEL_ID are deliberately not: they can just
@@ -120,10 +176,36 @@ for folder in check_and_create_folders:
         os.makedirs(folder)
 
 
+class SausageBot(commands.Bot):
+    """
+    `commands.Bot` that also runs the coroutines registered with
+    `add_close_hook()` when the bot shuts down, while the event loop is
+    still there to await them. Hooks run last registered first, so
+    something registered after the database pool can still use it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.close_hooks = []
+
+    def add_close_hook(self, hook):
+        "Add `hook`, a coroutine function without arguments"
+        self.close_hooks.append(hook)
+
+    async def close(self):
+        await super().close()
+        while self.close_hooks:
+            hook = self.close_hooks.pop()
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"Error in close hook `{hook.__name__}`: {e}")
+
+
 try:
     intents = discord.Intents.all()
     intents.members = True
-    bot = commands.Bot(command_prefix=PREFIX, intents=intents)
+    bot = SausageBot(command_prefix=PREFIX, intents=intents)
 except KeyError as e:
     logger.error(f"Couldn't load basic env: {e}")
     exit()
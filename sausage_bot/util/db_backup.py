@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+db_backup: Back up every database while the bot keeps using them
+
+Each database file is copied with sqlite's online backup API, a few
+pages at a time in a worker thread, so neither the event loop nor the
+bot's own writes to the file have to wait for the copy. The copies are
+then packed in one compressed archive in `envs.BACKUP_DIR`.
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+from sausage_bot.util import envs, config, db_helper
+
+logger = config.logger
+
+# Pages copied per step of the backup API, and the seconds the worker
+# thread waits between steps, holding no lock, so the bot's own writes
+# to the file get in
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.05
+# Every write to the file from another connection starts its copy over,
+# so a file that keeps changing is given up on after this many restarts
+BACKUP_MAX_RESTARTS = 5
+ARCHIVE_PREFIX = "db_backup_"
+
+
+def _backup_file(src: str, dest: str) -> int:
+    "Copy the database `src` to `dest` and return its size. #autodoc skip#"
+    Path(dest).parent.mkdir(parents=True, exist_ok=True)
+    restarts = 0
+    last_remaining = None
+
+    def pause(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # More pages left than after the last step means it started over
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                # Raising here makes `backup()` stop and raise it
+                raise sqlite3.OperationalError(
+                    f"`{src}` kept changing, gave up after {BACKUP_MAX_RESTARTS} "
+                    "restarts"
+                )
+        last_remaining = remaining
+        # The `sleep` of `backup()` only waits after a busy or locked step
+        if remaining:
+            time.sleep(BACKUP_SLEEP)
+
+    source = sqlite3.connect(f"{Path(src).as_uri()}?mode=ro", uri=True)
+    try:
+        with closing(source), closing(sqlite3.connect(dest)) as target:
+            source.backup(target, pages=BACKUP_PAGES, progress=pause)
+    except sqlite3.Error:
+        # Half a copy does not belong in the archive
+        Path(dest).unlink(missing_ok=True)
+        raise
+    return os.path.getsize(dest)
+
+
+def _make_archive(snapshot_dir: Path, archive: Path) -> int:
+    "Pack `snapshot_dir` in `archive` and return its size. #autodoc skip#"
+    with tarfile.open(archive, "w:gz") as tar:
+        for _file in sorted(snapshot_dir.rglob("*.sqlite")):
+            tar.add(_file, arcname=str(_file.relative_to(snapshot_dir)))
+    return os.path.getsize(archive)
+
+
+def db_files() -> list:
+    """
+    Every database file to back up: the bot-wide ones directly in
+    `envs.DB_DIR` (like `guilds.sqlite`) and the ones in each guild's
+    folder
+    """
+    db_dir = Path(envs.DB_DIR)
+    return sorted(db_dir.glob("*.sqlite")) + sorted(db_dir.glob("guild_*/*.sqlite"))
+
+
+def prune_backups(backup_dir: Path, keep: int) -> list:
+    "Delete all but the `keep` newest archives in `backup_dir`"
+    archives = sorted(backup_dir.glob(f"{ARCHIVE_PREFIX}*.tar.gz"))
+    if keep <= 0 or len(archives) <= keep:
+        return []
+    deleted = archives[:-keep]
+    for archive in deleted:
+        logger.info(f"Deleting old backup `{archive.name}`")
+        archive.unlink()
+    return deleted
+
+
+async def backup_all(backup_dir=None) -> dict:
+    """
+    Back up every database in `db_files()` to one archive in
+    `backup_dir` (default `envs.BACKUP_DIR`), and keep the newest
+    `config.DB_BACKUP_KEEP` archives there.
+
+    Returns
+    ------------
+    dict
+        `archive` (path), `bytes` (size of the archive), `seconds`, and
+        `guilds`: `{guild folder or "global": {"files", "bytes",
+        "seconds"}}`, with the uncompressed size of each one's copies
+    """
+    started = time.perf_counter()
+    backup_dir = Path(backup_dir or envs.BACKUP_DIR)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    # Rows still waiting in the write buffer belong in the backup too
+    await db_helper.write_buffer.flush()
+    db_dir = Path(envs.DB_DIR)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    archive = backup_dir / f"{ARCHIVE_PREFIX}{stamp}.tar.gz"
+    guilds = {}
+    snapshot_dir = Path(tempfile.mkdtemp(prefix="snapshot_", dir=backup_dir))
+    try:
+        for db_file in db_files():
+            rel_path = db_file.relative_to(db_dir)
+            owner = rel_path.parts[0] if len(rel_path.parts) > 1 else "global"
+            file_started = time.perf_counter()
+            try:
+                size = await asyncio.to_thread(
+                    _backup_file, str(db_file), str(snapshot_dir / rel_path)
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Could not back up `{db_file}`: {e}")
+                continue
+            stats = guilds.setdefault(owner, {"files": 0, "bytes": 0, "seconds": 0})
+            stats["files"] += 1
+            stats["bytes"] += size
+            stats["seconds"] += time.perf_counter() - file_started
+        archive_bytes = await asyncio.to_thread(_make_archive, snapshot_dir, archive)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    for owner, stats in guilds.items():
+        logger.info(
+            f"Backed up {stats['files']} files ({stats['bytes']} bytes) for "
+            f"`{owner}` in {stats['seconds']:.2f}s"
+        )
+    prune_backups(backup_dir, config.DB_BACKUP_KEEP)
+    report = {
+        "archive": archive,
+        "bytes": archive_bytes,
+        "seconds": time.perf_counter() - started,
+        "guilds": guilds,
+    }
+    logger.info(
+        f"Backup `{archive.name}` done: {report['bytes']} bytes "
+        f"in {report['seconds']:.2f}s"
+    )
+    return report
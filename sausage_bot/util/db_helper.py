@@ -3,15 +3,24 @@
 "db_helper: Helper functions for database handling"
 
 import aiosqlite
+import asyncio
+import base64
+import binascii
+import contextvars
+import copy
+import hashlib
+import os
 from uuid import uuid4
 import re
 from pathlib import Path
+from collections import OrderedDict
 from discord.utils import get
 from contextlib import asynccontextmanager
 
 from pprint import pformat
 
 from sausage_bot.util import envs, config, file_io, discord_commands, guild_context
+from sausage_bot.util import db_query, db_stats
 from sausage_bot.util.i18n import I18N
 from sausage_bot.util.args import args
 from .datetime_handling import get_dt
@@ -19,6 +28,489 @@ from .datetime_handling import get_dt
 logger = config.logger
 
 
+class ConnectionPool:
+    """
+    Long-lived aiosqlite connections, one per database file, keyed by the
+    path `envs.resolve_db_file()` gives. Every guild has about ten
+    database files, so only `max_connections` are kept open and the
+    least recently used idle one is closed to make room for a new one.
+
+    Each connection is lent to one caller at a time (see `connect()`), so
+    a caller's statements and commit are never interleaved with another
+    coroutine's on the same file.
+    #autodoc skip#
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        # db_file -> aiosqlite.Connection, least recently used first
+        self._connections = OrderedDict()
+        self._locks = {}
+        self._users = {}
+        self._loop = None
+
+    def _forget_loop_connections(self):
+        """
+        aiosqlite hands its results back to the event loop that is
+        running when a statement is queued, but a lock is bound to the
+        loop it was first waited on. If the loop has been replaced (a new
+        `asyncio.run()`, or every test in the test suite) the old locks
+        are useless, so stop the old connections and start over.
+        """
+        for db in self._connections.values():
+            db.stop()
+        self._connections.clear()
+        self._locks.clear()
+        self._users.clear()
+
+    async def _evict_idle(self):
+        "Close least recently used idle connections until there is room"
+        for db_file in list(self._connections):
+            if len(self._connections) <= self.max_connections:
+                break
+            if self._users.get(db_file, 0) > 0:
+                continue
+            logger.debug(f"Closing idle connection to `{db_file}`")
+            db = self._connections.pop(db_file)
+            self._locks.pop(db_file, None)
+            self._users.pop(db_file, None)
+            await db.close()
+
+    @asynccontextmanager
+    async def borrow(self, db_file: str):
+        "Get exclusive use of the connection to `db_file`, opening it if needed"
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._forget_loop_connections()
+            self._loop = loop
+        lock = self._locks.setdefault(db_file, asyncio.Lock())
+        self._users[db_file] = self._users.get(db_file, 0) + 1
+        try:
+            async with lock:
+                db = self._connections.get(db_file)
+                if db is None:
+                    logger.debug(f"Opening connection to `{db_file}`")
+                    db = await aiosqlite.connect(
+                        db_file, cached_statements=config.DB_STATEMENT_CACHE_SIZE
+                    )
+                    try:
+                        await apply_pragmas(db, db_file)
+                    except aiosqlite.Error:
+                        await db.close()
+                        raise
+                    self._connections[db_file] = db
+                else:
+                    self._connections.move_to_end(db_file)
+                # A previous borrower may have left its row factory behind
+                db.row_factory = None
+                yield db
+        finally:
+            self._users[db_file] = self._users.get(db_file, 1) - 1
+            if db_file in self._connections:
+                await self._evict_idle()
+
+    async def close_all(self):
+        "Close every open connection, e.g. when the bot shuts down"
+        connections = list(self._connections.items())
+        self._connections.clear()
+        self._locks.clear()
+        self._users.clear()
+        for db_file, db in connections:
+            logger.debug(f"Closing connection to `{db_file}`")
+            try:
+                await db.close()
+            except Exception as e:
+                logger.error(f"Error when closing `{db_file}`: {e}")
+
+
+async def apply_pragmas(db, db_file: str):
+    """
+    Apply the pragmas `envs.resolve_db_pragmas()` has for `db_file` to a
+    newly opened connection. `busy_timeout` goes first so that switching
+    the journal mode waits for a lock instead of failing on one.
+    """
+    pragmas = envs.resolve_db_pragmas(db_file)
+    if "busy_timeout" in pragmas:
+        pragmas = {"busy_timeout": pragmas.pop("busy_timeout"), **pragmas}
+    for pragma, value in pragmas.items():
+        if pragma == "journal_mode" and args.not_write_database:
+            # The journal mode is stored in the database file itself
+            logger.debug("`not_write_database` activated")
+            continue
+        _cmd = f"PRAGMA {pragma} = {value}"
+        logger.debug(f"Using this query: {_cmd}")
+        await db.execute(_cmd)
+
+
+pool = ConnectionPool(max_connections=config.DB_POOL_SIZE)
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer for rows to append to a table, kept per database
+    file (and thereby per guild). Instead of one commit per row, the
+    rows are written in one transaction when `flush` is called, when
+    `flush_interval` seconds have passed since the first buffered row,
+    or when the bot shuts down.
+
+    Buffered rows still count as written: anything else that uses the
+    database file through `connect` writes them first, and `get_output`
+    includes the ones matching a plain `where` without writing them.
+
+    In a table with a `primary` key, a buffered row replaces the one with
+    the same key, like `INSERT OR REPLACE`.
+    """
+
+    def __init__(self, flush_interval: int):
+        self.flush_interval = flush_interval
+        # {db_file: {table_name: [row, ...]}}
+        self._rows = {}
+        # {(db_file, table_name): index of the primary key column}
+        self._keys = {}
+        self._timer = None
+
+    def add(self, template_info, inserts: list, guild_id=None):
+        "Buffer `inserts` for `template_info`'s table"
+        db_file = envs.resolve_db_file(template_info, guild_id)
+        table_name = template_info["name"]
+        rows = self._rows.setdefault(db_file, {}).setdefault(table_name, [])
+        inserts = [tuple(insert) for insert in inserts]
+        if template_info.get("primary"):
+            cols = [item[0] for item in template_info["items"]]
+            key = cols.index(template_info["primary"])
+            self._keys[(db_file, table_name)] = key
+            replaced = {insert[key] for insert in inserts}
+            rows[:] = [row for row in rows if row[key] not in replaced]
+        rows.extend(inserts)
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def has_rows(self, db_file: str) -> bool:
+        "#autodoc skip#"
+        return db_file in self._rows
+
+    def pending(self, template_info, guild_id=None) -> list:
+        "Buffered rows for `template_info`'s table, as tuples"
+        db_file = envs.resolve_db_file(template_info, guild_id)
+        return list(self._rows.get(db_file, {}).get(template_info["name"], []))
+
+    def matching(self, template_info, where=(), select=(), guild_id=None) -> list:
+        """
+        Buffered rows for `template_info`'s table where every `where`
+        condition is met, as dicts with the `select`ed columns - like
+        `get_output` would return them once written.
+        """
+        cols = [item[0] for item in template_info["items"]]
+        if isinstance(select, str):
+            select = (select,)
+        select = select or cols
+        conditions = db_query.as_items(where) if where else []
+        out = []
+        for row in self.pending(template_info, guild_id):
+            row = dict(zip(cols, row))
+            if all(
+                db_query.as_text(row.get(col)) == db_query.as_text(value)
+                for col, value in conditions
+            ):
+                out.append({col: row[col] for col in select})
+        return out
+
+    async def write(self, db, db_file: str) -> bool:
+        """
+        Write and commit the rows buffered for `db_file` with the open
+        connection `db`. They stay in the buffer until the commit is
+        done, so if writing fails or is cancelled they are rolled back
+        and kept for the next try. A failed write is logged, not raised
+        to whatever read happened to trigger it.
+        #autodoc skip#
+        """
+        # Rows added while this awaits are left for the next write
+        tables = {
+            table_name: list(rows)
+            for table_name, rows in self._rows.get(db_file, {}).items()
+        }
+        try:
+            for table_name, rows in tables.items():
+                verb = "INSERT"
+                if (db_file, table_name) in self._keys:
+                    verb = "INSERT OR REPLACE"
+                _cmd = "{} INTO {} VALUES({})".format(
+                    verb, table_name, ", ".join("?" * len(rows[0]))
+                )
+                logger.debug(f"Using this query for {len(rows)} rows: {_cmd}")
+                await db.executemany(_cmd, rows)
+            await db.commit()
+        except BaseException as e:
+            if db.in_transaction:
+                await db.rollback()
+            if not isinstance(e, aiosqlite.Error):
+                raise
+            logger.error(f"Error when writing buffered rows to `{db_file}`: {e}")
+            return False
+        self._forget(db_file, tables)
+        return True
+
+    def _forget(self, db_file: str, tables: dict):
+        "Drop the written rows, but not the ones added since. #autodoc skip#"
+        buffered = self._rows.get(db_file, {})
+        for table_name, rows in tables.items():
+            # The written rows that no newer row replaced come first, in
+            # order, and the rows added since come after them
+            left = buffered.get(table_name, [])
+            written = 0
+            for row in rows:
+                if written < len(left) and left[written] is row:
+                    written += 1
+            if left[written:]:
+                buffered[table_name] = left[written:]
+            else:
+                buffered.pop(table_name, None)
+        if not buffered:
+            self._rows.pop(db_file, None)
+
+    async def flush(self, db_file: str = None):
+        "Write the buffered rows for `db_file`, or for all files"
+        db_files = [db_file] if db_file is not None else list(self._rows)
+        for _file in db_files:
+            if not self.has_rows(_file):
+                continue
+            async with connect(_file, write_buffered=False) as db:
+                await self.write(db, _file)
+
+    async def _flush_later(self):
+        "#autodoc skip#"
+        # The task got a copy of the context of whatever buffered the
+        # first row, which may have been in a `transaction()` that is
+        # long gone by now
+        active_transactions.set({})
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def cancel_timer(self):
+        "#autodoc skip#"
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        self._timer = None
+
+
+write_buffer = WriteBuffer(flush_interval=config.DB_WRITE_BUFFER_FLUSH)
+
+
+@asynccontextmanager
+async def connect(db_file: str, write_buffered: bool = True):
+    """
+    Use the pooled connection to `db_file` for the duration of the
+    with-block. Whatever the block changed is committed when it exits
+    cleanly and rolled back if it raises.
+
+    Rows in `write_buffer` for `db_file` are written and committed
+    first, unless `write_buffered` is False.
+
+    Usage:
+        async with connect(db_file) as db:
+            await db.execute(_cmd)
+    """
+    tx = active_transactions.get().get(db_file)
+    if tx is not None:
+        # Part of a `transaction()`, which commits or rolls back
+        tx.db.row_factory = None
+        timed = db_stats.TimedConnection(tx.db, db_file)
+        try:
+            yield timed
+        except BaseException as e:
+            # The helpers log and swallow their errors, so note it for
+            # the transaction to roll back on
+            tx.error = tx.error or e
+            raise
+        finally:
+            timed.finish()
+        return
+    async with pool.borrow(db_file) as db:
+        if write_buffered and write_buffer.has_rows(db_file):
+            await write_buffer.write(db, db_file)
+        timed = db_stats.TimedConnection(db, db_file)
+        try:
+            yield timed
+        except BaseException:
+            if db.in_transaction:
+                await db.rollback()
+            raise
+        finally:
+            timed.finish()
+        if db.in_transaction:
+            await db.commit()
+
+
+class SettingsCache:
+    """
+    In-memory copy of what `get_output` returned for the schemas marked
+    `cached` in envs (the settings tables), per database file - and
+    thereby per guild - and table. These are read on almost every
+    operation and hardly ever change.
+
+    Every helper that writes to a table drops what is cached for it.
+    """
+
+    def __init__(self):
+        # {(db_file, table_name): {query key: output}}
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db_file: str, table_name: str, key: str):
+        "Cached output for `key`, or None"
+        out = self._cache.get((db_file, table_name), {}).get(key)
+        if out is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # The callers are free to change what they get
+        return copy.deepcopy(out)
+
+    def set(self, db_file: str, table_name: str, key: str, out):
+        "#autodoc skip#"
+        self._cache.setdefault((db_file, table_name), {})[key] = copy.deepcopy(out)
+
+    def invalidate(self, db_file: str, table_name: str = None):
+        "Drop what is cached for `table_name` in `db_file`, or the whole file"
+        for cache_key in list(self._cache):
+            if cache_key[0] == db_file and table_name in (None, cache_key[1]):
+                del self._cache[cache_key]
+
+    def clear(self):
+        "#autodoc skip#"
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        "Hits, misses and number of cached tables"
+        return {"hits": self.hits, "misses": self.misses, "tables": len(self._cache)}
+
+
+settings_cache = SettingsCache()
+
+
+def invalidate_cache(template_info, guild_id=None):
+    """
+    Drop cached output for `template_info`'s table, and mark the guild
+    registry as stale if that is what changed.
+    #autodoc skip#
+    """
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    settings_cache.invalidate(db_file, template_info["name"])
+    if db_file == envs.resolve_db_file(envs.guilds_db_schema):
+        guild_registry.invalidate()
+    elif Path(db_file).name == envs.tasks_db_schema["db_file"]:
+        task_statuses.invalidate(guild_id)
+
+
+class Transaction:
+    """
+    A transaction on one database file, as given by `transaction()`.
+    `db` is the connection every helper uses for that file inside the
+    with-block, and `error` the first error any of them ran into.
+    """
+
+    def __init__(self, db, db_file: str):
+        self.db = db
+        self.db_file = db_file
+        self.error = None
+
+
+# {db_file: Transaction} for the transactions open in this context
+active_transactions = contextvars.ContextVar("active_transactions", default={})
+
+# The database folders and `(db_file, table)`s known to exist, so reads
+# don't have to ask the file system or the database again. Tables are
+# only added once they are committed.
+known_folders = set()
+known_tables = set()
+
+
+def forget_known_tables():
+    "Forget which database folders and tables are known to exist"
+    known_folders.clear()
+    known_tables.clear()
+
+
+def ensure_db_folder(db_file: str):
+    "#autodoc skip#"
+    folder = os.path.dirname(db_file)
+    if folder not in known_folders:
+        file_io.ensure_folder(folder)
+        known_folders.add(folder)
+
+
+@asynccontextmanager
+async def transaction(template_info, guild_id=None):
+    """
+    Run everything the helpers do to `template_info`'s database file in
+    the with-block as one transaction, on one connection. It is
+    committed when the block exits, or rolled back if the block raises
+    or any of the helpers in it ran into an error - in which case that
+    error is raised.
+
+    Other schemas in the same database file are part of the
+    transaction as well.
+
+    Usage:
+        async with db_helper.transaction(envs.quote_db_schema, guild_id):
+            await db_helper.del_row_by_AND_filter(...)
+            await db_helper.del_row_id(...)
+    """
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    tx = active_transactions.get().get(db_file)
+    if tx is not None:
+        # Already in a transaction on this file, so just be part of it
+        yield tx
+        return
+    async with pool.borrow(db_file) as db:
+        if write_buffer.has_rows(db_file):
+            await write_buffer.write(db, db_file)
+        tx = Transaction(db, db_file)
+        token = active_transactions.set({**active_transactions.get(), db_file: tx})
+        try:
+            if not args.not_write_database:
+                await db.execute("BEGIN")
+            yield tx
+        except BaseException:
+            if db.in_transaction:
+                await db.rollback()
+            raise
+        finally:
+            active_transactions.reset(token)
+            # Whatever was read in the transaction may have been rolled back
+            settings_cache.invalidate(db_file)
+            if db_file == envs.resolve_db_file(envs.guilds_db_schema):
+                guild_registry.invalidate()
+            elif Path(db_file).name == envs.tasks_db_schema["db_file"]:
+                task_statuses.invalidate()
+        if tx.error is not None:
+            logger.error(f"Rolling back transaction on `{db_file}`: {tx.error}")
+            if db.in_transaction:
+                await db.rollback()
+            raise tx.error
+        if db.in_transaction:
+            await db.commit()
+
+
+async def close_connections():
+    """
+    Write any buffered rows and close all pooled database connections.
+    Registered as a bot close hook.
+    """
+    write_buffer.cancel_timer()
+    await write_buffer.flush()
+    await pool.close_all()
+    settings_cache.clear()
+    guild_registry.invalidate()
+    task_statuses.invalidate()
+
+
+async def flush_buffered_inserts():
+    "Write all rows buffered by `insert_buffered`, e.g. at the end of a task"
+    await write_buffer.flush()
+
+
 @asynccontextmanager
 async def guild_locale_context(guild_id):
     """
@@ -47,6 +539,139 @@ async def guild_locale_context(guild_id):
         guild_context.current_timezone.reset(tz_token)
 
 
+class GuildRegistry:
+    """
+    In-memory copy of the guild registry (`envs.guilds_db_schema`), so
+    checking a guild's status doesn't need a query.
+
+    It is loaded in `on_ready`. Everything that changes a guild's status
+    (`register_guild`, `/approve-guild`, `/leave-guild`,
+    `on_guild_remove`) writes to the registry through the helpers here,
+    and every such write marks the copy as stale, so the next lookup
+    reloads it.
+    """
+
+    def __init__(self):
+        # {guild_id (str): registry row}
+        self._guilds = None
+        self._db_file = None
+
+    async def load(self):
+        "(Re)load the registry from the database"
+        self._db_file = envs.resolve_db_file(envs.guilds_db_schema)
+        rows = await _get_output(envs.guilds_db_schema)
+        self._guilds = {str(row["guild_id"]): row for row in rows or []}
+        logger.debug(f"Loaded {len(self._guilds)} guilds into the guild registry")
+
+    def invalidate(self):
+        "#autodoc skip#"
+        self._guilds = None
+
+    async def _guilds_loaded(self) -> dict:
+        "#autodoc skip#"
+        if self._guilds is None or self._db_file != envs.resolve_db_file(
+            envs.guilds_db_schema
+        ):
+            await self.load()
+        return self._guilds
+
+    async def status(self, guild_id) -> str | None:
+        "The registry status of `guild_id`, or None if it isn't registered"
+        row = (await self._guilds_loaded()).get(str(guild_id))
+        return row["status"] if row else None
+
+    async def approved(self) -> list:
+        "Registry rows for all approved guilds"
+        return [
+            dict(row)
+            for row in (await self._guilds_loaded()).values()
+            if row["status"] == "approved"
+        ]
+
+
+guild_registry = GuildRegistry()
+
+
+class TaskStatusIndex:
+    """
+    In-memory index of every guild's `envs.tasks_db_schema` rows, as
+    `{guild_id: {(cog, task): status}}`, so the task loops don't have to
+    open each guild's tasks database on every tick.
+
+    A guild's rows are read the first time they're needed. Every helper
+    write to a guild's tasks table (`/tasks`, `control_posting`, the
+    cogs' own start/stop commands) drops that guild from the index, so
+    it is read again on the next lookup.
+    """
+
+    def __init__(self):
+        self._statuses = {}
+
+    async def _guild_statuses(self, guild_id) -> dict:
+        "#autodoc skip#"
+        guild_id = str(guild_id)
+        if guild_id not in self._statuses:
+            rows = await _get_output(
+                envs.tasks_db_schema,
+                select=("cog", "task", "status"),
+                guild_id=guild_id,
+            )
+            # No tasks table yet counts as every task being stopped
+            self._statuses[guild_id] = {
+                (row["cog"], row["task"]): row["status"] for row in rows or []
+            }
+        return self._statuses[guild_id]
+
+    async def status(self, guild_id, cog: str, task: str) -> str | None:
+        "The status of `cog`'s `task` in `guild_id`, or None if it has no row"
+        return (await self._guild_statuses(guild_id)).get((cog, task))
+
+    async def started_guilds(self, cog: str, task: str) -> list:
+        "Registry rows for the approved guilds where `cog`'s `task` is started"
+        return [
+            guild_row
+            for guild_row in await guild_registry.approved()
+            if await self.status(guild_row["guild_id"], cog, task) == "started"
+        ]
+
+    def invalidate(self, guild_id=None):
+        "Drop `guild_id`'s statuses, or everything. #autodoc skip#"
+        if guild_id is None:
+            self._statuses.clear()
+        else:
+            self._statuses.pop(str(guild_id), None)
+
+
+task_statuses = TaskStatusIndex()
+
+
+async def for_each_guild(guilds, func, limit: int = None) -> list:
+    """
+    Await `func(guild)` for every item in `guilds` (guild objects or
+    registry rows), at most `limit` at a time, by default
+    `config.GUILD_BOOTSTRAP_CONCURRENCY`. An exception in one guild is
+    logged and doesn't stop the others.
+
+    Returns
+    ------------
+    list
+        What each `func(guild)` returned, in the order of `guilds`, with
+        None for the ones that failed
+    """
+    semaphore = asyncio.Semaphore(max(1, limit or config.GUILD_BOOTSTRAP_CONCURRENCY))
+
+    async def _run(guild):
+        async with semaphore:
+            try:
+                return await func(guild)
+            except Exception as e:
+                guild_id = guild["guild_id"] if isinstance(guild, dict) else guild.id
+                logger.error(f"`{func.__name__}` failed for guild {guild_id}: {e}")
+                return None
+
+    return await asyncio.gather(*(_run(guild) for guild in guilds))
+
+
 async def is_guild_approved(guild_id) -> bool:
     """
     Check the guild registry for whether `guild_id` is approved. Used by
@@ -55,10 +680,7 @@ async def is_guild_approved(guild_id) -> bool:
     stay inactive until it's been approved via /approve-guild.
     #autodoc skip#
     """
-    row = await get_output(
-        envs.guilds_db_schema, where=("guild_id", str(guild_id)), single=True
-    )
-    return bool(row) and row.get("status") == "approved"
+    return await guild_registry.status(guild_id) == "approved"
 
 
 async def ensure_guild_tasks_rows(guild_id) -> None:
@@ -94,7 +716,7 @@ async def ensure_guild_tasks_rows(guild_id) -> None:
 
 def db_exist(db_file_in, guild_id=None):
     db_path = envs.resolve_db_file(db_file_in, guild_id)
-    file_io.ensure_folder(Path(db_path).parent)
+    ensure_db_folder(db_path)
     try:
         file_io.file_exist(db_path)
         return True
@@ -105,18 +727,22 @@ def db_exist(db_file_in, guild_id=None):
 
 async def table_exist(template_info, guild_id=None):
     db_file = envs.resolve_db_file(template_info, guild_id)
-    logger.info(f"Opening `{db_file}`")
     table_name = template_info["name"]
-    async with aiosqlite.connect(db_file) as db:
+    if (db_file, table_name) in known_tables:
+        return True
+    logger.info(f"Opening `{db_file}`")
+    async with connect(db_file) as db:
         out = await db.execute(f"PRAGMA table_info({table_name})")
         out = await out.fetchall()
+    if len(out) > 0 and db_file not in active_transactions.get():
+        known_tables.add((db_file, table_name))
     return len(out) > 0
 
 
 async def prep_table(table_in, inserts: list = [], guild_id=None):
     logger.debug(f"Got `table_in`: {table_in}")
     db_file = envs.resolve_db_file(table_in, guild_id)
-    file_io.ensure_folder(Path(db_file).parent)
+    ensure_db_folder(db_file)
     table_name = table_in["name"]
     item_list = table_in["items"]
     _cmd = """CREATE TABLE IF NOT EXISTS {} (""".format(table_name)
@@ -136,18 +762,59 @@ async def prep_table(table_in, inserts: list = [], guild_id=None):
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
+            async with connect(db_file) as db:
                 await db.execute(_cmd)
                 logger.debug(f"Changed {db.total_changes} rows")
+            invalidate_cache(table_in, guild_id)
+            if db_file not in active_transactions.get():
+                known_tables.add((db_file, table_name))
         except aiosqlite.OperationalError as e:
             logger.error(f"Error: {e}")
             return None
+    await prep_indexes(table_in, guild_id=guild_id)
     delete_json_ok = False
     if len(inserts) > 0:
         await add_missing_db_setup(table_in, guild_id=guild_id)
     return delete_json_ok
 
 
+def index_name(table_name: str, cols: list) -> str:
+    "Name of the index on `cols` in `table_name`. #autodoc skip#"
+    return "{}_{}_idx".format(table_name, "_".join(cols))
+
+
+async def prep_indexes(template_info, guild_id=None):
+    """
+    Create the indexes listed in `template_info["indexes"]` if they
+    don't exist yet. Each index is a list of the columns it covers, in
+    order.
+
+    An index on a column an older database doesn't have yet is skipped
+    with a warning, and created once `add_missing_db_setup` has added
+    the column.
+    """
+    indexes = template_info.get("indexes", [])
+    if len(indexes) == 0:
+        return
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    table_name = template_info["name"]
+    async with connect(db_file) as db:
+        for cols in indexes:
+            _cmd = "CREATE INDEX IF NOT EXISTS {} ON {} ({});".format(
+                index_name(table_name, cols), table_name, ", ".join(cols)
+            )
+            logger.debug(f"Using this query: {_cmd}")
+            try:
+                await db.execute(_cmd)
+            except aiosqlite.OperationalError as e:
+                logger.warning(
+                    f"Could not create index on `{table_name}` in {db_file}: {e}"
+                )
+
+
 async def add_missing_db_setup(template_info, dict_in: dict = None, guild_id=None):
     logger.debug(f"Received `template_info`:\n{pformat(template_info)}")
     db_file = envs.resolve_db_file(template_info, guild_id)
@@ -162,12 +829,12 @@ async def add_missing_db_setup(template_info, dict_in: dict = None, guild_id=Non
     logger.debug(f"dict_in is: {dict_in}")
     wanted_cols = template_info["items"]
     table_info = f"PRAGMA table_info({table_name})"
-    async with aiosqlite.connect(db_file) as db:
+    async with connect(db_file) as db:
         db_out = await db.execute(table_info)
         existing_cols = await db_out.fetchall()
         _existing_cols = [col[1] for col in existing_cols]
         logger.debug(f"_existing_cols: {_existing_cols}")
-    async with aiosqlite.connect(db_file) as db:
+    async with connect(db_file) as db:
         row_ids = await db.execute(f"SELECT rowid FROM {table_name}")
         row_ids = await row_ids.fetchall()
     _existing_cols = [col[1] for col in existing_cols]
@@ -177,18 +844,22 @@ async def add_missing_db_setup(template_info, dict_in: dict = None, guild_id=Non
             if col_in[0] not in _existing_cols:
                 logger.debug(f"Adding {col_in[0]}")
                 dict_in[table_name].append(col_in)
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             for col in dict_in[table_name]:
                 _cmd = f"ALTER TABLE {table_name} ADD COLUMN {col[0]};"
                 logger.debug(f"Using this query: {_cmd}")
                 await db.execute(_cmd)
+        invalidate_cache(template_info, guild_id)
+        if len(dict_in[table_name]) > 0:
+            await prep_indexes(template_info, guild_id=guild_id)
         # Remove cols if they are not wanted anymore
         del_cols = [x for x in _existing_cols if x not in [x[0] for x in wanted_cols]]
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             for col in del_cols:
                 _cmd = f"ALTER TABLE {table_name} DROP COLUMN {col};"
                 logger.debug(f"Using this query: {_cmd}")
                 await db.execute(_cmd)
+        invalidate_cache(template_info, guild_id)
     # Add existing inserts in columns where they don't exist yet
     temp_inserts = []
     if inserts is not None and len(inserts) > 0:
@@ -231,7 +902,7 @@ async def find_cols(template_info, cols_find: list = None, guild_id=None):
     logger.debug(f"Got `db_file`: {db_file}")
     logger.debug(f"Got `table_name`: {table_name}")
     table_info = f"PRAGMA table_info({table_name})"
-    async with aiosqlite.connect(db_file) as db:
+    async with connect(db_file) as db:
         db_out = await db.execute(table_info)
         search_out = await db_out.fetchall()
     _cols = [col[1] for col in search_out]
@@ -252,12 +923,12 @@ async def remove_cols(template_info, cols_remove: list = None, guild_id=None):
     else:
         _cmd = "ALTER TABLE {} DROP COLUMN {};"
         try:
-            async with aiosqlite.connect(db_file) as db:
+            async with connect(db_file) as db:
                 for col_in in cols_remove:
                     __cmd = _cmd.format(table_name, col_in)
                     logger.debug(f"Using this query: {__cmd}")
                     await db.execute(__cmd)
-                await db.commit()
+            invalidate_cache(template_info, guild_id)
         except aiosqlite.OperationalError as e:
             logger.error(f"Error: {e}")
             return
@@ -543,7 +1214,7 @@ async def db_remove_old_cols(template_info, guild_id=None):
         logger.debug(f"Got `db_file`: {db_file}")
         logger.debug(f"Got `table_name`: {table_name}")
         table_info = f"PRAGMA table_info({table_name})"
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             db_out = await db.execute(table_info)
             list_out = await db_out.fetchall()
         return [col[1] for col in list_out] if list_out is not None else None
@@ -559,6 +1230,52 @@ async def db_remove_old_cols(template_info, guild_id=None):
     await remove_cols(template_info, cols_to_remove, guild_id=guild_id)
 
 
+async def db_quote_imgs_to_blobs(guild_id=None):
+    """
+    Move the images in `quote_img`'s old `base64` column to
+    `quote_blob`, stored once per content, and drop the column. Does
+    nothing once that is done.
+    #autodoc skip#
+    """
+    template_info = envs.quote_img_db_schema
+    old_cols = await find_cols(template_info, ["base64", "sha256"], guild_id=guild_id)
+    if "base64" not in old_cols:
+        return
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return
+    await prep_table(envs.quote_blob_db_schema, guild_id=guild_id)
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    logger.info(f"Moving quote images in `{db_file}` to `quote_blob`")
+    async with connect(db_file) as db:
+        if "sha256" not in old_cols:
+            await db.execute("ALTER TABLE quote_img ADD COLUMN sha256 TEXT")
+        out = await db.execute("SELECT rowid FROM quote_img WHERE base64 IS NOT NULL")
+        row_ids = [row[0] for row in await out.fetchall()]
+        # One image at a time, there may be a lot of them
+        for row_id in row_ids:
+            out = await db.execute(
+                "SELECT base64 FROM quote_img WHERE rowid = ?", (row_id,)
+            )
+            b64_img = (await out.fetchone())[0]
+            try:
+                img = base64.b64decode(b64_img, validate=True)
+            except (binascii.Error, ValueError) as e:
+                logger.error(f"Invalid Base64 string in quote_img row {row_id}: {e}")
+                continue
+            sha256 = hashlib.sha256(img).hexdigest()
+            await db.execute(
+                "INSERT OR IGNORE INTO quote_blob VALUES (?, ?, ?)",
+                (sha256, len(img), img),
+            )
+            await db.execute(
+                "UPDATE quote_img SET sha256 = ? WHERE rowid = ?", (sha256, row_id)
+            )
+        await db.execute("ALTER TABLE quote_img DROP COLUMN base64")
+    invalidate_cache(template_info, guild_id)
+    logger.info(f"Moved {len(row_ids)} quote images")
+
+
 async def json_to_db_inserts(cog_name):
     """
     This is a cleanup function to be used for converting from old json
@@ -821,13 +1538,13 @@ async def insert_many_all(template_info, inserts: tuple = None, guild_id=None):
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
+            async with connect(db_file) as db:
                 if input_singles:
                     await db.execute(_cmd, inserts)
                 elif input_multiples:
                     await db.executemany(_cmd, inserts)
-                await db.commit()
                 logger.debug("Changed {} rows".format(db.total_changes))
+            invalidate_cache(template_info, guild_id)
             logger.debug("Done and commited!")
             return True
         except aiosqlite.OperationalError as e:
@@ -835,6 +1552,28 @@ async def insert_many_all(template_info, inserts: tuple = None, guild_id=None):
             return False
 
 
+async def insert_buffered(template_info, inserts: list = None, guild_id=None):
+    """
+    Like `insert_many_all`, but the rows are put in `write_buffer` and
+    written together with other buffered rows for the same database
+    file, in one transaction. Meant for append-only logs.
+
+    Parameters
+    ------------
+    template_info: dict
+        dict info about the table from envs file
+    inserts: list(list)
+        The rows to insert, with a value for every column
+    """
+    if inserts is None or len(inserts) == 0:
+        logger.error("Missing inserts")
+        return None
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return None
+    write_buffer.add(template_info, inserts, guild_id=guild_id)
+
+
 async def insert_many_some(
     template_info, rows: tuple = None, inserts: list = None, guild_id=None
 ):
@@ -883,10 +1622,10 @@ async def insert_many_some(
         if input_singles:
             inserts = [inserts]
         try:
-            async with aiosqlite.connect(db_file) as db:
+            async with connect(db_file) as db:
                 await db.executemany(_cmd, inserts)
-                await db.commit()
                 logger.debug("Changed {} rows".format(db.total_changes))
+            invalidate_cache(template_info, guild_id)
         except aiosqlite.OperationalError as e:
             logger.error(f"Error: {e}")
             return None
@@ -922,11 +1661,11 @@ async def insert_single(
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
+            async with connect(db_file) as db:
                 await db.execute(_cmd, insert)
-                await db.commit()
                 logger.debug("Changed {} rows".format(db.total_changes))
                 last_row = db.lastinsertrow
+            invalidate_cache(template_info, guild_id)
             logger.debug("Done and commited!")
             return last_row
         except aiosqlite.OperationalError as e:
@@ -979,42 +1718,24 @@ async def update_fields(template_info, where=None, updates: list = None, guild_i
     if updates is None:
         logger.error("Missing updates")
         return
-    _cmd = f"UPDATE {table_name} SET "
     if isinstance(updates, dict):
         logger.debug("`updates` is dict")
-        for update in updates:
-            logger.debug(f"Got `update`: {update}")
-            _cmd += "{} = CASE".format(update)
-            for _item in updates[update]:
-                _cmd += " WHEN {} = '{}' THEN '{}'".format(_item[0], _item[1], _item[2])
-            _cmd += " ELSE {} END".format(update)
-            if update != list(updates)[-1]:
-                _cmd += ", "
+        _set, params = db_query.set_values(updates)
+        _cmd = f"UPDATE {table_name} SET {_set}"
     elif isinstance(updates, (list, tuple)):
         logger.debug("`updates` is list or tuple")
-        if isinstance(updates[0], (str, int)):
-            _cmd += "{} = '{}'".format(updates[0], updates[1])
-        elif isinstance(updates[0], (list, tuple)):
-            for update in updates:
-                _cmd += "{} = '{}'".format(update[0], update[1])
-                if update != updates[-1]:
-                    _cmd += ", "
-        if isinstance(where, tuple):
-            _cmd += f" WHERE {where[0]} = '{where[1]}'"
-        elif isinstance(where, list):
-            _cmd += " WHERE "
-            for id in where:
-                _cmd += f"{id[0]} = '{id[1]}'"
-                if id != where[-1]:
-                    _cmd += " AND "
-    logger.debug(f"Using this query: {_cmd}")
+        _set, params = db_query.set_values(updates)
+        _where, _where_params = db_query.where_filter(where=where)
+        _cmd = f"UPDATE {table_name} SET {_set}{_where}"
+        params += _where_params
+    logger.debug(f"Using this query: {_cmd} {params}")
     if args.not_write_database:
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
-                await db.execute(_cmd)
-                await db.commit()
+            async with connect(db_file) as db:
+                await db.execute(_cmd, params)
+            invalidate_cache(template_info, guild_id)
             logger.debug("Done and commited!")
         except aiosqlite.OperationalError as e:
             logger.error(f"Error: {e}")
@@ -1070,82 +1791,118 @@ async def get_output(
         Only works for tables with two columns
     """
 
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    table_name = template_info["name"]
+    # Not inside a transaction, as it could still be rolled back
+    use_cache = (
+        template_info.get("cached", False)
+        and db_file not in active_transactions.get()
+    )
+    if use_cache:
+        cache_key = repr(
+            (
+                where,
+                like,
+                not_like,
+                select,
+                order_by,
+                get_row_ids,
+                rowid_sort,
+                single,
+                as_settings_json,
+            )
+        )
+        out = settings_cache.get(db_file, table_name, cache_key)
+        if out is not None:
+            logger.debug(f"Using cached output from `{table_name}` in `{db_file}`")
+            return out
+    try:
+        out = await _get_output(
+            template_info,
+            where=where,
+            like=like,
+            not_like=not_like,
+            select=select,
+            order_by=order_by,
+            get_row_ids=get_row_ids,
+            rowid_sort=rowid_sort,
+            single=single,
+            as_settings_json=as_settings_json,
+            guild_id=guild_id,
+            raise_errors=True,
+        )
+    except aiosqlite.OperationalError as e:
+        # Not cached, so the next read tries again
+        logger.error(f"Error: {e}")
+        return {}
+    if use_cache:
+        settings_cache.set(db_file, table_name, cache_key, out)
+    return out
+
+
+async def _get_output(
+    template_info,
+    where: tuple | list = (),
+    like: tuple | list = (),
+    not_like: tuple | list = (),
+    select: tuple | (str) = (),
+    order_by: list = [],
+    get_row_ids: bool = False,
+    rowid_sort: bool = False,
+    single: bool = False,
+    as_settings_json: bool = False,
+    guild_id=None,
+    raise_errors: bool = False,
+) -> dict:
+    """
+    The uncached part of `get_output`. Returns {} on errors, unless
+    `raise_errors`. #autodoc skip#
+    """
     db_file = envs.resolve_db_file(template_info, guild_id)
     logger.debug(f"Opening `{db_file}`")
     table_name = template_info["name"]
     _cmd = "SELECT "
     if get_row_ids:
         _cmd += "rowid, "
-    if isinstance(select, tuple) and len(select) == 0:
-        _cmd += "*"
-    elif isinstance(select, tuple) and len(select) > 1:
-        _cmd += ", ".join(field for field in select)
-    elif isinstance(select, str):
-        _cmd += select
+    _cmd += db_query.select_fields(select)
     _cmd += f" FROM {table_name}"
     logger.debug(f"where: {where}")
     logger.debug(f"like: {like}")
     logger.debug(f"not_like: {not_like}")
-    if where:
-        _cmd += " WHERE"
-        if isinstance(where[0], str):
-            _cmd += f" {where[0]} = '{where[1]}'"
-        elif isinstance(where[0], tuple):
-            for item in where:
-                if len(item) == 3:
-                    if item == where[-1]:
-                        _cmd += f" {item[0]} = '{item[1]}'"
-                    else:
-                        _cmd += f" {item[0]} = '{item[1]}' {item[2]}"
-                elif len(item) == 2:
-                    _cmd += f" {item[0]} = '{item[1]}'"
-                    if item != where[-1]:
-                        _cmd += " AND "
-    logger.debug("_cmd after where: {}".format(_cmd))
-    if like:
-        if not where:
-            _cmd += " WHERE"
-        else:
-            _cmd += " AND"
-        if isinstance(like[0], str):
-            _cmd += f" {like[0]} LIKE '%{like[1]}%'"
-        elif isinstance(like[0], tuple):
-            for item in like:
-                if len(item) == 3:
-                    _cmd += f" {item[0]} LIKE '%{item[1]}%' {item[2]}"
-                elif len(item) == 2:
-                    _cmd += f" {item[0]} LIKE '%{item[1]}%'"
-                    if item != like[-1]:
-                        _cmd += " AND "
-    logger.debug("_cmd after like: {}".format(_cmd))
-    if not_like:
-        if not where:
-            _cmd += " WHERE "
-        else:
-            _cmd += " AND"
-        if isinstance(not_like, tuple):
-            logger.debug(f"`not_like` is tuple: {not_like}")
-            _cmd += f" {not_like[0]} NOT LIKE '%{not_like[1]}%'"
-        elif isinstance(not_like, list) and isinstance(not_like[0], tuple):
-            logger.debug(f"`not_like` is tuple inside a list: {not_like}")
-            for id in not_like:
-                _cmd += f" {id[0]} NOT LIKE '%{id[1]}%'"
-                if id != not_like[-1]:
-                    _cmd += " AND"
-    logger.debug("_cmd after not_like: {}".format(_cmd))
-    if order_by or rowid_sort:
-        _cmd += " ORDER BY "
-        if order_by:
-            _cmd += ", ".join(f"{order[0]} {order[1]}" for order in order_by)
-        elif rowid_sort:
-            _cmd += ", rowid"
-        else:
-            logger.error("Error with setting sort order!")
-    logger.debug(f"Using this query: {_cmd}")
+    _where, params = db_query.where_filter(
+        where=where, like=like, not_like=not_like
+    )
+    _cmd += _where
+    _cmd += db_query.order_by(order_by, rowid_sort=rowid_sort)
+    # Buffered rows can be added to the output as long as it is only
+    # filtered on plain `where`s. Otherwise they are written first.
+    add_buffered = (
+        write_buffer.has_rows(db_file)
+        and not any(
+            (
+                like,
+                not_like,
+                order_by,
+                get_row_ids,
+                rowid_sort,
+                single,
+                as_settings_json,
+            )
+        )
+        and not any(len(item) == 3 for item in db_query.as_items(where or ()))
+        # Buffered rows can only replace written ones by their key
+        and (
+            not template_info.get("primary")
+            or not select
+            or template_info["primary"]
+            in ((select,) if isinstance(select, str) else select)
+        )
+    )
+    logger.debug(f"Using this query: {_cmd} {params}")
     try:
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file, write_buffered=not add_buffered) as db:
             db.row_factory = aiosqlite.Row
-            out = await db.execute(_cmd)
+            out = await db.execute(_cmd, params)
             if single:
                 out = await out.fetchone()
                 if out is None:
@@ -1154,6 +1911,22 @@ async def get_output(
                     return dict(out)
             else:
                 out = [dict(row) for row in await out.fetchall()]
+                if add_buffered:
+                    buffered = write_buffer.matching(
+                        template_info, where=where, select=select, guild_id=guild_id
+                    )
+                    primary = template_info.get("primary")
+                    if primary and buffered:
+                        # These replace the written rows with the same key
+                        replaced = {
+                            db_query.as_text(row[primary]) for row in buffered
+                        }
+                        out = [
+                            row
+                            for row in out
+                            if db_query.as_text(row[primary]) not in replaced
+                        ]
+                    out += buffered
                 if as_settings_json:
                     out_dict = {}
                     for item in out:
@@ -1162,6 +1935,8 @@ async def get_output(
             logger.debug(f"Returning {len(out)} items from from db")
             return out
     except aiosqlite.OperationalError as e:
+        if raise_errors:
+            raise
         logger.error(f"Error: {e}")
         return {}
 
@@ -1191,12 +1966,7 @@ async def get_random_left_exclude_output(
     table_name1 = template_info_1["name"]
     table_name2 = template_info_2["name"]
     _cmd = "SELECT "
-    if len(select) == 0 or select is None:
-        _cmd += "*"
-    elif isinstance(select, tuple) and len(select) > 1:
-        _cmd += ", ".join(f"A.{field}" for field in select)
-    elif isinstance(select, str):
-        _cmd += select
+    _cmd += db_query.select_fields(select, prefix="A.")
     _cmd += f" FROM {table_name1} A"
     _cmd += f" LEFT JOIN {table_name2} B ON"
     _cmd += f" A.{key} = B.{key}"
@@ -1205,7 +1975,7 @@ async def get_random_left_exclude_output(
     _cmd += " LIMIT 1"
     logger.debug(f"Using this query: {_cmd}")
     try:
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             out = await db.execute(_cmd)
             out = await out.fetchall()
             return out
@@ -1213,6 +1983,130 @@ async def get_random_left_exclude_output(
         return None
 
 
+async def get_random_from_bag(
+    template_info, log_info, bag_info, key: str, select: tuple = (), guild_id=None
+):
+    """
+    Get a random row from `template_info` that hasn't been posted in this
+    round, like `get_random_left_exclude_output()`, but draw it from a
+    shuffle bag: `bag_info` holds the `key`s left in the round in random
+    order, so a draw is an indexed read of the first one instead of a
+    sort of the whole table.
+
+    An empty bag ends the round: `log_info` is emptied and the bag is
+    filled with every `key` again. The first time a guild's bag is made
+    it only gets the `key`s not in `log_info`, so a round that was
+    already going on is kept.
+
+    The drawn `key` is left in the bag: take it out with
+    `remove_from_bag()` once the row is posted, so a post that fails
+    doesn't skip it for the round.
+
+    Rows deleted from `template_info` are skipped if they are still in
+    the bag, see also `add_to_bag()`.
+
+    Returns
+    ------------
+    list
+        The row as a tuple of the `select` fields, or an empty list if
+        `template_info` is empty
+    """
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return await get_random_left_exclude_output(
+            template_info, log_info, key, select, guild_id=guild_id
+        )
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    table_name = template_info["name"]
+    log_name = log_info["name"]
+    bag_name = bag_info["name"]
+    new_bag = not await table_exist(bag_info, guild_id=guild_id)
+    if new_bag:
+        await prep_table(bag_info, guild_id=guild_id)
+    _fill = f"INSERT OR IGNORE INTO {bag_name} (item, position)"
+    _fill_all = f"{_fill} SELECT {key}, random() FROM {table_name}"
+    _fill_left = (
+        f"{_fill} SELECT A.{key}, random() FROM {table_name} A"
+        f" LEFT JOIN {log_name} B ON A.{key} = B.{key}"
+        f" WHERE B.{key} IS NULL"
+    )
+    _draw = f"SELECT item FROM {bag_name} ORDER BY position LIMIT 1"
+    _take = f"DELETE FROM {bag_name} WHERE item = ?"
+    _cmd = "SELECT "
+    _cmd += db_query.select_fields(select)
+    _cmd += f" FROM {table_name} WHERE {key} = ?"
+    refilled = False
+    try:
+        async with connect(db_file) as db:
+            if new_bag:
+                logger.debug(f"Using this query: {_fill_left}")
+                await db.execute(_fill_left)
+            while True:
+                drawn = await (await db.execute(_draw)).fetchone()
+                if drawn is None:
+                    if refilled:
+                        return []
+                    logger.debug(f"Bag `{bag_name}` is empty, starting a new round")
+                    await db.execute(f"DELETE FROM {log_name}")
+                    await db.execute(_fill_all)
+                    refilled = True
+                    continue
+                logger.debug(f"Using this query: {_cmd} {tuple(drawn)}")
+                out = await (await db.execute(_cmd, drawn)).fetchall()
+                if len(out) > 0:
+                    return out
+                # The row is gone
+                await db.execute(_take, drawn)
+    except aiosqlite.OperationalError as e:
+        logger.error(f"Error: {e}")
+        return None
+    finally:
+        if refilled:
+            invalidate_cache(log_info, guild_id)
+
+
+async def add_to_bag(bag_info, items: list, guild_id=None):
+    """
+    Put `items` in random places in `bag_info`'s shuffle bag (see
+    `get_random_from_bag()`), so new rows can come up in the ongoing
+    round. A bag that hasn't been made yet is left alone, it gets every
+    row when it is.
+    """
+    db_file = envs.resolve_db_file(bag_info, guild_id)
+    _cmd = f"INSERT OR IGNORE INTO {bag_info['name']} (item, position) "
+    _cmd += "VALUES (?, random())"
+    logger.debug(f"Using this query: {_cmd} {items}")
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return
+    async with connect(db_file) as db:
+        try:
+            await db.executemany(_cmd, [(str(item),) for item in items])
+        except aiosqlite.OperationalError as e:
+            # No bag yet. Caught in here so it doesn't roll back a
+            # `transaction()` this is part of.
+            logger.debug(f"Not adding to bag: {e}")
+
+
+async def remove_from_bag(bag_info, items: list, guild_id=None):
+    """
+    Take `items` out of `bag_info`'s shuffle bag, see
+    `get_random_from_bag()`
+    """
+    db_file = envs.resolve_db_file(bag_info, guild_id)
+    _cmd = f"DELETE FROM {bag_info['name']} WHERE item = ?"
+    logger.debug(f"Using this query: {_cmd} {items}")
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return
+    async with connect(db_file) as db:
+        try:
+            await db.executemany(_cmd, [(str(item),) for item in items])
+        except aiosqlite.OperationalError as e:
+            # As in `add_to_bag()`
+            logger.debug(f"Not removing from bag: {e}")
+
+
 async def get_combined_output(
     template_info_1: dict,
     template_info_2: dict,
@@ -1244,47 +2138,23 @@ async def get_combined_output(
     )
     _cmd = "SELECT "
     if get_row_ids:
-        _cmd += "A.rowid"
-    if len(select) == 0:
-        if get_row_ids:
-            _cmd += ", "
-        _cmd += "*"
-    elif isinstance(select, list) and len(select) > 1:
-        _cmd += ", ".join(f"{field}" for field in select)
-    elif isinstance(select, str):
-        _cmd += select
+        _cmd += "A.rowid, "
+    _cmd += db_query.select_fields(select)
     if group_by:
         _cmd += ", COUNT(*)"
     _cmd += f" FROM {table_name1} A"
     _cmd += f" INNER JOIN {table_name2} B ON"
     _cmd += f" A.{key} = B.{key}"
-    if where:
-        _cmd += " WHERE"
-        if isinstance(where[0], str):
-            _cmd += f" {where[0]} = '{where[1]}'"
-        elif isinstance(where[0], tuple):
-            for item in where:
-                if len(item) == 3:
-                    _cmd += f" {item[0]} = '{item[1]}' {item[2]}"
-                elif len(item) == 2:
-                    _cmd += f" {item[0]} = '{item[1]}'"
-                    if item != where[-1]:
-                        _cmd += " AND "
+    _where, params = db_query.where_filter(where=where)
+    _cmd += _where
     if group_by:
         _cmd += f" GROUP BY {group_by}"
-    if order_by or rowid_sort:
-        _cmd += " ORDER BY "
-        if order_by:
-            _cmd += ", ".join(f"{order[0]} {order[1]}" for order in order_by)
-        elif rowid_sort:
-            _cmd += ", A.rowid"
-        else:
-            logger.error("Error with setting sort order!")
-    logger.debug(f"Using this query: {_cmd}")
+    _cmd += db_query.order_by(order_by, rowid_sort=rowid_sort, rowid="A.rowid")
+    logger.debug(f"Using this query: {_cmd} {params}")
     try:
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             db.row_factory = aiosqlite.Row
-            out = await db.execute(_cmd)
+            out = await db.execute(_cmd, params)
             out = [dict(row) for row in await out.fetchall()]
             return out
     except aiosqlite.OperationalError:
@@ -1297,61 +2167,54 @@ async def get_imgs_with_quote(
     where: list | tuple = [],
     like: list | tuple = [],
     order_by: list | tuple = [],
+    img_refs: bool = False,
+    uuids: list | tuple = None,
     guild_id=None,
 ):
+    """
+    Get quotes with their comments, and the comments' images, as a list
+    of quotes with a `comments` dict each. `uuids` limits it to those
+    quotes, in that order.
+
+    The images of a comment are in its `imgs` dict, by `img_no`: the
+    image bytes, or with `img_refs` a reference to the image instead,
+    `{"comment_id": ..., "img_no": ..., "size": ...}`. Get the bytes
+    for a reference with `get_quote_img`, when it is needed.
+    """
     db_file = envs.resolve_db_file(template_info, guild_id)
     sql_query = "SELECT "
     if len(select) > 0:
-        for _sel in select:
-            sql_query += _sel
-            if _sel != select[-1]:
-                sql_query += ", "
+        sql_query += db_query.select_fields(select)
     else:
-        # `quote_img.base64` must be aliased: it is read as `img_base64`
+        # `quote_blob.data` must be aliased: it is read as `img_data`
         # below. The image columns are listed explicitly rather than as
         # `quote_img.*` so the join's own `comment_id` (NULL for every
         # comment without an image) never shadows `quote_content`'s.
-        sql_query += (
-            "quote.rowid, quote.*, quote_content.*,"
-            " quote_img.img_no, quote_img.base64 AS img_base64 "
-        )
+        sql_query += "quote.rowid, quote.*, quote_content.*, quote_img.img_no"
+        if img_refs:
+            sql_query += ", quote_blob.size AS img_size"
+        else:
+            sql_query += ", quote_blob.data AS img_data"
     sql_query += (
-        "FROM quote INNER JOIN quote_content"
+        " FROM quote INNER JOIN quote_content"
         " ON quote.uuid = quote_content.uuid"
         " LEFT JOIN quote_img ON quote_content.comment_id = quote_img.comment_id"
+        " LEFT JOIN quote_blob ON quote_img.sha256 = quote_blob.sha256"
     )
-    if where:
-        sql_query += " WHERE"
-        if isinstance(where[0], str):
-            sql_query += f" {where[0]} = '{where[1]}'"
-        elif isinstance(where[0], tuple):
-            for item in where:
-                if len(item) == 3:
-                    sql_query += f" {item[0]} = '{item[1]}' {item[2]}"
-                elif len(item) == 2:
-                    sql_query += f" {item[0]} = '{item[1]}'"
-                    if item != where[-1]:
-                        sql_query += " AND "
-    if like:
-        if not where:
-            sql_query += " WHERE"
-        if isinstance(like[0], str):
-            sql_query += f" {like[0]} LIKE '%{like[1]}%'"
-        elif isinstance(like[0], tuple):
-            for item in like:
-                if len(item) == 3:
-                    sql_query += f" {item[0]} LIKE '%{item[1]}%' {item[2]}"
-                elif len(item) == 2:
-                    sql_query += f" {item[0]} LIKE '%{item[1]}%'"
-                    if item != like[-1]:
-                        sql_query += " AND "
-    if order_by:
-        sql_query += " ORDER BY "
-        sql_query += ", ".join(f"{order[0]} {order[1]}" for order in order_by)
+    _where, params = db_query.where_filter(where=where, like=like)
+    if uuids is not None:
+        if len(uuids) == 0:
+            return []
+        _in, _params = db_query.in_list("quote.uuid", uuids)
+        _where += f" AND {_in}" if _where else f" WHERE {_in}"
+        params += _params
+    sql_query += _where
+    sql_query += db_query.order_by(order_by)
+    logger.debug(f"Using this query: {sql_query} {params}")
     try:
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             db.row_factory = aiosqlite.Row
-            out = await db.execute(sql_query)
+            out = await db.execute(sql_query, params)
             rows = [dict(row) for row in await out.fetchall()]
             quotes = {}
             for row in rows:
@@ -1363,7 +2226,8 @@ async def get_imgs_with_quote(
                         if k
                         not in (
                             "img_no",
-                            "img_base64",
+                            "img_data",
+                            "img_size",
                             "comment_id",
                             "author_id",
                             "author_backup",
@@ -1390,15 +2254,193 @@ async def get_imgs_with_quote(
                     quotes[uid]["comments"][cid]["content_order"] = row["content_order"]
                     quotes[uid]["comments"][cid]["imgs"] = {}
                 if row["img_no"] is not None:
-                    quotes[uid]["comments"][cid]["imgs"][row["img_no"]] = row[
-                        "img_base64"
-                    ]
+                    if img_refs:
+                        img = {
+                            "comment_id": row["comment_id"],
+                            "img_no": row["img_no"],
+                            "size": row["img_size"],
+                        }
+                    else:
+                        img = row["img_data"]
+                    quotes[uid]["comments"][cid]["imgs"][row["img_no"]] = img
+            if uuids is not None:
+                return [quotes[uid] for uid in uuids if uid in quotes]
             return list(quotes.values())
     except aiosqlite.OperationalError:
         logger.error("Error when fetching img quotes")
         return []
 
 
+async def prep_quote_search(guild_id=None):
+    """
+    Make the full-text index `quote_search` over `quote_content`'s
+    authors and text for `guild_id`, with triggers that keep it in step
+    with every insert, update and delete there. An index made for an
+    existing `quote_content` is filled from it, but only when it is made:
+    the triggers keep it up to date from then on.
+    #autodoc skip#
+    """
+    db_file = envs.resolve_db_file(envs.quote_content_db_schema, guild_id)
+    fields = "author_backup, content_text"
+    new_values = "new.rowid, new.author_backup, new.content_text"
+    old_values = "'delete', old.rowid, old.author_backup, old.content_text"
+    _cmds = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS quote_search USING fts5("
+        f"{fields}, content='quote_content', content_rowid='rowid', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS quote_search_ai AFTER INSERT ON "
+        f"quote_content BEGIN INSERT INTO quote_search(rowid, {fields}) "
+        f"VALUES ({new_values}); END",
+        "CREATE TRIGGER IF NOT EXISTS quote_search_ad AFTER DELETE ON "
+        f"quote_content BEGIN INSERT INTO quote_search(quote_search, rowid, "
+        f"{fields}) VALUES ({old_values}); END",
+        "CREATE TRIGGER IF NOT EXISTS quote_search_au AFTER UPDATE ON "
+        f"quote_content BEGIN INSERT INTO quote_search(quote_search, rowid, "
+        f"{fields}) VALUES ({old_values}); INSERT INTO quote_search(rowid, "
+        f"{fields}) VALUES ({new_values}); END",
+    ]
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return
+    async with connect(db_file) as db:
+        out = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            ("quote_search",),
+        )
+        if await out.fetchone() is None:
+            _cmds.append("INSERT INTO quote_search(quote_search) VALUES ('rebuild')")
+        for _cmd in _cmds:
+            logger.debug(f"Using this query: {_cmd}")
+            await db.execute(_cmd)
+
+
+async def search_quotes(keyword: str, limit: int = 25, guild_id=None):
+    """
+    Full-text search for `keyword` in the quotes' authors and text, the
+    best match first. Every word in `keyword` has to be in the same
+    comment, as a whole word or the start of one. A `limit` of -1 gets
+    every match.
+
+    Returns
+    ------------
+    list
+        Dicts with the quote's `rowid` and `uuid`, the `author_backup`
+        and a `snippet` of its best matching comment, and that comment's
+        `score` (lower is better). Empty if the search index is missing.
+    """
+    match = db_query.fts_match(keyword)
+    if not match:
+        return []
+    db_file = envs.resolve_db_file(envs.quote_content_db_schema, guild_id)
+    # The hits are materialized first: the ranking functions only work
+    # in a query on `quote_search` alone
+    _cmd = (
+        "WITH hit AS MATERIALIZED (SELECT rowid, bm25(quote_search) AS score,"
+        " author_backup, snippet(quote_search, 1, '**', '**', '…', 12) AS snippet"
+        " FROM quote_search WHERE quote_search MATCH ?)"
+        " SELECT quote.rowid, quote.uuid, MIN(hit.score) AS score,"
+        " hit.author_backup, hit.snippet"
+        " FROM hit"
+        " INNER JOIN quote_content ON quote_content.rowid = hit.rowid"
+        " INNER JOIN quote ON quote.uuid = quote_content.uuid"
+        " GROUP BY quote.uuid ORDER BY score LIMIT ?"
+    )
+    logger.debug(f"Using this query: {_cmd} {(match, limit)}")
+    try:
+        async with connect(db_file) as db:
+            db.row_factory = aiosqlite.Row
+            out = await db.execute(_cmd, (match, limit))
+            return [dict(row) for row in await out.fetchall()]
+    except aiosqlite.OperationalError as e:
+        if "no such table" in str(e):
+            logger.warning(f"No quote search index in `{db_file}`: {e}")
+        else:
+            logger.error(f"Error: {e}")
+        return []
+
+
+async def get_quote_img(comment_id, img_no, guild_id=None) -> bytes | None:
+    """
+    Get the bytes of image `img_no` in the comment `comment_id`, like
+    the references `get_imgs_with_quote(img_refs=True)` gives, or None
+    if there is no such image
+    """
+    db_file = envs.resolve_db_file(envs.quote_img_db_schema, guild_id)
+    _cmd = (
+        "SELECT quote_blob.data FROM quote_img"
+        " INNER JOIN quote_blob ON quote_img.sha256 = quote_blob.sha256"
+        " WHERE quote_img.comment_id = ? AND quote_img.img_no = ?"
+    )
+    params = (db_query.as_text(comment_id), db_query.as_text(img_no))
+    logger.debug(f"Using this query: {_cmd} {params}")
+    try:
+        async with connect(db_file) as db:
+            out = await db.execute(_cmd, params)
+            img = await out.fetchone()
+    except aiosqlite.OperationalError as e:
+        logger.error(f"Error: {e}")
+        return None
+    return img[0] if img is not None else None
+
+
+async def insert_quote_imgs(imgs: list = None, guild_id=None):
+    """
+    Store quote images: every image in `quote_blob`, keyed by the sha256
+    of its content so the same image is only stored once, and a row in
+    `quote_img` pointing to it.
+
+    Parameters
+    ------------
+    imgs: list(tuple)
+        `(comment_id, img_no, image bytes)` for each image
+    """
+    if imgs is None or len(imgs) == 0:
+        logger.error("Missing imgs")
+        return None
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return None
+    blobs = {}
+    img_rows = []
+    for comment_id, img_no, img in imgs:
+        sha256 = hashlib.sha256(img).hexdigest()
+        blobs[sha256] = (sha256, len(img), img)
+        img_rows.append((comment_id, img_no, sha256))
+    db_file = envs.resolve_db_file(envs.quote_img_db_schema, guild_id)
+    try:
+        async with connect(db_file) as db:
+            await db.executemany(
+                "INSERT OR IGNORE INTO quote_blob VALUES (?, ?, ?)", blobs.values()
+            )
+            await db.executemany("INSERT INTO quote_img VALUES (?, ?, ?)", img_rows)
+        invalidate_cache(envs.quote_img_db_schema, guild_id)
+        return True
+    except aiosqlite.OperationalError as e:
+        logger.error(f"Error: {e}")
+        return False
+
+
+async def prune_quote_blobs(guild_id=None):
+    "Delete the images in `quote_blob` no `quote_img` row points to anymore"
+    db_file = envs.resolve_db_file(envs.quote_blob_db_schema, guild_id)
+    _cmd = (
+        "DELETE FROM quote_blob WHERE sha256 NOT IN"
+        " (SELECT sha256 FROM quote_img WHERE sha256 IS NOT NULL)"
+    )
+    logger.debug(f"Using this query: {_cmd}")
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return None
+    try:
+        async with connect(db_file) as db:
+            await db.execute(_cmd)
+        invalidate_cache(envs.quote_blob_db_schema, guild_id)
+        return True
+    except aiosqlite.OperationalError as e:
+        logger.error(f"Error: {e}")
+        return None
+
+
 async def empty_table(template_info, guild_id=None):
     db_file = envs.resolve_db_file(template_info, guild_id)
     table_name = template_info["name"]
@@ -1408,11 +2450,11 @@ async def empty_table(template_info, guild_id=None):
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
+            async with connect(db_file) as db:
                 out = await db.execute(_cmd)
-                await db.commit()
                 logger.debug("Changed {} rows".format(db.total_changes))
-                return out
+            invalidate_cache(template_info, guild_id)
+            return out
         except aiosqlite.OperationalError as e:
             logger.error(f"Error: {e}")
             return None
@@ -1441,7 +2483,7 @@ async def get_one_random_output(template_info, fields_out: tuple, guild_id=None)
     _cmd += " LIMIT 1"
     logger.debug(f"Using this query: {_cmd}")
     try:
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             out = await db.execute(_cmd)
             out = await out.fetchall()
             return out
@@ -1469,13 +2511,13 @@ async def get_output_by_rowid(
     elif isinstance(fields_out, str):
         _cmd += fields_out
     _cmd += f" FROM {table_name}"
-    _cmd += f" WHERE rowid = {rowid}"
+    _cmd += " WHERE rowid = ?"
     _cmd += " ORDER BY rowid"
-    logger.debug(f"Using this query: {_cmd}")
+    logger.debug(f"Using this query: {_cmd} {rowid}")
     try:
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             db.row_factory = aiosqlite.Row
-            out = await db.execute(_cmd)
+            out = await db.execute(_cmd, (rowid,))
             out = [dict(row) for row in await out.fetchall()]
             return out
     except aiosqlite.OperationalError:
@@ -1490,7 +2532,7 @@ async def get_row_ids(template_info, sort=False, guild_id=None) -> list:
         _cmd += " ORDER BY rowid"
     logger.debug(f"Using this query: {_cmd}")
     try:
-        async with aiosqlite.connect(db_file) as db:
+        async with connect(db_file) as db:
             out = await db.execute(_cmd)
             out = await out.fetchall()
             return [id[0] for id in out]
@@ -1501,24 +2543,24 @@ async def get_row_ids(template_info, sort=False, guild_id=None) -> list:
 async def del_row_id(template_info, numbers, guild_id=None):
     db_file = envs.resolve_db_file(template_info, guild_id)
     table_name = template_info["name"]
-    _cmd = f"DELETE FROM {table_name} WHERE rowid "
+    _cmd = f"DELETE FROM {table_name} WHERE "
     if isinstance(numbers, list):
-        _cmd += "IN ("
-        _cmd += ", ".join(str(number) for number in numbers)
-        _cmd += ")"
+        _in, params = db_query.in_list("rowid", numbers)
+        _cmd += _in
     elif isinstance(numbers, (int, str)):
-        _cmd += f"= {numbers}"
+        _cmd += "rowid = ?"
+        params = (numbers,)
     else:
         logger.error(f"Could not find rowid for {numbers}")
         return None
-    logger.debug(f"Using this query: {_cmd}")
+    logger.debug(f"Using this query: {_cmd} {params}")
     if args.not_write_database:
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
-                await db.execute(_cmd)
-                await db.commit()
+            async with connect(db_file) as db:
+                await db.execute(_cmd, params)
+            invalidate_cache(template_info, guild_id)
         except aiosqlite.OperationalError:
             return None
 
@@ -1526,17 +2568,16 @@ async def del_row_id(template_info, numbers, guild_id=None):
 async def del_row_ids(template_info, numbers=None, guild_id=None):
     db_file = envs.resolve_db_file(template_info, guild_id)
     table_name = template_info["name"]
-    _cmd = f"DELETE FROM {table_name} WHERE rowid IN ("
-    _cmd += ", ".join(str(number) for number in numbers)
-    _cmd += ")"
-    logger.debug(f"Using this query: {_cmd}")
+    _in, params = db_query.in_list("rowid", numbers)
+    _cmd = f"DELETE FROM {table_name} WHERE {_in}"
+    logger.debug(f"Using this query: {_cmd} {params}")
     if args.not_write_database:
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
-                await db.execute(_cmd)
-                await db.commit()
+            async with connect(db_file) as db:
+                await db.execute(_cmd, params)
+            invalidate_cache(template_info, guild_id)
         except aiosqlite.OperationalError:
             return None
 
@@ -1552,23 +2593,16 @@ async def del_row_by_OR_filter(template_info, where=None, guild_id=None):
     """
     db_file = envs.resolve_db_file(template_info, guild_id)
     table_name = template_info["name"]
-    _cmd = f"DELETE FROM {table_name} "
-    if isinstance(where, tuple):
-        _cmd += f" WHERE {where[0]} = '{where[1]}'"
-    elif isinstance(where, list):
-        _cmd += " WHERE "
-        for id in where:
-            _cmd += f"{id[0]} = '{id[1]}'"
-            if id != where[-1]:
-                _cmd += " OR "
-    logger.debug(f"Using this query: {_cmd}")
+    _where, params = db_query.where_filter(where=where, connector="OR")
+    _cmd = f"DELETE FROM {table_name}{_where}"
+    logger.debug(f"Using this query: {_cmd} {params}")
     if args.not_write_database:
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
-                await db.execute(_cmd)
-                await db.commit()
+            async with connect(db_file) as db:
+                await db.execute(_cmd, params)
+            invalidate_cache(template_info, guild_id)
             logger.debug("Done and commited!")
         except aiosqlite.OperationalError as e:
             logger.error(f"Error: {e}")
@@ -1587,24 +2621,19 @@ async def del_row_by_AND_filter(template_info, where: list = None, guild_id=None
     """
     db_file = envs.resolve_db_file(template_info, guild_id)
     table_name = template_info["name"]
-    _cmd = f"DELETE FROM {table_name}"
-    if isinstance(where[0], str):
-        _cmd += f" WHERE {where[0]} = '{where[1]}'"
-    elif isinstance(where, (list, tuple)):
-        _cmd += " WHERE "
-        for id in where:
-            logger.debug(f"`id` is {type(id)}: {id}")
-            _cmd += f"{id[0]} = '{id[1]}'"
-            if id != where[-1]:
-                _cmd += " AND "
-    logger.debug(f"Using this query: {_cmd}")
+    if not where:
+        logger.error("Missing where")
+        return None
+    _where, params = db_query.where_filter(where=where)
+    _cmd = f"DELETE FROM {table_name}{_where}"
+    logger.debug(f"Using this query: {_cmd} {params}")
     if args.not_write_database:
         logger.debug("`not_write_database` activated")
     elif not args.not_write_database:
         try:
-            async with aiosqlite.connect(db_file) as db:
-                await db.execute(_cmd)
-                await db.commit()
+            async with connect(db_file) as db:
+                await db.execute(_cmd, params)
+            invalidate_cache(template_info, guild_id)
             logger.debug("Done and commited!")
             return True
         except aiosqlite.OperationalError as e:
@@ -1612,6 +2641,137 @@ async def del_row_by_AND_filter(template_info, where: list = None, guild_id=None
             return None
 
 
+async def db_size(db) -> int:
+    "Size in bytes of the database `db` is connected to. #autodoc skip#"
+    page_count = await (await db.execute("PRAGMA page_count")).fetchone()
+    page_size = await (await db.execute("PRAGMA page_size")).fetchone()
+    return page_count[0] * page_size[0]
+
+
+async def prune_log(
+    template_info,
+    keep_rows: int = None,
+    keep_days: int = None,
+    guild_id=None,
+) -> int:
+    """
+    Delete the rows in the log table `template_info` that its
+    `retention` no longer keeps. A row is kept if it is one of the last
+    `keep_rows` rows (by rowid) with its `group_by` value, or if its
+    `date` is less than `keep_days` old. 0 turns a rule off. With only
+    `keep_days`, the last config.LOG_RETENTION_MIN_ROWS rows of each
+    `group_by` value are kept as well, so a feed is never left without
+    the log that tells which of its items have been posted.
+
+    Defaults to config.LOG_RETENTION_ROWS and config.LOG_RETENTION_DAYS.
+
+    Returns
+    ------------
+    int
+        The number of rows deleted
+    """
+    if keep_rows is None:
+        keep_rows = config.LOG_RETENTION_ROWS
+    if keep_days is None:
+        keep_days = config.LOG_RETENTION_DAYS
+    if keep_rows <= 0 and keep_days <= 0:
+        return 0
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    table_name = template_info["name"]
+    retention = template_info["retention"]
+    partition = ""
+    if retention["group_by"]:
+        partition = f"PARTITION BY {retention['group_by']} "
+    _where = []
+    params = []
+    _where.append("row_no > ?")
+    if keep_rows > 0:
+        params.append(keep_rows)
+    else:
+        params.append(max(config.LOG_RETENTION_MIN_ROWS, 1))
+    if keep_days > 0:
+        cutoff = (await get_dt(format="datetimeobject")).subtract(days=keep_days)
+        _where.append(f"{retention['date']} < ?")
+        params.append(cutoff.format("YYYY-MM-DD HH:mm:ss"))
+    _cmd = (
+        f"DELETE FROM {table_name} WHERE rowid IN ("
+        f"SELECT rowid FROM (SELECT rowid, {retention['date']}, "
+        f"ROW_NUMBER() OVER ({partition}ORDER BY rowid DESC) AS row_no "
+        f"FROM {table_name}) WHERE {' AND '.join(_where)})"
+    )
+    logger.debug(f"Using this query: {_cmd} {params}")
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return 0
+    try:
+        async with connect(db_file) as db:
+            out = await db.execute(_cmd, params)
+            deleted = out.rowcount
+    except aiosqlite.OperationalError as e:
+        logger.error(f"Error: {e}")
+        return 0
+    if deleted > 0:
+        invalidate_cache(template_info, guild_id)
+    return deleted
+
+
+async def vacuum_db(db_file: str) -> int:
+    """
+    Give the free pages in `db_file` back to the file system.
+
+    Uses an incremental vacuum, which is cheap and does not rewrite the
+    file. Files made before `auto_vacuum` was set in `envs.db_pragmas`
+    don't support that, so they get one full VACUUM to convert them.
+
+    Returns
+    ------------
+    int
+        The number of bytes the database shrunk by
+    """
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return 0
+    try:
+        async with connect(db_file) as db:
+            size_before = await db_size(db)
+            auto_vacuum = await (await db.execute("PRAGMA auto_vacuum")).fetchone()
+            if auto_vacuum[0] != 2:
+                logger.info(f"Converting `{db_file}` to incremental auto_vacuum")
+                await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                await db.execute("VACUUM")
+            else:
+                await (await db.execute("PRAGMA incremental_vacuum")).fetchall()
+            return size_before - await db_size(db)
+    except aiosqlite.OperationalError as e:
+        logger.error(f"Error: {e}")
+        return 0
+
+
+async def compact_guild_logs(guild_id) -> dict:
+    """
+    Prune every table in `envs.retention_db_schemas` for `guild_id` and
+    vacuum the files they are in. Files that don't exist are skipped
+    rather than created.
+
+    Returns
+    ------------
+    dict
+        {"rows": rows deleted, "bytes": bytes reclaimed}
+    """
+    reclaimed = {"rows": 0, "bytes": 0}
+    db_files = []
+    for template_info in envs.retention_db_schemas:
+        db_file = envs.resolve_db_file(template_info, guild_id)
+        if not file_io.file_exist(db_file):
+            continue
+        reclaimed["rows"] += await prune_log(template_info, guild_id=guild_id)
+        if db_file not in db_files:
+            db_files.append(db_file)
+    for db_file in db_files:
+        reclaimed["bytes"] += await vacuum_db(db_file)
+    return reclaimed
+
+
 async def calculate_average_rating_from_db(
     show_uuid, episode_uuid, template_info, guild_id=None
 ):
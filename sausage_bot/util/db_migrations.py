@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+db_migrations: Run the fixups for old guild databases once per database
+
+Every database file keeps the number of fixups it has had in
+`PRAGMA user_version`. `migrate()` only runs the ones after that, so a
+database that is up to date costs one pragma read, however many fixups
+there are.
+
+`bootstrap_guild()` goes one step further for the cogs' setup: it keeps
+a hash of every table layout and fixup per guild, and skips setting up a
+guild's tables at all while that hash is unchanged.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import aiosqlite
+
+from sausage_bot.util import envs, config, db_helper
+from sausage_bot.util.args import args
+
+logger = config.logger
+
+
+async def _stats_hide_roles_to_own_table(guild):
+    await db_helper.db_fix_old_hide_roles_status(guild_id=guild.id)
+
+
+async def _stats_msg_to_stats_msg_id(guild):
+    await db_helper.db_fix_old_stats_msg_name_status(guild_id=guild.id)
+
+
+async def _stats_remove_value_check_and_help(guild):
+    await db_helper.db_fix_old_value_check_or_help(guild_id=guild.id)
+
+
+async def _stats_numeral_bools_to_bools(guild):
+    await db_helper.db_replace_numeral_bool_with_bool(
+        envs.stats_db_settings_schema, guild_id=guild.id
+    )
+
+
+async def _stats_remove_old_cols(guild):
+    await db_helper.db_remove_old_cols(envs.stats_db_settings_schema, guild_id=guild.id)
+
+
+async def _rss_channel_names_to_ids(guild):
+    await db_helper.db_channel_names_to_ids(
+        template_info=envs.rss_db_schema,
+        id_col="uuid",
+        channel_col="channel",
+        guild=guild,
+    )
+
+
+async def _rss_spotify_to_podcast(guild):
+    await db_helper.db_update_to_correct_feed_types(
+        template_info=envs.rss_db_schema, guild_id=guild.id
+    )
+
+
+async def _youtube_channel_names_to_ids(guild):
+    await db_helper.db_channel_names_to_ids(
+        template_info=envs.youtube_db_schema,
+        id_col="uuid",
+        channel_col="channel",
+        guild=guild,
+    )
+
+
+async def _roles_channel_names_to_ids(guild):
+    await db_helper.db_channel_names_to_ids(
+        template_info=envs.roles_db_msgs_schema,
+        id_col="msg_id",
+        channel_col="channel",
+        guild=guild,
+    )
+
+
+async def _quote_imgs_to_blobs(guild):
+    await db_helper.db_quote_imgs_to_blobs(guild_id=guild.id)
+
+
+async def _quote_search_index(guild):
+    await db_helper.prep_quote_search(guild_id=guild.id)
+
+
+# The fixups for each database file name, in the order they are run. A
+# database's `user_version` is how many of them it has had, so only ever
+# add new ones to the end of a list.
+migrations = {
+    "stats.sqlite": [
+        _stats_hide_roles_to_own_table,
+        _stats_msg_to_stats_msg_id,
+        _stats_remove_value_check_and_help,
+        _stats_numeral_bools_to_bools,
+        _stats_remove_old_cols,
+    ],
+    "rss_feeds.sqlite": [
+        _rss_channel_names_to_ids,
+        _rss_spotify_to_podcast,
+    ],
+    "youtube_feeds.sqlite": [_youtube_channel_names_to_ids],
+    "roles.sqlite": [_roles_channel_names_to_ids],
+    "quote.sqlite": [_quote_imgs_to_blobs, _quote_search_index],
+}
+
+
+def latest_version(template_info) -> int:
+    "The version `template_info`'s database has when every fixup has run"
+    return len(migrations.get(Path(template_info["db_file"]).name, []))
+
+
+async def get_version(template_info, guild_id=None) -> int:
+    "The `user_version` of `template_info`'s database for `guild_id`"
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    async with db_helper.connect(db_file) as db:
+        out = await db.execute("PRAGMA user_version")
+        return (await out.fetchone())[0]
+
+
+async def set_version(template_info, version: int, guild_id=None):
+    "#autodoc skip#"
+    db_file = envs.resolve_db_file(template_info, guild_id)
+    _cmd = f"PRAGMA user_version = {int(version)}"
+    logger.debug(f"Using this query: {_cmd}")
+    async with db_helper.connect(db_file) as db:
+        await db.execute(_cmd)
+
+
+async def is_current(template_info, guild_id=None) -> bool:
+    "Whether `template_info`'s database for `guild_id` has had every fixup"
+    return await get_version(template_info, guild_id) >= latest_version(
+        template_info
+    )
+
+
+def schema_version() -> str:
+    """
+    A hash of every guild-scoped table layout in `envs` and of the fixups
+    in `migrations`, which changes whenever either of them does
+    """
+    layouts = {
+        name: value
+        for name, value in vars(envs).items()
+        if name.endswith("_schema")
+        and isinstance(value, dict)
+        and value.get("scope") != "global"
+    }
+    layouts["migrations"] = {
+        db_name: [fixup.__name__ for fixup in fixups]
+        for db_name, fixups in migrations.items()
+    }
+    return hashlib.sha256(
+        json.dumps(layouts, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+
+
+# The `schema_versions` tables made since the bot started, by file
+_versions_prepped = set()
+
+
+async def tables_exist(tables, guild_id) -> bool:
+    """
+    Whether the database files and tables of every schema in `tables`
+    exist for `guild_id`, and if `envs.tasks_db_schema` is one of them,
+    all its rows as well. Files that are missing aren't made.
+    """
+    for template_info in tables:
+        db_file = envs.resolve_db_file(template_info, guild_id)
+        if not Path(db_file).exists():
+            return False
+        if not await db_helper.table_exist(template_info, guild_id=guild_id):
+            return False
+        if template_info is envs.tasks_db_schema:
+            for cog, task, _status in envs.tasks_db_schema["inserts"]:
+                if await db_helper.task_statuses.status(guild_id, cog, task) is None:
+                    return False
+    return True
+
+
+async def bootstrap_guild(name: str, guild, prep, migrated=(), tables=()) -> bool:
+    """
+    Run `prep(guild)`, the setup of `name`'s tables for `guild`, unless it
+    has already run for the current `schema_version()`. Reconnects and
+    restarts without schema changes then cost one cached read per guild.
+
+    `tables` are the schemas `prep` makes. If any of them is missing,
+    like when a database file has been deleted or restored from an older
+    backup, `prep` is run whatever the recorded version says.
+
+    The version is only recorded when `prep` didn't raise and every
+    schema in `migrated` has had all its fixups, so a failed fixup is
+    tried again on the next start.
+
+    Returns
+    ------------
+    bool
+        Whether `prep` was run
+    """
+    version = schema_version()
+    db_file = envs.resolve_db_file(envs.schema_versions_db_schema, guild.id)
+    if db_file not in _versions_prepped:
+        await db_helper.prep_table(envs.schema_versions_db_schema, guild_id=guild.id)
+        _versions_prepped.add(db_file)
+    recorded = await db_helper.get_output(
+        envs.schema_versions_db_schema,
+        where=("name", name),
+        select=("version"),
+        single=True,
+        guild_id=guild.id,
+    )
+    if (
+        recorded
+        and recorded["version"] == version
+        and await tables_exist(tables, guild.id)
+    ):
+        logger.debug(f"`{name}` tables for `{guild.name}` are up to date")
+        return False
+    await prep(guild)
+    for template_info in migrated:
+        if not await is_current(template_info, guild.id):
+            return True
+    async with db_helper.transaction(envs.schema_versions_db_schema, guild.id):
+        await db_helper.del_row_by_AND_filter(
+            envs.schema_versions_db_schema, where=("name", name), guild_id=guild.id
+        )
+        await db_helper.insert_many_all(
+            envs.schema_versions_db_schema, [(name, version)], guild_id=guild.id
+        )
+    return True
+
+
+async def migrate(template_info, guild) -> int:
+    """
+    Run the fixups `template_info`'s database for `guild` hasn't had yet,
+    in order, and record each one in its `user_version`. The tables have
+    to be prepped first.
+
+    Each fixup runs in a `db_helper.transaction()` together with its
+    `user_version`, so an error the helpers only log still rolls it back
+    and leaves it and the rest for the next time.
+
+    Returns
+    ------------
+    int
+        The number of fixups that were run
+    """
+    db_name = Path(template_info["db_file"]).name
+    pending = migrations.get(db_name, [])
+    version = await get_version(template_info, guild.id)
+    if version >= len(pending):
+        return 0
+    if args.not_write_database:
+        logger.debug("`not_write_database` activated")
+        return 0
+    ran = 0
+    for number, fixup in enumerate(pending[version:], start=version + 1):
+        logger.info(f"Running fixup {number} (`{fixup.__name__}`) on `{db_name}`")
+        try:
+            async with db_helper.transaction(template_info, guild.id):
+                await fixup(guild)
+                await set_version(template_info, number, guild.id)
+        except (aiosqlite.Error, KeyError, ValueError) as e:
+            logger.error(f"Fixup `{fixup.__name__}` failed for `{db_name}`: {e}")
+            break
+        ran += 1
+    return ran
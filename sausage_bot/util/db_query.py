@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+db_query: Build parameterized SQL fragments for `db_helper`
+
+Every function returns a tuple of `(sql, params)`, where `sql` only has
+`?` placeholders for values. The text of a query therefore depends on
+its shape alone (which columns, how many conditions), never on the
+values, so sqlite can reuse the prepared statement from its statement
+cache instead of parsing a new one on every call - and values with
+quotes in them no longer break the query.
+
+Column names, operators and sort orders are still put into the text as
+is. They come from the code, not from user input.
+
+Values are bound as text. That is what the quoted literals
+(`col = 'value'`) these queries used to be built with did, and sqlite's
+type affinity converts them back for numeric columns, so stored data
+and comparisons stay the same as before.
+"""
+
+import re
+
+
+def as_text(value) -> str:
+    "Bind `value` the same way a quoted SQL literal would have stored it"
+    return str(value)
+
+
+def as_items(items) -> list:
+    """
+    Conditions come either as a single `(col, value)` tuple or as a
+    list/tuple of such tuples. Always give a list of tuples.
+    """
+    if len(items) > 0 and isinstance(items[0], str):
+        return [items]
+    return list(items)
+
+
+def conditions(
+    items, compare: str = "=", connector: str = "AND", value_format: str = "{}"
+) -> tuple:
+    """
+    Make `col <compare> ?` conditions for each item in `items`.
+
+    Parameters
+    ------------
+    items: tuple/list of tuples
+        `(col, value)` or `(col, value, connector)`. The third element
+        is used to join this condition with the next one, instead of
+        `connector`
+    compare: str
+        The comparison operator, like `=` or `LIKE` (default: `=`)
+    connector: str
+        How to join the conditions (default: `AND`)
+    value_format: str
+        Format string for the bound value, like `%{}%` for LIKE
+    """
+    items = as_items(items)
+    sql_out = []
+    params = []
+    for idx, item in enumerate(items):
+        sql_out.append(f"{item[0]} {compare} ?")
+        params.append(value_format.format(as_text(item[1])))
+        if idx < len(items) - 1:
+            sql_out.append(item[2] if len(item) == 3 else connector)
+    return " ".join(sql_out), tuple(params)
+
+
+def where_filter(where=(), like=(), not_like=(), connector: str = "AND") -> tuple:
+    """
+    Make a complete ` WHERE ...` clause out of `where` (`col = ?`),
+    `like` (`col LIKE ?`) and `not_like` (`col NOT LIKE ?`), joined with
+    AND. Returns an empty clause if there is nothing to filter on.
+
+    `connector` joins the conditions within `where`.
+    """
+    sql_out = []
+    params = ()
+    for items, compare, value_format, _connector in (
+        (where, "=", "{}", connector),
+        (like, "LIKE", "%{}%", "AND"),
+        (not_like, "NOT LIKE", "%{}%", "AND"),
+    ):
+        if not items:
+            continue
+        _sql, _params = conditions(
+            items,
+            compare=compare,
+            connector=_connector,
+            value_format=value_format,
+        )
+        sql_out.append(_sql)
+        params += _params
+    if len(sql_out) == 0:
+        return "", ()
+    return " WHERE " + " AND ".join(sql_out), params
+
+
+def set_values(updates) -> tuple:
+    """
+    Make the `SET` part of an UPDATE, without the `SET` keyword.
+
+    `updates` is either a single `(col, value)` tuple, a list of those,
+    or a dict of `{col: [(when_col, when_value, then_value), ...]}`
+    for updating `col` with a CASE.
+    """
+    sql_out = []
+    params = []
+    if isinstance(updates, dict):
+        for col in updates:
+            _case = f"{col} = CASE"
+            for when_col, when_value, then_value in updates[col]:
+                _case += f" WHEN {when_col} = ? THEN ?"
+                params += [as_text(when_value), as_text(then_value)]
+            _case += f" ELSE {col} END"
+            sql_out.append(_case)
+    else:
+        if isinstance(updates[0], (str, int)):
+            updates = [updates]
+        for col, value in updates:
+            sql_out.append(f"{col} = ?")
+            params.append(as_text(value))
+    return ", ".join(sql_out), tuple(params)
+
+
+def select_fields(select, prefix: str = "") -> str:
+    """
+    Make the field list of a SELECT. An empty `select` gives `*`,
+    `prefix` (like `A.`) is put in front of every field in a tuple/list.
+    """
+    if select is None or len(select) == 0:
+        return "*"
+    if isinstance(select, str):
+        return select
+    return ", ".join(f"{prefix}{field}" for field in select)
+
+
+def fts_match(text: str) -> str:
+    """
+    Make an FTS5 MATCH query out of what someone typed: every word has to
+    be there, each as a prefix (so `sau` finds `sausage`), and nothing
+    in `text` is read as FTS5 syntax
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", str(text)))
+
+
+def in_list(col: str, values) -> tuple:
+    "Make `col IN (?, ?, ...)` for every value in `values`"
+    values = tuple(values)
+    return "{} IN ({})".format(col, ", ".join("?" * len(values))), values
+
+
+def order_by(order_by_in=(), rowid_sort: bool = False, rowid: str = "rowid") -> str:
+    """
+    Make an ` ORDER BY ...` clause from a list of `(col, ASC/DESC)`
+    tuples, or sort by `rowid` if `rowid_sort` is set and there is no
+    `order_by_in`.
+    """
+    if order_by_in:
+        return " ORDER BY " + ", ".join(
+            f"{order[0]} {order[1]}" for order in order_by_in
+        )
+    if rowid_sort:
+        return f" ORDER BY {rowid}"
+    return ""
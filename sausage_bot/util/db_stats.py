@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+db_stats: Where the time in the database goes
+
+Every statement `db_helper` runs goes through the `TimedConnection` its
+`connect()` lends out. The time each one takes (including fetching the
+rows) and the rows it returned or changed are added up per query shape
+in `query_stats`, with the database file and table. Statements slower
+than `config.DB_SLOW_QUERY_MS` are also written to the slow query log,
+`slow_queries.log`, with the `db_helper` function and cog they came
+from. Only those walk the call stack to find that out.
+
+A query's text only depends on its shape (see `db_query`), so the text
+is the shape.
+"""
+
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from tabulate import tabulate
+
+from sausage_bot.util import config
+
+logger = config.logger
+slow_logger = logging.getLogger("slow_queries")
+
+# Upper bounds of the latency histogram's buckets, in milliseconds. The
+# last bucket has everything slower.
+BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+_table_in_sql = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+(\w+)", re.IGNORECASE
+)
+# Modules whose frames are skipped when looking for who ran a query
+_internal_modules = ("sausage_bot.util.db_helper", __name__, "contextlib")
+
+
+def bucket_labels() -> list:
+    "#autodoc skip#"
+    return [f"<{limit}ms" for limit in BUCKETS_MS] + [f">={BUCKETS_MS[-1]}ms"]
+
+
+def _bucket(ms: float) -> int:
+    "#autodoc skip#"
+    for index, limit in enumerate(BUCKETS_MS):
+        if ms < limit:
+            return index
+    return len(BUCKETS_MS)
+
+
+def find_caller() -> tuple:
+    """
+    The `db_helper` function a query was run through and the cog (or
+    other module) that called it, from the call stack. Has to be called
+    while the query's `connect()` is still open.
+    #autodoc skip#
+    """
+    entry = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module == "sausage_bot.util.db_helper":
+            entry = frame.f_code.co_name
+        elif module not in _internal_modules and not module.startswith("asyncio"):
+            return entry, module.rsplit(".", 1)[-1]
+        frame = frame.f_back
+    return entry, None
+
+
+class ShapeStats:
+    "What the queries of one shape took, added up. #autodoc skip#"
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        match = _table_in_sql.search(sql)
+        self.table = match.group(1) if match else None
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.db_files = Counter()
+
+    @property
+    def avg_seconds(self) -> float:
+        return self.seconds / self.count if self.count else 0.0
+
+
+class QueryStats:
+    """
+    The statistics per query shape since the bot started, and a
+    histogram of all queries' latencies
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        "#autodoc skip#"
+        self._shapes = {}
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+    def record(self, sql: str, db_file: str, seconds: float, rows=0):
+        """
+        Add one query to the statistics, and to the slow query log if it
+        took longer than `config.DB_SLOW_QUERY_MS`
+        """
+        sql = " ".join(str(sql).split())
+        shape = self._shapes.get(sql)
+        if shape is None:
+            shape = self._shapes[sql] = ShapeStats(sql)
+        ms = seconds * 1000
+        shape.count += 1
+        shape.seconds += seconds
+        shape.max_seconds = max(shape.max_seconds, seconds)
+        shape.rows += max(rows, 0)
+        shape.histogram[_bucket(ms)] += 1
+        self.histogram[_bucket(ms)] += 1
+        db_name = Path(db_file).parent.name + "/" + Path(db_file).name
+        shape.db_files[db_name] += 1
+        if 0 < config.DB_SLOW_QUERY_MS <= ms:
+            entry, cog = find_caller()
+            slow_logger.warning(
+                f"{ms:.1f}ms, {rows} rows, `{db_name}` table `{shape.table}` "
+                f"via `{entry}` from `{cog}`: {sql}"
+            )
+
+    def shapes(self) -> list:
+        "#autodoc skip#"
+        return list(self._shapes.values())
+
+    def top(self, n: int = 10, by: str = "avg_seconds") -> list:
+        "The `n` shapes with the most `by` (`avg_seconds`, `count`, ...)"
+        shapes = sorted(self.shapes(), key=lambda shape: getattr(shape, by))
+        return shapes[::-1][:n]
+
+
+query_stats = QueryStats()
+
+
+def shape_table(shapes: list, headers: list) -> str:
+    """
+    `shapes` as the table `/dbstats` shows: the start of the query, how
+    many times it ran, its average and slowest time in ms, the rows and
+    the database file it ran on the most
+    """
+    return tabulate(
+        [
+            [
+                shape.sql[:40],
+                shape.count,
+                f"{shape.avg_seconds * 1000:.1f}",
+                f"{shape.max_seconds * 1000:.1f}",
+                shape.rows,
+                shape.db_files.most_common(1)[0][0],
+            ]
+            for shape in shapes
+        ],
+        headers=headers,
+    )
+
+
+class _TimedQuery:
+    "#autodoc skip#"
+
+    __slots__ = ("sql", "seconds", "rows")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.seconds = 0.0
+        self.rows = 0
+
+
+class TimedCursor:
+    """
+    An aiosqlite cursor that adds the time its fetches take and the
+    rows they return to its query
+    #autodoc skip#
+    """
+
+    def __init__(self, cursor, query: _TimedQuery):
+        self._cursor = cursor
+        self._query = query
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return await fetch(*args)
+        finally:
+            self._query.seconds += time.perf_counter() - started
+
+    async def fetchone(self):
+        row = await self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._query.rows += 1
+        return row
+
+    async def fetchmany(self, size=None):
+        args = () if size is None else (size,)
+        rows = await self._timed(self._cursor.fetchmany, *args)
+        self._query.rows += len(rows)
+        return rows
+
+    async def fetchall(self):
+        rows = await self._timed(self._cursor.fetchall)
+        self._query.rows += len(rows)
+        return rows
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while (row := await self.fetchone()) is not None:
+            yield row
+
+
+class _TimedResult:
+    """
+    What `TimedConnection.execute` returns: like aiosqlite's own, it can
+    be awaited or used in `async with`, which closes the cursor after
+    #autodoc skip#
+    """
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._cursor = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._cursor = await self._coro
+        return self._cursor
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._cursor.close()
+
+
+class TimedConnection:
+    """
+    The connection `db_helper.connect()` lends out: an aiosqlite
+    connection whose `execute` and `executemany` are timed. The queries
+    are added to `query_stats` when the with-block ends, so the time to
+    fetch their rows is included.
+    #autodoc skip#
+    """
+
+    def __init__(self, db, db_file: str):
+        object.__setattr__(self, "_db", db)
+        object.__setattr__(self, "_db_file", db_file)
+        object.__setattr__(self, "_queries", [])
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __setattr__(self, name, value):
+        # Like `row_factory`
+        setattr(self._db, name, value)
+
+    def execute(self, sql, parameters=None):
+        return _TimedResult(self._execute(sql, parameters))
+
+    def executemany(self, sql, parameters):
+        return _TimedResult(self._executemany(sql, parameters))
+
+    async def _execute(self, sql, parameters):
+        query = _TimedQuery(sql)
+        self._queries.append(query)
+        started = time.perf_counter()
+        try:
+            cursor = await self._db.execute(sql, parameters)
+        finally:
+            query.seconds += time.perf_counter() - started
+        if cursor.rowcount > 0:
+            query.rows += cursor.rowcount
+        return TimedCursor(cursor, query)
+
+    async def _executemany(self, sql, parameters):
+        query = _TimedQuery(sql)
+        self._queries.append(query)
+        started = time.perf_counter()
+        try:
+            cursor = await self._db.executemany(sql, parameters)
+        finally:
+            query.seconds += time.perf_counter() - started
+        if cursor.rowcount > 0:
+            query.rows += cursor.rowcount
+        return cursor
+
+    def finish(self):
+        "Add the queries run so far to `query_stats`"
+        for query in self._queries:
+            query_stats.record(query.sql, self._db_file, query.seconds, query.rows)
+        self._queries.clear()
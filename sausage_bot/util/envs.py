@@ -34,6 +34,7 @@ if args.db_dir:
 else:
     DB_DIR = DATA_DIR / "db"
 LOG_DIR = DATA_DIR / "logs"
+BACKUP_DIR = DATA_DIR / "backups"
 STATIC_DIR = DATA_DIR / "static"
 TEMP_DIR = ROOT_DIR / "tempfiles"
 GUILDS_DB_FILE = str(DB_DIR / "guilds.sqlite")
@@ -44,13 +45,19 @@ def guild_db_dir(guild_id) -> Path:
     return DB_DIR / f"guild_{guild_id}"
 
 
+# The paths `resolve_db_file` has worked out, by schema name, file name
+# and guild
+_db_files = {}
+
+
 def resolve_db_file(template_info: dict, guild_id=None) -> str:
     """
     Resolve a schema's "db_file" into an actual path to connect to.
 
     Globally scoped schemas (`"scope": "global"`) already hold a full path.
     Guild-scoped schemas (the default) hold a bare filename that must be
-    joined with the given guild's own database directory.
+    joined with the given guild's own database directory. That path is
+    only worked out once per schema and guild.
     """
     if template_info.get("scope") == "global":
         return template_info["db_file"]
@@ -58,7 +65,28 @@ def resolve_db_file(template_info: dict, guild_id=None) -> str:
         raise ValueError(
             f"guild_id is required for guild-scoped table '{template_info.get('name')}'"
         )
-    return str(guild_db_dir(guild_id) / template_info["db_file"])
+    key = (template_info.get("name"), template_info["db_file"], guild_id)
+    db_file = _db_files.get(key)
+    if db_file is None:
+        db_file = str(guild_db_dir(guild_id) / template_info["db_file"])
+        _db_files[key] = db_file
+    return db_file
+
+
+def forget_db_files():
+    "Forget the paths `resolve_db_file` has worked out, when `DB_DIR` changes"
+    _db_files.clear()
+
+
+def resolve_db_pragmas(db_file) -> dict:
+    """
+    Get the pragmas to apply to a new connection to `db_file`: the
+    defaults in `db_pragmas_default`, overridden by whatever
+    `db_pragmas` has for that file name.
+    """
+    pragmas = dict(db_pragmas_default)
+    pragmas.update(db_pragmas.get(Path(db_file).name, {}))
+    return pragmas
 
 
 # DB schema convention: "db_file" is a relative filename resolved against
@@ -143,6 +171,40 @@ SPOTIFY_SECRET=
 SCRAPEOPS_API_KEY=
 """
 
+# DB pragmas, applied by `db_helper` every time it opens a connection.
+# WAL lets readers (reaction events, autocompletes) carry on while a log
+# insert is being written, and with WAL `synchronous=NORMAL` is still
+# safe against corruption - a power cut can at worst lose the last
+# commits. `busy_timeout` is in milliseconds, a negative `cache_size` is
+# in KiB and `mmap_size` is in bytes. `auto_vacuum` only takes for new
+# database files; `db_helper.compact_guild_logs` converts old log files.
+db_pragmas_default = {
+    "busy_timeout": 5000,
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+}
+# Per database file name, on top of `db_pragmas_default`
+db_pragmas = {
+    # Read on every quote post, list and autocomplete
+    "quote.sqlite": {"cache_size": -16000, "mmap_size": 64 * 1024 * 1024},
+    # Written on every posted link, read in full for every feed on every tick
+    "rss_log.sqlite": {"cache_size": -8000, "mmap_size": 32 * 1024 * 1024},
+    "youtube_log.sqlite": {"cache_size": -8000, "mmap_size": 32 * 1024 * 1024},
+}
+
+# Schemas can list secondary `indexes`, each a list of the columns it
+# covers. `db_helper.prep_table` creates them (if missing) every time it
+# runs, so existing guild databases get them on startup as well.
+# Schemas with `cached` set are kept in memory by `db_helper.get_output`
+# until one of the helpers writes to them. Only for tables that are read
+# a lot and rarely written, like the settings.
+# Feed logs that grow with every post have a `retention`, which
+# `db_helper.prune_log` uses to drop old rows: `group_by` is the column
+# the config.LOG_RETENTION_ROWS rule counts rows per (None counts the
+# whole table), `date` the column the config.LOG_RETENTION_DAYS rule
+# checks.
+
 # Guilds registry (global - not scoped to a guild, this IS the list of guilds)
 guilds_db_schema = {
     "db_file": GUILDS_DB_FILE,
@@ -259,6 +321,16 @@ dilemmas_db_log_schema = {
     "items": [["id", " TEXT NOT NULL"], ["msg_id", " TEXT"]],
 }
 
+# The dilemmas left to post in this round, see `db_helper.get_random_from_bag`
+dilemmas_bag_db_schema = {
+    "db_file": "dilemmas.sqlite",
+    "name": "bag",
+    "items": [["item", "TEXT NOT NULL"], ["position", "INTEGER NOT NULL"]],
+    "primary": "item",
+    "autoincrement": False,
+    "indexes": [["position"]],
+}
+
 # Invitations
 invitations_db_schema = {
     "db_file": "invitations.sqlite",
@@ -324,6 +396,7 @@ quote_content_db_schema = {
         ["content_text", "TEXT"],
         ["content_order", "INT"],
     ],
+    "indexes": [["uuid"], ["comment_id"]],
 }
 
 quote_img_db_schema = {
@@ -332,8 +405,23 @@ quote_img_db_schema = {
     "items": [
         ["comment_id", "INT"],
         ["img_no", "INT"],
-        ["base64", "TEXT"],
+        ["sha256", "TEXT"],
     ],
+    "indexes": [["comment_id"]],
+}
+
+# The images themselves, once per content (`sha256` of `data`), however
+# many comments have them
+quote_blob_db_schema = {
+    "db_file": "quote.sqlite",
+    "name": "quote_blob",
+    "items": [
+        ["sha256", "TEXT NOT NULL UNIQUE"],
+        ["size", "INTEGER"],
+        ["data", "BLOB"],
+    ],
+    "primary": "sha256",
+    "autoincrement": False,
 }
 
 quote_db_log_schema = {
@@ -344,6 +432,16 @@ quote_db_log_schema = {
     "autoincrement": False,
 }
 
+# The quotes left to post in this round, see `db_helper.get_random_from_bag`
+quote_bag_db_schema = {
+    "db_file": "quote.sqlite",
+    "name": "bag",
+    "items": [["item", "TEXT NOT NULL"], ["position", "INTEGER NOT NULL"]],
+    "primary": "item",
+    "autoincrement": False,
+    "indexes": [["position"]],
+}
+
 quote_db_settings_schema = {
     "db_file": "quote.sqlite",
     "name": "settings",
@@ -364,6 +462,7 @@ quote_db_settings_schema = {
         "autopost_tag_role": "role_id",
         "autopost_time": "str",
     },
+    "cached": True,
 }
 
 # Roles
@@ -386,12 +485,14 @@ roles_db_roles_schema = {
     "db_file": "roles.sqlite",
     "name": "roles",
     "items": [["msg_id", "TEXT NOT NULL"], ["role", "TEXT"], ["emoji", "TEXT"]],
+    "indexes": [["msg_id"]],
 }
 
 roles_db_settings_schema = {
     "db_file": "roles.sqlite",
     "name": "settings",
     "items": [["setting", "TEXT NOT NULL"], ["value", "TEXT"]],
+    "cached": True,
 }
 
 # Stats
@@ -438,6 +539,7 @@ stats_db_settings_schema = {
         "sort_roles_abc": "bool",
         "stats_msg_id": "str",
     },
+    "cached": True,
 }
 
 stats_db_hide_roles_schema = {
@@ -490,6 +592,7 @@ rss_db_filter_schema = {
     ],
     "primary": None,
     "autoincrement": False,
+    "indexes": [["uuid"]],
 }
 
 rss_db_settings_schema = {
@@ -507,6 +610,7 @@ rss_db_settings_schema = {
     ],
     "primary": None,
     "autoincrement": False,
+    "cached": True,
 }
 
 rss_db_ratings_schema = {
@@ -521,6 +625,7 @@ rss_db_ratings_schema = {
     ],
     "primary": None,
     "autoincrement": False,
+    "indexes": [["show_uuid", "episode_uuid", "user_id"]],
 }
 
 rss_db_log_schema = {
@@ -534,6 +639,25 @@ rss_db_log_schema = {
     ],
     "primary": None,
     "autoincrement": False,
+    "indexes": [["uuid"]],
+    "retention": {"group_by": "uuid", "date": "date"},
+}
+
+# The `ETag` and `Last-Modified` each feed was last fetched with, and how
+# many of its fetches got a 304 Not Modified back
+rss_db_http_cache_schema = {
+    "db_file": "rss_feeds.sqlite",
+    "name": "http_cache",
+    "items": [
+        ["uuid", "TEXT NOT NULL"],
+        ["url", "TEXT"],
+        ["etag", "TEXT"],
+        ["last_modified", "TEXT"],
+        ["fetches", "INTEGER"],
+        ["not_modified", "INTEGER"],
+    ],
+    "primary": "uuid",
+    "autoincrement": False,
 }
 
 # Youtube
@@ -567,6 +691,7 @@ youtube_db_filter_schema = {
     ],
     "primary": None,
     "autoincrement": False,
+    "indexes": [["uuid"]],
 }
 
 youtube_db_log_schema = {
@@ -580,6 +705,23 @@ youtube_db_log_schema = {
     ],
     "primary": None,
     "autoincrement": False,
+    "indexes": [["uuid"]],
+    "retention": {"group_by": "uuid", "date": "date"},
+}
+
+youtube_db_http_cache_schema = {
+    "db_file": "youtube_feeds.sqlite",
+    "name": "http_cache",
+    "items": [
+        ["uuid", "TEXT NOT NULL"],
+        ["url", "TEXT"],
+        ["etag", "TEXT"],
+        ["last_modified", "TEXT"],
+        ["fetches", "INTEGER"],
+        ["not_modified", "INTEGER"],
+    ],
+    "primary": "uuid",
+    "autoincrement": False,
 }
 
 settings_db_schema = {
@@ -589,8 +731,26 @@ settings_db_schema = {
     "inserts": [["language", "en"], ["timezone", "UTC"], ["bot_channel", ""]],
     "primary": None,
     "autoincrement": False,
+    "cached": True,
 }
 
+# Which schema version each cog last set up this guild's tables for, see
+# `db_migrations.bootstrap_guild`
+schema_versions_db_schema = {
+    "db_file": "settings.sqlite",
+    "name": "schema_versions",
+    "items": [["name", "TEXT NOT NULL"], ["version", "TEXT NOT NULL"]],
+    "primary": "name",
+    "autoincrement": False,
+    "cached": True,
+}
+
+# Log tables `db_helper.compact_guild_logs` prunes, see `retention` above
+retention_db_schemas = [
+    rss_db_log_schema,
+    youtube_db_log_schema,
+]
+
 ### Botlines ###
 # Generiske
 GUILD_NOT_FOUND = "Fant ikke serveren {}, dobbeltsjekk navnet i .env"
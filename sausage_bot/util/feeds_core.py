@@ -7,7 +7,9 @@ from lxml import etree
 from tabulate import tabulate
 from uuid import uuid4
 import discord
+import asyncio
 import re
+from urllib.parse import urlparse, urlunparse
 from hashlib import md5
 from pprint import pformat
 from time import monotonic
@@ -199,8 +201,27 @@ async def check_feed_validity(url_in, mock_file=None, guild=None):
 
 
 async def get_items_from_rss(
-    req, url, filters_in=None, log_in=None, num_items=None
+    req, url, filters_in=None, log_in=None, num_items=None, fetches=None
 ) -> list:
+    """
+    Get the items in the feed `req` that pass `filters_in`. With
+    `fetches` (a `FeedFetches`), a feed several guilds follow is only
+    parsed once.
+    """
+    if fetches is None:
+        items = await parse_feed_items(req, url, num_items=num_items)
+    else:
+        items = await fetches.get_items(req, url, num_items=num_items)
+    if items is None:
+        return None
+    # Every guild gets its own copy of the items to filter and post
+    return net_io.filter_links(
+        {"filters": filters_in, "items": [dict(item) for item in items], "log": log_in}
+    )
+
+
+async def parse_feed_items(req, url, num_items=None) -> list:
+    "The items in the feed `req`, or None if it isn't a feed"
     try:
         soup = BeautifulSoup(req, features="xml")
         rss_status = False
@@ -218,7 +239,7 @@ async def get_items_from_rss(
     except Exception as e:
         logger.error(f"Error when reading `soup` from {url}: {e}")
         return None
-    items_out = {"filters": filters_in, "items": [], "log": log_in}
+    items_out = {"items": []}
     # Feed level info, so items get the same shape as the ones coming out
     # of `net_io.get_spotify_podcast_links` and
     # `net_io.get_other_podcast_links`
@@ -336,8 +357,96 @@ async def get_items_from_rss(
                 temp_info["link"] = item.find("link")["href"]
             logger.debug(f"Got `temp_info`: {temp_info}")
             items_out["items"].append(temp_info)
-    links_out = net_io.filter_links(items_out)
-    return links_out
+    return items_out["items"]
+
+
+def _same_validators(first: dict, second: dict) -> bool:
+    "#autodoc skip#"
+    return all(
+        first.get(name) == second.get(name) for name in ("etag", "last_modified")
+    )
+
+
+def feed_key(url: str) -> str:
+    """
+    `url` written the same way however a guild added it: with a scheme,
+    a lowercase host without the default port, the query sorted and
+    without a fragment or trailing slash. Youtube feeds are made from
+    `envs.YOUTUBE_RSS_LINK`/`envs.YOUTUBE_PLAYLIST_RSS_LINK`, so the
+    same channel or playlist always gets the same key.
+    """
+    url = str(url).strip()
+    if not re.search(r"^https?://", url, re.IGNORECASE):
+        url = f"https://{url}"
+    parts = urlparse(url)
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port not in [80, 443]:
+        host += f":{parts.port}"
+    query = "&".join(sorted(parts.query.split("&"))) if parts.query else ""
+    return urlunparse(
+        (parts.scheme.lower(), host, parts.path.rstrip("/"), parts.params, query, "")
+    )
+
+
+class FeedFetches:
+    """
+    The feeds fetched and parsed during one run of a feed loop. Feeds
+    with the same `feed_key()` are only fetched and parsed once per run,
+    however many guilds follow them, and every guild gets the result to
+    filter, log and post on its own. Guilds fetching at the same time
+    wait for the same fetch.
+
+    A feed is fetched with the validators (see `get_feed_if_changed`) of
+    the first guild to ask for it. If it hasn't changed since, the
+    guilds that had other validators, like one that just added the
+    feed, share one more fetch without them.
+    """
+
+    def __init__(self):
+        # {key: task}
+        self._tasks = {}
+        # {feed_key(): validators the feed was first fetched with}
+        self._sent = {}
+        self.fetched = 0
+        self.shared = 0
+
+    async def _once(self, key, func):
+        "#autodoc skip#"
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(func())
+        else:
+            self.shared += 1
+        # Someone giving up shouldn't cancel it for the others
+        return await asyncio.shield(task)
+
+    async def get_link(self, url, validators=None):
+        "Like `net_io.get_link(url, status_out=True, validators=validators)`"
+        key = feed_key(url)
+        validators = validators or {}
+        sent = self._sent.setdefault(key, validators)
+
+        def fetch(validators):
+            async def _fetch():
+                self.fetched += 1
+                return await net_io.get_link(url, status_out=True, validators=validators)
+
+            return _fetch
+
+        req = await self._once(("fetch", key), fetch(sent))
+        if req["status"] != 304 or _same_validators(sent, validators):
+            return req
+        # Unchanged since someone else's validators says nothing about these
+        return await self._once(("fetch", key, "full"), fetch(None))
+
+    async def get_items(self, req, url, num_items=None):
+        "Like `parse_feed_items()`, for a `req` from `get_link()`"
+        # The fetched `req`s are kept until the run is over, so their ids
+        # aren't reused
+        return await self._once(
+            ("parse", id(req), num_items),
+            lambda: parse_feed_items(req, url, num_items=num_items),
+        )
 
 
 async def add_to_feed_db(
@@ -512,8 +621,81 @@ async def remove_feed_from_db(feed_type, feed_name, guild_id):
     return removal_ok
 
 
-async def get_feed_links(feed_type, feed_info, guild_id):
-    "Get the links from a feed"
+async def get_feed_if_changed(feed_type, uuid, url, guild_id, fetches=None):
+    """
+    Get the feed `uuid` at `url` like `net_io.get_link(status_out=True)`,
+    sending along the `ETag` and `Last-Modified` it had the last time. A
+    status of 304 means it hasn't changed since, and has no content.
+    With `fetches` (a `FeedFetches`), guilds following the same feed
+    share one fetch.
+
+    The new validators aren't saved until `save_feed_fetches` is given
+    the returned `req`, which should wait until what the feed had has
+    been posted. If posting fails, the feed is fetched in full again the
+    next time. The fetches and 304s are counted per feed as well, see
+    `get_feed_list(list_type="cache")`.
+    """
+    if feed_type == "youtube":
+        cache_db = envs.youtube_db_http_cache_schema
+    else:
+        cache_db = envs.rss_db_http_cache_schema
+    # Not `single`, which would write the buffered rows to read this
+    cached = await db_helper.get_output(
+        template_info=cache_db, where=("uuid", uuid), guild_id=guild_id
+    )
+    cached = cached[-1] if cached else {}
+    # The validators are for the url they came from
+    validators = cached if cached and cached["url"] == url else None
+    if fetches is None:
+        req = await net_io.get_link(url, status_out=True, validators=validators)
+    else:
+        req = await fetches.get_link(url, validators=validators)
+    if req["status"] not in [200, 304]:
+        return req
+    not_modified = req["status"] == 304
+    if not_modified:
+        logger.debug(f"`{url}` has not changed")
+    etag = req["etag"] or (validators["etag"] if not_modified else None)
+    last_modified = req["last_modified"] or (
+        validators["last_modified"] if not_modified else None
+    )
+    row = (
+        uuid,
+        url,
+        etag,
+        last_modified,
+        (cached.get("fetches") or 0) + 1,
+        (cached.get("not_modified") or 0) + int(not_modified),
+    )
+    # `req` may be shared with other guilds through `fetches`
+    return {**req, "http_cache": (cache_db, row)}
+
+
+async def save_feed_fetches(fetched: list, guild_id):
+    """
+    Save the validators and counts of the feeds in `fetched`, as
+    returned by `get_feed_if_changed`. They are buffered, and written
+    together with the links logged in the same run.
+    """
+    for req in fetched:
+        if "http_cache" not in req:
+            continue
+        cache_db, row = req["http_cache"]
+        await db_helper.insert_buffered(cache_db, [row], guild_id=guild_id)
+
+
+async def get_feed_links(
+    feed_type, feed_info, guild_id, fetches=None, fetched: list = None
+):
+    """
+    Get the links from a feed. A feed that hasn't changed since the last
+    time has no new links, and isn't parsed again. With `fetches` (a
+    `FeedFetches`), a feed several guilds follow is fetched and parsed
+    once for all of them.
+
+    The fetch is added to `fetched`, for `save_feed_fetches` once the
+    links are posted.
+    """
     UUID = feed_info["uuid"]
     if feed_type == "rss":
         URL = feed_info["url"]
@@ -530,7 +712,13 @@ async def get_feed_links(feed_type, feed_info, guild_id):
         URL = feed_info["url"]
     # Get the url and make it parseable
     if feed_type in ["rss", "youtube"]:
-        req = await net_io.get_link(URL, status_out=True)
+        req = await get_feed_if_changed(
+            feed_type, UUID, URL, guild_id, fetches=fetches
+        )
+        if fetched is not None and req["status"] in [200, 304]:
+            fetched.append(req)
+        if req["status"] == 304:
+            return []
         if req["status"] != 200:
             logger.error(f"Got HTTP status {req['status']} for {URL}")
             return req["status"]
@@ -544,8 +732,12 @@ async def get_feed_links(feed_type, feed_info, guild_id):
             template_info=feed_db_log, where=[("uuid", UUID)], guild_id=guild_id
         )
         links_out = await get_items_from_rss(
-            req=req["content"], url=URL, filters_in=filters_db, log_in=log_db,
-            num_items=5
+            req=req["content"],
+            url=URL,
+            filters_in=filters_db,
+            log_in=log_db,
+            num_items=5,
+            fetches=fetches,
         )
         logger.debug(
             "Got {} items from `get_items_from_rss`".format(
@@ -594,6 +786,7 @@ async def get_feed_list(
     guild: discord.Guild,
     db_in: str = None,
     db_filter_in: str = None,
+    db_cache_in: str = None,
     list_type: str = None,
     link_type: str = None,
     feed_type: str = None,
@@ -607,9 +800,11 @@ async def get_feed_list(
         Database to get feeds from (default: None)
     db_filter_in: str
         Database with the filters (default: None)
+    db_cache_in: str
+        Database with the feeds' fetch counts (default: None)
     list_type: str
-        If specified, should show that specific list_type: `added` or
-        `filter` (default: None, a plain listing)
+        If specified, should show that specific list_type: `added`,
+        `filter` or `cache` (default: None, a plain listing)
     link_type: str
         If specified, should show that specific link_type: `channel` or
         `playlist` (default: None, both)
@@ -794,6 +989,52 @@ async def get_feed_list(
             logger.debug(f"`temp_list` is {temp_list}")
         headers = ("Feed", "Channel", "Allow", "Deny")
         maxcolwidths = [None, None, 30, 30]
+    elif list_type == "cache":
+        if db_cache_in is None:
+            logger.error("`db_cache_in` is not specified")
+            return None
+        feeds_db = await db_helper.get_output(
+            template_info=db_in,
+            select=("uuid", "feed_name", "playlist_id")
+            if has_playlist_id
+            else ("uuid", "feed_name"),
+            where=wheres_in,
+            order_by=[("feed_name", "ASC")],
+            guild_id=guild.id,
+        )
+        if not feeds_db:
+            logger.info("No feeds in database")
+            return None
+        feeds_db = [feed for feed in feeds_db if wanted_link_type(feed)]
+        fetches = {
+            row["uuid"]: row
+            for row in await db_helper.get_output(
+                template_info=db_cache_in,
+                select=("uuid", "fetches", "not_modified"),
+                guild_id=guild.id,
+            )
+            or []
+        }
+        feeds_out = []
+        for feed in feeds_db:
+            counts = fetches.get(feed["uuid"], {})
+            num_fetches = counts.get("fetches") or 0
+            not_modified = counts.get("not_modified") or 0
+            feeds_out.append(
+                [
+                    feed["feed_name"],
+                    num_fetches,
+                    not_modified,
+                    f"{not_modified / num_fetches:.0%}" if num_fetches else "-",
+                ]
+            )
+        headers = (
+            I18N.t("feeds_core.list_headers.feed_name"),
+            I18N.t("feeds_core.list_headers.fetches"),
+            I18N.t("feeds_core.list_headers.not_modified"),
+            I18N.t("feeds_core.list_headers.not_modified_rate"),
+        )
+        maxcolwidths = [None, None, None, None]
     else:
         logger.error(f"Unknown `list_type`: {list_type}")
         return None
@@ -856,8 +1097,8 @@ async def link_is_in_log(link, log_in, log_env, channel, uuid, guild):
         await replace_post(link, log_in, link_hash, channel, uuid)
         return True
     elif not link_in_log and hash_in_log is None:
-        logger.debug("Link is not in log, logging it and returning False")
-        await log_link(log_env, uuid, link, link_hash, guild)
+        # Not logged here: the caller logs the link once it is posted
+        logger.debug("Link is not in log, returning False")
         return False
 
 
@@ -878,7 +1119,8 @@ async def log_link(template_info, uuid, feed_link, page_hash, guild):
             I18N.t("feeds_core.log.no_page_hash", feed_link=feed_link),
         )
     logger.debug(f"Adding this to log:\n{pformat(inserts)}")
-    await db_helper.insert_many_all(
+    # Buffered, so all links posted in one run are written together
+    await db_helper.insert_buffered(
         template_info=template_info, inserts=[inserts], guild_id=guild.id
     )
 
@@ -924,6 +1166,45 @@ async def report_dead_channel(feed_db, uuid, feed_name, channel, guild):
     )
 
 
+async def run_feed_jobs(jobs: list):
+    """
+    Run `jobs`, a list of `(channel, url, job)` where `job` is a coroutine
+    function that fetches the feed at `url` and posts it to `channel`.
+
+    Jobs for different channels run at the same time, at most
+    `config.FEED_CONCURRENCY` of them in all and
+    `config.FEED_CONCURRENCY_PER_HOST` per host. The jobs for one channel
+    run one after another, in the order they are given, so the posts in
+    a channel keep their order. A job that fails is logged, and the rest
+    are still run.
+    """
+    limit = asyncio.Semaphore(config.FEED_CONCURRENCY)
+    host_limits = {}
+    channels = {}
+    for channel, url, job in jobs:
+        channels.setdefault(str(channel), []).append((url, job))
+
+    async def run_channel(channel, channel_jobs):
+        for url, job in channel_jobs:
+            host = urlparse(str(url)).hostname
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(config.FEED_CONCURRENCY_PER_HOST)
+            # The host's limit first, so jobs waiting on a busy host don't
+            # hold a slot other hosts could use
+            async with host_limits[host], limit:
+                try:
+                    await job()
+                except Exception:
+                    logger.exception(f"Error when posting `{url}` to `{channel}`")
+
+    await asyncio.gather(
+        *(
+            run_channel(channel, channel_jobs)
+            for channel, channel_jobs in channels.items()
+        )
+    )
+
+
 async def process_links_for_posting_or_editing(
     feed_name: str, feed_type: str, uuid, FEED_POSTS, CHANNEL, guild: discord.Guild
 ):
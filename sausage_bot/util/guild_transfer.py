@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+guild_transfer: Move a guild's data between bot instances
+
+`export_guild()` writes every guild-scoped table in `envs` to one
+gzipped file of JSON lines, and `import_guild()` reads such a file back
+in. Both stream the rows in batches, so a guild with a big log or a lot
+of quote images never has to fit in memory. The pooled connection is only
+held while a batch is read or written, and the (de)compressing runs in a
+thread so the bot keeps answering meanwhile.
+
+Every row keeps its `rowid`, as that is the number users know a quote by
+and what the quote search index points at.
+
+The file starts with a header line, and every table with a line naming
+its schema and columns, followed by one line per row:
+
+    {"format": 1, "guild_id": "...", "exported": "..."}
+    {"schema": "quote_db_schema", "columns": ["rowid", "uuid", ...]}
+    {"row": ["...", ...]}
+"""
+
+import asyncio
+import base64
+import gzip
+import json
+import time
+from pathlib import Path
+
+import aiosqlite
+
+from sausage_bot.util import envs, config, db_helper
+from sausage_bot.util.args import args
+
+logger = config.logger
+
+EXPORT_FORMAT = 1
+# Rows read or written at a time
+BATCH_SIZE = 500
+# A guild's schema versions are left out, so the instance it is
+# imported to sets up the tables itself
+SKIP_SCHEMAS = ["schema_versions_db_schema"]
+
+
+def guild_schemas() -> dict:
+    """
+    The guild-scoped schemas in `envs` by name, one per table. Where
+    several schemas describe the same table, the first one is used.
+    """
+    schemas = {}
+    tables = set()
+    for name, value in vars(envs).items():
+        if (
+            not name.endswith("_schema")
+            or name in SKIP_SCHEMAS
+            or not isinstance(value, dict)
+            or "db_file" not in value
+            or value.get("scope") == "global"
+        ):
+            continue
+        table = (value["db_file"], value["name"])
+        if table not in tables:
+            tables.add(table)
+            schemas[name] = value
+    return schemas
+
+
+def _encode(value):
+    "#autodoc skip#"
+    if isinstance(value, bytes):
+        return {"b64": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode(value):
+    "#autodoc skip#"
+    if isinstance(value, dict) and "b64" in value:
+        return base64.b64decode(value["b64"])
+    return value
+
+
+def _dump(record: dict) -> str:
+    "#autodoc skip#"
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _write_rows(out, batch: list):
+    "Encode and write `batch`, meant to run in a thread. #autodoc skip#"
+    out.write(
+        "".join(_dump({"row": [_encode(value) for value in row]}) for row in batch)
+    )
+
+
+def _read_lines(infile, count: int) -> list:
+    "Read and parse up to `count` lines, meant to run in a thread. #autodoc skip#"
+    records = []
+    for line in infile:
+        records.append(json.loads(line))
+        if len(records) >= count:
+            break
+    return records
+
+
+async def _read_batch(db_file, table: str, after: int):
+    """
+    Up to `BATCH_SIZE` rows of `table` with a `rowid` above `after`,
+    and the column names. The connection is only held for this batch.
+    #autodoc skip#
+    """
+    _cmd = (
+        f"SELECT rowid AS rowid, * FROM {table} WHERE rowid > ? "
+        "ORDER BY rowid LIMIT ?"
+    )
+    logger.debug(f"Using this query: {_cmd} {(after, BATCH_SIZE)}")
+    async with db_helper.connect(db_file) as db:
+        cursor = await db.execute(_cmd, (after, BATCH_SIZE))
+        columns = [col[0] for col in cursor.description]
+        batch = await cursor.fetchall()
+        await cursor.close()
+    return columns, batch
+
+
+async def export_guild(guild_id, path=None) -> dict:
+    """
+    Write all of `guild_id`'s tables to `path`, by default a new
+    `guild_<id>_<time>.jsonl.gz` in `envs.BACKUP_DIR`. Tables and
+    database files the guild doesn't have are left out.
+
+    Returns
+    ------------
+    dict
+        `path` and `rows`: `{schema name: number of rows}`
+    """
+    if path is None:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = Path(envs.BACKUP_DIR) / f"guild_{guild_id}_{stamp}.jsonl.gz"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    await db_helper.write_buffer.flush()
+    rows = {}
+    out = await asyncio.to_thread(gzip.open, path, "wt", encoding="utf-8")
+    try:
+        await asyncio.to_thread(
+            out.write,
+            _dump(
+                {
+                    "format": EXPORT_FORMAT,
+                    "guild_id": str(guild_id),
+                    "exported": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+            ),
+        )
+        for name, schema in guild_schemas().items():
+            db_file = envs.resolve_db_file(schema, guild_id)
+            if not Path(db_file).exists():
+                continue
+            if not await db_helper.table_exist(schema, guild_id=guild_id):
+                continue
+            columns, batch = await _read_batch(db_file, schema["name"], -(2**63))
+            await asyncio.to_thread(
+                out.write, _dump({"schema": name, "columns": columns})
+            )
+            rows[name] = 0
+            while batch:
+                await asyncio.to_thread(_write_rows, out, batch)
+                rows[name] += len(batch)
+                if len(batch) < BATCH_SIZE:
+                    break
+                _, batch = await _read_batch(db_file, schema["name"], batch[-1][0])
+    finally:
+        await asyncio.to_thread(out.close)
+    logger.info(f"Exported {sum(rows.values())} rows for guild {guild_id} to `{path}`")
+    return {"path": path, "rows": rows}
+
+
+async def _table_columns(schema, guild_id) -> list:
+    "The columns `schema`'s table has in `guild_id`. #autodoc skip#"
+    db_file = envs.resolve_db_file(schema, guild_id)
+    async with db_helper.connect(db_file) as db:
+        out = await db.execute(f"PRAGMA table_info({schema['name']})")
+        return [col[1] for col in await out.fetchall()]
+
+
+async def _insert_batch(schema, columns: list, batch: list, guild_id):
+    "#autodoc skip#"
+    db_file = envs.resolve_db_file(schema, guild_id)
+    _cmd = "INSERT OR IGNORE INTO {} ({}) VALUES ({})".format(
+        schema["name"], ", ".join(columns), ", ".join("?" * len(columns))
+    )
+    logger.debug(f"Using this query for {len(batch)} rows: {_cmd}")
+    async with db_helper.connect(db_file) as db:
+        await db.executemany(_cmd, batch)
+    db_helper.invalidate_cache(schema, guild_id)
+
+
+async def _records(infile):
+    "The parsed lines of `infile`, read a batch at a time. #autodoc skip#"
+    while records := await asyncio.to_thread(_read_lines, infile, BATCH_SIZE):
+        for record in records:
+            yield record
+
+
+async def import_guild(path, guild_id=None) -> dict:
+    """
+    Read a file made by `export_guild()` into `guild_id`'s tables, by
+    default those of the guild it was exported from. Missing tables are
+    made first. Columns the tables here don't have (like ones from an
+    older layout) are left out. Rows that clash with a primary key or
+    `rowid` already there are skipped, so the tables should be empty to
+    get an exact copy.
+
+    Returns
+    ------------
+    dict
+        `guild_id` and `rows`: `{schema name: number of rows read}`
+    """
+    schemas = guild_schemas()
+    rows = {}
+    infile = await asyncio.to_thread(gzip.open, path, "rt", encoding="utf-8")
+    try:
+        header = (await asyncio.to_thread(_read_lines, infile, 1) or [{}])[0]
+        if header.get("format") != EXPORT_FORMAT:
+            raise ValueError(f"`{path}` is not a guild export this bot can read")
+        guild_id = str(guild_id or header["guild_id"])
+        if args.not_write_database:
+            logger.debug("`not_write_database` activated")
+            return {"guild_id": guild_id, "rows": rows}
+        schema = columns = keep = None
+        batch = []
+        async for record in _records(infile):
+            if "row" in record:
+                if schema is None:
+                    continue
+                batch.append([_decode(record["row"][index]) for index in keep])
+                rows[schema_name] += 1
+                if len(batch) >= BATCH_SIZE:
+                    await _insert_batch(schema, columns, batch, guild_id)
+                    batch = []
+                continue
+            if batch:
+                await _insert_batch(schema, columns, batch, guild_id)
+                batch = []
+            schema_name = record["schema"]
+            schema = schemas.get(schema_name)
+            if schema is None:
+                logger.warning(f"Skipping `{schema_name}`, no such schema")
+                continue
+            rows[schema_name] = 0
+            await db_helper.prep_table(schema, guild_id=guild_id)
+            existing = await _table_columns(schema, guild_id) + ["rowid"]
+            keep = [
+                index
+                for index, col in enumerate(record["columns"])
+                if col in existing
+            ]
+            columns = [record["columns"][index] for index in keep]
+            if len(columns) < len(record["columns"]):
+                logger.warning(
+                    f"Leaving out columns of `{schema_name}` that aren't here: "
+                    f"{set(record['columns']) - set(columns)}"
+                )
+        if batch:
+            await _insert_batch(schema, columns, batch, guild_id)
+    finally:
+        await asyncio.to_thread(infile.close)
+    logger.info(f"Imported {sum(rows.values())} rows for guild {guild_id}")
+    return {"guild_id": guild_id, "rows": rows}
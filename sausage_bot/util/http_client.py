@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+http_client: The one HTTP session every outgoing request goes through
+
+Making a session per request means every fetch pays for a DNS lookup and
+a new TCP and TLS connection, and sessions that aren't closed when a
+request fails are leaked. `client` keeps one aiohttp session for the
+bot's lifetime instead, with its connections kept alive, DNS lookups
+cached, a cap on connections per host and default timeouts. It is closed
+by a bot close hook.
+"""
+
+import asyncio
+
+import aiohttp
+
+from sausage_bot.util import config
+
+logger = config.logger
+
+
+class HttpClient:
+    """
+    Lends out the shared `aiohttp.ClientSession`, which is made on first
+    use (it has to be made on the running event loop)
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 8,
+        timeout: int = 30,
+        dns_cache_ttl: int = 300,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        "The shared session, made anew if it is closed or from another loop"
+        loop = asyncio.get_running_loop()
+        if (
+            self._session is None
+            or self._session.closed
+            or self._session.loop is not loop
+        ):
+            logger.debug("Opening the shared HTTP session")
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        """
+        Close the shared session and its connections. Registered as a bot
+        close hook.
+        """
+        if self._session is not None and not self._session.closed:
+            logger.debug("Closing the shared HTTP session")
+            await self._session.close()
+        self._session = None
+
+
+client = HttpClient(
+    limit=config.HTTP_LIMIT,
+    limit_per_host=config.HTTP_LIMIT_PER_HOST,
+    timeout=config.HTTP_TIMEOUT,
+)
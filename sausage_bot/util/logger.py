@@ -150,6 +150,20 @@ def configure_logging(
         )
         file_handler.setFormatter(file_formatter)
         logger.addHandler(file_handler)
+        # `db_stats`' slow query log only goes to its own file
+        slow_logger = logging.getLogger("slow_queries")
+        slow_logger.propagate = False
+        slow_handler = TimedRotatingFileHandler(
+            filename=envs.LOG_DIR / "slow_queries.log",
+            when="midnight",
+            encoding="UTF-8",
+            delay=True,
+            backupCount=log_days,
+        )
+        slow_handler.setFormatter(
+            logging.Formatter("%(asctime)s\t%(message)s", "%Y-%m-%d %H:%M:%S")
+        )
+        slow_logger.addHandler(slow_handler)
 
 
 def main():
@@ -4,10 +4,12 @@
 
 import discord
 import re
+import asyncio
 import aiohttp
+import time
+from collections import OrderedDict
 from urllib.parse import urlparse
 from random import choice
-import requests
 from datetime import datetime
 import json
 from pprint import pformat
@@ -18,13 +20,12 @@ from bs4 import BeautifulSoup
 from bs4 import element as bs4_element
 from PIL import Image
 from io import BytesIO
-import httpx
 from numpy import array as np_array
 from hashlib import md5
 from yt_dlp import YoutubeDL
 
 from sausage_bot.util import config, envs, datetime_handling, db_helper
-from sausage_bot.util import file_io, discord_commands
+from sausage_bot.util import file_io, discord_commands, http_client
 from sausage_bot.util.i18n import I18N
 from sausage_bot.util.args import args
 
@@ -76,12 +77,26 @@ async def fetch_random_user_agent():
         or file_io.file_exist(envs.TEMP_DIR / "headers.json") is False
     ):
         logger.debug("Headers file is older than an hour or does not exist")
-        response = requests.get(envs.scrapeops_url.format(config.SCRAPEOPS_API_KEY))
-        file_io.write_json(envs.TEMP_DIR / "headers.json", response.json())
+        try:
+            async with http_client.client.session().get(
+                envs.scrapeops_url.format(config.SCRAPEOPS_API_KEY)
+            ) as response:
+                headers = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Could not fetch user-agents: {e}")
+            return
+        file_io.write_json(envs.TEMP_DIR / "headers.json", headers)
+
 
+async def get_link(url=None, mock_file=None, status_out=None, validators=None):
+    """
+    Get contents of requests object from a `url`
 
-async def get_link(url=None, mock_file=None, status_out=None):
-    "Get contents of requests object from a `url`"
+    `validators` is a dict with the `etag` and `last_modified` the page
+    had the last time, if any. They are sent along, so a page that
+    hasn't changed since gets a 304 with no content. With `status_out`,
+    the page's new `etag` and `last_modified` are returned as well.
+    """
 
     def get_random_user_agent():
         """
@@ -116,16 +131,25 @@ async def get_link(url=None, mock_file=None, status_out=None):
         url = f"https://{url}"
     try:
         logger.debug(f"Trying `url`: {url}")
-        session = aiohttp.ClientSession()
+        session = http_client.client.session()
         # Get random user agent
         rand_user_agent = get_random_user_agent()
         logger.debug(f"Using user-agent: {rand_user_agent}")
+        headers = {"user-agent": rand_user_agent} if rand_user_agent else {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
         # aiohttp falls back to its own user-agent when this is None
-        headers = {"user-agent": rand_user_agent} if rand_user_agent else None
-        # async with session.get(url) as resp:
-        async with session.get(url, headers=headers) as resp:
+        async with session.get(url, headers=headers or None) as resp:
             url_status = resp.status
             logger.debug(f"Got status: {url_status}")
+            if status_out:
+                validators_out = {
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                }
             content_out = await resp.text()
             logger.debug(f"Got content_out: {content_out[0:500]}...")
             if 399 < int(url_status) < 600:
@@ -141,9 +165,8 @@ async def get_link(url=None, mock_file=None, status_out=None):
                     ),
                     str(content_out),
                 )
-        await session.close()
         if status_out:
-            return {"status": url_status, "content": content_out}
+            return {"status": url_status, "content": content_out, **validators_out}
         else:
             return content_out
     except Exception as e:
@@ -939,9 +962,9 @@ async def parse_tv2livesport(url_in=None, mock_in=None):
 
 
 async def extract_color_from_image_url(image_url):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(image_url)
-    image = Image.open(BytesIO(response.content)).convert("RGB")
+    async with http_client.client.session().get(image_url) as response:
+        content = await response.read()
+    image = Image.open(BytesIO(content)).convert("RGB")
     image = image.resize((50, 50))  # Nedskalere for raskere prosessering
 
     pixels = np_array(image).reshape(-1, 3)
@@ -967,8 +990,82 @@ def clean_pod_description(desc_in):
     return desc_in.strip()
 
 
+class PageHashCache:
+    """
+    The hashes `get_page_hash` has worked out, by url. Each is kept for
+    `ttl` seconds, and only the `max_size` last used are kept. A url
+    that is already being fetched isn't fetched again: the ones asking
+    for it in the meantime wait for that fetch instead.
+
+    Pages that couldn't be hashed are not kept, so they are tried again.
+    """
+
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # {url: (expires, hash)}, least recently used first
+        self._hashes = OrderedDict()
+        # {url: task fetching it}
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, url: str, fetch):
+        "The hash of `url`, from `await fetch(url)` if it isn't kept"
+        cached = self._hashes.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            self._hashes.move_to_end(url)
+            self.hits += 1
+            return cached[1]
+        task = self._pending.get(url)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch(url))
+            self._pending[url] = task
+            task.add_done_callback(lambda done: self._keep(url, done))
+        else:
+            self.hits += 1
+        # Someone giving up on the fetch shouldn't cancel it for the others
+        return await asyncio.shield(task)
+
+    def _keep(self, url, task):
+        "#autodoc skip#"
+        self._pending.pop(url, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if task.result() is None:
+            return
+        self._hashes[url] = (time.monotonic() + self.ttl, task.result())
+        self._hashes.move_to_end(url)
+        while len(self._hashes) > self.max_size:
+            self._hashes.popitem(last=False)
+
+    def clear(self):
+        "#autodoc skip#"
+        self._hashes.clear()
+
+    def stats(self) -> dict:
+        "Hits, misses and number of kept hashes"
+        return {"hits": self.hits, "misses": self.misses, "urls": len(self._hashes)}
+
+
+page_hashes = PageHashCache(
+    ttl=config.PAGE_HASH_TTL, max_size=config.PAGE_HASH_CACHE_SIZE
+)
+
+
 async def get_page_hash(url, debug=False):
-    "Get hash of page at `url`"
+    """
+    Get hash of page at `url`. The same page is only fetched and hashed
+    once per `config.PAGE_HASH_TTL`, see `PageHashCache`.
+    """
+    if debug:
+        return await _fetch_page_hash(url, debug=True)
+    return await page_hashes.get(url, _fetch_page_hash)
+
+
+async def _fetch_page_hash(url, debug=False):
+    "#autodoc skip#"
     req = await get_link(url)
     if req is None:
         logger.error("Could not get link")